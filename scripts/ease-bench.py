@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+#
+# Microbenchmark and accuracy report for the easing functions in steve.ease.
+# Each curve is evaluated in three modes: the scalar Python function called
+# once per sample, the NumPy-vectorized form called once for all samples, and
+# a linearly interpolated lookup table. The error columns show the maximum
+# absolute difference from the scalar function.
+#
+# Usage: python scripts/ease-bench.py [--samples N] [--lut-size N] [--repeat N]
+#
+import timeit
+import argparse
+
+import numpy as np
+
+import steve.ease as ease
+
+
+def bench(fn, repeat):
+    return min(timeit.repeat(fn, number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark easing functions')
+    parser.add_argument('--samples', type=int, default=1000, help='Number of samples per curve')
+    parser.add_argument('--lut-size', type=int, default=ease.DEFAULT_LUT_SIZE, help='Number of points in lookup tables')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of repetitions, the best time is reported')
+    args = parser.parse_args()
+
+    x = np.linspace(0, 1, args.samples)
+    xl = x.tolist()
+
+    print(f'{args.samples} samples per curve, lookup tables with {args.lut_size} points\n')
+    print(f'{"curve":<16} {"scalar µs":>10} {"vector µs":>10} {"LUT µs":>10} {"speedup":>8} {"vector err":>11} {"LUT err":>10}')
+
+    total = [0, 0, 0]
+    for name in ease.names:
+        scalar = getattr(ease, name)
+        vector = ease.vectorize(name)
+        lut = ease.LUT(name, args.lut_size)
+
+        ts = bench(lambda: [scalar(v) for v in xl], args.repeat)
+        tv = bench(lambda: vector(x), args.repeat)
+        tl = bench(lambda: lut(x), args.repeat)
+
+        ref = np.array([scalar(v) for v in xl])
+        ev = np.max(np.abs(vector(x) - ref))
+        el = np.max(np.abs(lut(x) - ref))
+
+        total[0] += ts
+        total[1] += tv
+        total[2] += tl
+        print(f'{name:<16} {ts * 1e6:>10.1f} {tv * 1e6:>10.1f} {tl * 1e6:>10.1f} {ts / min(tv, tl):>7.1f}x {ev:>11.2e} {el:>10.2e}')
+
+    print(f'\n{"total":<16} {total[0] * 1e6:>10.1f} {total[1] * 1e6:>10.1f} {total[2] * 1e6:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
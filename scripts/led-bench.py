@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+#
+# Benchmark of the LED compositor in steve.led. The compositor runs headless
+# with the output stage and a sink that only counts frames, for every
+# combination of the number of layers, the number of animated layers, and the
+# number of pixels. For each combination, the script reports the achieved
+# frame rate, CPU time per frame, the 99th percentile of the time it takes to
+# compose a frame, and the number of frames missed relative to the target
+# rate. Configurations without animated layers should show a single frame,
+# since the compositor goes idle.
+#
+# Usage: python scripts/led-bench.py [--layers 1,8,32] [--animated 0,1,8] [--pixels 4,16,64] [--duration S] [--rate HZ]
+#
+import time
+import asyncio
+import argparse
+import itertools
+
+import numpy as np
+
+import steve.led as led
+from steve.color import RGB
+from steve.layers import LayerStack
+from steve.ledout import OutputStage
+from steve.animation import Blink, Breathe
+
+
+class CountingSink:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, frame):
+        self.count += 1
+
+
+def int_list(v):
+    return [int(x) for x in v.split(',')]
+
+
+async def run(layers, animated, pixels, duration, rate):
+    # The compositor uses the module-level layer stack, replace it with one
+    # sized for this configuration.
+    led.PIXEL_COUNT = pixels
+    led.layers = LayerStack(pixels, capacity=max(layers, 1))
+    led.animations = {}
+    led.asyncio_loop = asyncio.get_running_loop()
+
+    sink = CountingSink()
+    led.compositor = compositor = led.Compositor(sink, rate=rate, output=OutputStage())
+    compositor.trace = []
+
+    rng = np.random.default_rng(0)
+    for i in range(layers):
+        color = RGB(*(int(v) for v in rng.integers(0, 256, 3)))
+        mask = rng.choice(pixels, max(1, pixels // 2), replace=False) if i % 2 else None
+        if i < animated:
+            v = Breathe(color, period=1 + i % 3) if i % 2 else Blink(color, 0.05 + 0.01 * i)
+        else:
+            v = color
+        led.add_layer(v, alpha=0.5, mask=mask)
+
+    task = asyncio.create_task(compositor.run())
+    cpu = time.process_time()
+    await asyncio.sleep(duration)
+    cpu = time.process_time() - cpu
+    task.cancel()
+
+    trace = compositor.trace
+    frames = len(trace)
+    if frames > 1:
+        start = np.array([t[0] for t in trace])
+        gaps = np.round(np.diff(start) * rate).astype(int)
+        missed = int(np.sum(np.maximum(gaps - 1, 0))) if animated else 0
+    else:
+        missed = 0
+
+    p99 = np.percentile([t[1] for t in trace], 99) if frames else 0
+    return frames / duration, cpu / max(frames, 1), p99, missed, sink.count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the LED compositor')
+    parser.add_argument('--layers', type=int_list, default=[1, 8, 32], help='Comma-separated numbers of layers')
+    parser.add_argument('--animated', type=int_list, default=[0, 1, 8], help='Comma-separated numbers of animated layers')
+    parser.add_argument('--pixels', type=int_list, default=[4, 16, 64], help='Comma-separated numbers of pixels')
+    parser.add_argument('--duration', type=float, default=2, help='Duration of each run in seconds')
+    parser.add_argument('--rate', type=int, default=led.DEFAULT_RATE, help='Target frame rate in Hz')
+    args = parser.parse_args()
+
+    print(f'Target rate {args.rate} Hz, {args.duration} s per run\n')
+    print(f'{"layers":>6} {"animated":>8} {"pixels":>6} {"fps":>8} {"cpu/frame µs":>13} {"p99 µs":>9} {"missed":>7} {"sent":>6}')
+
+    for layers, animated, pixels in itertools.product(args.layers, args.animated, args.pixels):
+        if animated > layers:
+            continue
+
+        fps, cpu, p99, missed, sent = asyncio.run(run(layers, animated, pixels, args.duration, args.rate))
+        print(f'{layers:>6} {animated:>8} {pixels:>6} {fps:>8.1f} {cpu * 1e6:>13.1f} {p99 * 1e6:>9.1f} {missed:>7} {sent:>6}')
+
+
+if __name__ == '__main__':
+    main()
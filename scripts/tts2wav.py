@@ -2,6 +2,8 @@ from google.cloud import texttospeech
 import wave
 from dotenv import load_dotenv
 
+SAMPLE_RATE = 24000
+
 
 def text_to_speech_to_wav():
     # Set up Google Cloud TTS client
@@ -21,7 +23,8 @@ def text_to_speech_to_wav():
 
     # Configure the audio settings
     audio_config = texttospeech.AudioConfig(
-        audio_encoding=texttospeech.AudioEncoding.LINEAR16  # WAV format
+        audio_encoding=texttospeech.AudioEncoding.LINEAR16,  # WAV format
+        sample_rate_hertz=SAMPLE_RATE
     )
 
     # Perform the text-to-speech request
@@ -35,7 +38,7 @@ def text_to_speech_to_wav():
         # Set the WAV file parameters
         wav_file.setnchannels(1)  # Mono
         wav_file.setsampwidth(2)  # 16-bit samples
-        wav_file.setframerate(24000)  # 24kHz sample rate
+        wav_file.setframerate(SAMPLE_RATE)
 
         # Write the audio data
         wav_file.writeframes(response.audio_content)
@@ -0,0 +1,198 @@
+import time
+import logging
+import threading
+
+import numpy as np
+
+import steve.stats
+from steve.resample import Resampler
+
+try:
+    import speexdsp
+except ImportError:
+    speexdsp = None
+
+log = logging.getLogger(__name__)
+
+# The number of frames processed by the echo canceller at once (16 ms at 16 kHz)
+DEFAULT_FRAME_SIZE = 256
+
+# The length of the echo path the canceller can model in frames (128 ms at 16
+# kHz). Must be a multiple of the frame size.
+DEFAULT_FILTER_LENGTH = 2048
+
+# The step size of the NumPy adaptive filter
+DEFAULT_STEP = 0.5
+
+# The amount of reference audio (in seconds) that may be queued ahead of the
+# microphone on top of the output latency, to absorb the jitter between the
+# mixer's and the capture hub's threads. Older reference audio is dropped, so
+# that the delay between the two signals stays within the filter.
+MAX_REFERENCE = 0.04
+
+
+class FDAFEchoCanceller:
+    '''An echo canceller based on a partitioned-block frequency-domain adaptive filter
+
+    The echo path from the speaker to the microphone is modeled by a filter
+    of filter_length taps split into partitions of frame_size taps. For each
+    frame, the filter is applied to the recent far-end (speaker) signal in the
+    frequency domain, the estimated echo is subtracted from the near-end
+    (microphone) signal, and the filter is adapted with a step normalized by
+    the far-end power in each frequency bin. This is the NumPy fallback used
+    when the speexdsp package is not installed.
+    '''
+    def __init__(self, frame_size: int, filter_length: int, step: float = DEFAULT_STEP):
+        if filter_length % frame_size:
+            raise Exception('The filter length must be a multiple of the frame size')
+
+        self.N = frame_size
+        self.P = filter_length // frame_size
+        self.step = step
+        bins = frame_size + 1
+
+        self.X = np.zeros((self.P, bins), dtype=np.complex128)   # Far-end spectra, newest first
+        self.W = np.zeros((self.P, bins), dtype=np.complex128)   # Filter partitions
+        self.power = np.zeros(bins)
+        self.prev = np.zeros(frame_size)
+
+    def process(self, near: np.ndarray, far: np.ndarray) -> np.ndarray:
+        '''Remove the echo of far from near, both int16 frames of frame_size samples'''
+        N = self.N
+        near = near.astype(np.float64)
+        far = far.astype(np.float64)
+
+        self.X[1:] = self.X[:-1]
+        self.X[0] = np.fft.rfft(np.concatenate((self.prev, far)))
+        self.prev = far
+
+        echo = np.fft.irfft(np.einsum('pk,pk->k', self.X, self.W))[N:]
+        e = near - echo
+
+        # Normalize the step by the smoothed far-end power of each bin. The
+        # gradient is constrained to frame_size taps per partition to avoid
+        # circular convolution artifacts.
+        self.power = 0.9 * self.power + 0.1 * np.abs(self.X[0]) ** 2
+        E = np.fft.rfft(np.concatenate((np.zeros(N), e)))
+        G = self.step * np.conj(self.X) * E / (self.P * self.power + 1e-3 * N * N + 1)
+        g = np.fft.irfft(G, axis=1)[:, :N]
+        self.W += np.fft.rfft(np.concatenate((g, np.zeros_like(g)), axis=1), axis=1)
+
+        return np.clip(e, -32768, 32767).astype(np.int16)
+
+
+class SpeexEchoCanceller:
+    '''An echo canceller backed by the speexdsp package'''
+    def __init__(self, frame_size: int, filter_length: int, sample_rate: int):
+        self._ec = speexdsp.EchoCanceller.create(frame_size, filter_length, sample_rate)
+
+    def process(self, near: np.ndarray, far: np.ndarray) -> np.ndarray:
+        return np.frombuffer(self._ec.process(near.tobytes(), far.tobytes()), dtype=np.int16)
+
+
+def create_echo_canceller(frame_size: int, filter_length: int, sample_rate: int):
+    '''Create a speexdsp echo canceller if available, or the NumPy fallback'''
+    if speexdsp is not None:
+        log.debug('Using speexdsp echo canceller')
+        return SpeexEchoCanceller(frame_size, filter_length, sample_rate)
+
+    log.debug('speexdsp not available, using NumPy echo canceller')
+    return FDAFEchoCanceller(frame_size, filter_length)
+
+
+class EchoCancellation:
+    '''A capture processor that removes the mixer's output from the microphone signal
+
+    The mixer's output serves as the far-end reference. It is converted to the
+    capture rate and queued as it is rendered. The capture hub calls the
+    processor from its dedicated processing thread with frames of frame_size
+    frames of 16-bit mono audio. Each frame is paired with the same amount of
+    queued reference audio. If the mixer has not rendered enough audio yet, the
+    missing reference is silence.
+
+    Echo cancellation only works in the process that plays audio through its
+    own mixer. The processor can be created before the mixer exists and
+    attached to it later. Until then, captured audio is passed through
+    unchanged.
+
+    The echo of rendered audio reaches the microphone no sooner than the
+    output stream's latency later. The queue is therefore kept that much
+    ahead of the microphone: when the first frame is captured, the reference
+    rendered before is dropped except for the last output latency worth of
+    audio, and later the queue is trimmed whenever it grows beyond the
+    latency plus MAX_REFERENCE. The adaptive filter only has to model the
+    rest of the delay.
+    '''
+    def __init__(self, mixer, sample_rate: int, frame_size: int = DEFAULT_FRAME_SIZE,
+                 filter_length: int = DEFAULT_FILTER_LENGTH):
+        self.sample_rate = sample_rate
+        self.frame_size = frame_size
+        self.filter_length = filter_length
+        self.canceller = create_echo_canceller(frame_size, filter_length, sample_rate)
+
+        self.mixer = None
+        self.resampler = None
+        self.delay = 0
+        self.max_reference = 0
+        self.reference = np.zeros(0, dtype=np.float32)
+        self.started = False
+        self.lock = threading.Lock()
+
+        self.underruns = 0
+        self.dropped = 0
+        self.time = steve.stats.Series()
+        steve.stats.register('aec', self.stats)
+
+        if mixer is not None:
+            self.attach(mixer)
+
+    def attach(self, mixer):
+        '''Start using the mixer's output as the far-end reference'''
+        with self.lock:
+            self.resampler = Resampler(mixer.rate, self.sample_rate)
+            self.delay = min(round(mixer.stream.get_output_latency() * self.sample_rate), self.filter_length // 2)
+            self.max_reference = self.delay + round(MAX_REFERENCE * self.sample_rate)
+            self.mixer = mixer
+        mixer.monitor(self._on_output)
+
+    def _on_output(self, x: np.ndarray):
+        # Called from the mixer's thread with each rendered period
+        x = self.resampler(x)
+        with self.lock:
+            ref = np.concatenate((self.reference, x))
+            if len(ref) > self.max_reference:
+                self.dropped += len(ref) - self.max_reference
+                ref = ref[-self.max_reference:]
+            self.reference = ref
+
+    def _far(self) -> np.ndarray:
+        n = self.frame_size
+        with self.lock:
+            if not self.started:
+                # Align the reference with the first captured frame
+                ref = self.reference[max(0, len(self.reference) - self.delay):] if self.delay else self.reference[:0]
+                self.reference = np.concatenate((np.zeros(self.delay - len(ref), dtype=np.float32), ref))
+                self.started = True
+            far, self.reference = self.reference[:n], self.reference[n:]
+
+        if len(far) < n:
+            self.underruns += 1
+            far = np.concatenate((far, np.zeros(n - len(far), dtype=np.float32)))
+        return (far * 32767).astype(np.int16)
+
+    def __call__(self, frame) -> bytes:
+        if self.mixer is None:
+            return bytes(frame)
+
+        start = time.perf_counter()
+        near = np.frombuffer(frame, dtype=np.int16)
+        rv = self.canceller.process(near, self._far()).tobytes()
+        self.time.add(time.perf_counter() - start)
+        return rv
+
+    def stats(self) -> dict:
+        return {
+            'reference_underruns': self.underruns,
+            'reference_dropped'  : self.dropped,
+            **self.time.stats('process_ms', 1000)
+        }
@@ -1,13 +1,22 @@
+import abc
 import math
+import functools
 import contextvars
 from datetime import datetime, timedelta
 from asyncio import sleep
 
+import numpy as np
+
+import steve.ease
+from steve.color import RGB, RGBA, rgb_to_float
+
 
 # This variable is used to keep track of the current layer within animation
 # tasks. That way, there is no need for the animation coroutine to accept the
 # layer_id via its parameters. The value is a tuple where the first item is the
-# ID of the layer and the second item is the layer's value (array)
+# ID of the layer, the second item is the layer's value (a steve.layers.LayerView
+# indexed like a NumPy array with one RGBA row per pixel), and the third item is
+# the function used to update the layer.
 current_layer = contextvars.ContextVar('Layer for current task')
 
 
@@ -18,8 +27,8 @@ async def transition(color, duration, ease=lambda v: v, rate=25):
     # start value of the easing function.
 
     update_layer(color)
-    alpha = layer[3]
-    layer[3] = alpha * ease(0)
+    alpha = layer[..., 3].copy()
+    layer[..., 3] = alpha * ease(0)
 
     start = datetime.now()
     stop = start + timedelta(seconds=duration)
@@ -28,7 +37,7 @@ async def transition(color, duration, ease=lambda v: v, rate=25):
         now = datetime.now()
 
         step = min((now - start).total_seconds() / duration, 1)
-        layer[3] = alpha * ease(step)
+        layer[..., 3] = alpha * ease(step)
 
         if now > stop: break
         await sleep(1 / rate)
@@ -41,12 +50,12 @@ async def blink(color, on_duration, off_duration=None):
         off_duration = on_duration
 
     update_layer(color)
-    alpha = layer[3]
+    alpha = layer[..., 3].copy()
 
     while True:
-        layer[3] = alpha
+        layer[..., 3] = alpha
         await sleep(on_duration)
-        layer[3] = 0
+        layer[..., 3] = 0
         await sleep(off_duration)
 
 
@@ -56,12 +65,179 @@ async def breathe(color, period=4, gamma=0.12, rate=60):
     _, layer, update_layer = current_layer.get()
     update_layer(color)
 
-    r, g, b = layer[0], layer[1], layer[2]
-    n = rate * period
+    rgb = layer[..., :3].copy()
+    wave = breathe_waveform(period, gamma, rate)
     while True:
-        for i in range(n):
-            v = math.exp(-(pow((i / n - 0.5) / gamma, 2)) / 2)
-            layer[0] = r * v
-            layer[1] = g * v
-            layer[2] = b * v
+        for v in wave:
+            layer[..., :3] = rgb * v
             await sleep(1 / rate)
+
+
+# Waveforms of the animations below are rendered once into NumPy tables, cached
+# by their parameters, and played back by index, so that evaluating an
+# animation costs a table lookup per frame. Cached tables are shared by all
+# animations with the same parameters and must not be modified.
+
+# The rate (in Hz) at which animation waveforms are sampled
+WAVEFORM_RATE = 100
+
+
+def _readonly(a: np.ndarray) -> np.ndarray:
+    a.flags.writeable = False
+    return a
+
+
+@functools.lru_cache(maxsize=128)
+def breathe_waveform(period: float, gamma: float, rate: int = WAVEFORM_RATE) -> np.ndarray:
+    '''Return one period of the breathing curve sampled at the given rate'''
+    n = max(1, round(period * rate))
+    x = np.arange(n) / n
+    return _readonly(np.exp(-(((x - 0.5) / gamma) ** 2) / 2).astype(np.float32))
+
+
+@functools.lru_cache(maxsize=128)
+def breathe_table(color: tuple, period: float, gamma: float, rate: int = WAVEFORM_RATE) -> np.ndarray:
+    '''Return one period of a breathing color as an array of RGB rows'''
+    wave = breathe_waveform(period, gamma, rate)
+    return _readonly(np.outer(wave, np.asarray(color[:3], dtype=np.float32)))
+
+
+@functools.lru_cache(maxsize=128)
+def blink_waveform(on_duration: float, off_duration: float, rate: int = WAVEFORM_RATE) -> np.ndarray:
+    '''Return one period of blinking as an array of alpha multipliers'''
+    on = max(1, round(on_duration * rate))
+    off = max(1, round(off_duration * rate))
+    return _readonly(np.concatenate((np.ones(on, dtype=np.float32), np.zeros(off, dtype=np.float32))))
+
+
+@functools.lru_cache(maxsize=128)
+def transition_waveform(duration: float, ease=None, rate: int = WAVEFORM_RATE) -> np.ndarray:
+    '''Return the eased progress of a transition sampled at the given rate
+
+    The last element is the final value of the transition.
+    '''
+    x = np.linspace(0, 1, max(1, math.ceil(duration * rate)) + 1)
+    if ease is not None:
+        x = steve.ease.vectorize(ease)(x)
+    return _readonly(x.astype(np.float32))
+
+
+def _float_color(color) -> tuple | None:
+    '''Return a single color as a tuple of floats, None for other values'''
+    if isinstance(color, RGB) or isinstance(color, RGBA):
+        return tuple(rgb_to_float(color))
+    elif isinstance(color, tuple) or isinstance(color, list):
+        return tuple(float(v) for v in color)
+    return None
+
+
+# Frame-synchronized animations. An animation is a function of the time (in
+# seconds) elapsed since the animation started. The compositor evaluates all
+# running animations once per frame, so any number of animations costs a
+# single wakeup per frame. Animations keep no state between frames.
+
+class Animation(abc.ABC):
+    '''Base class for frame-synchronized animations
+
+    The optional color is applied to the layer when the animation starts. The
+    layer's value at that moment becomes the base value that is passed to
+    each evaluation of the animation. An animation with a duration of None
+    runs until it is removed.
+    '''
+    color = None
+    duration = None
+
+    @abc.abstractmethod
+    def __call__(self, t: float, base: np.ndarray, out: np.ndarray):
+        '''Write the layer's value at time t into out'''
+
+    def done(self, t: float) -> bool:
+        return self.duration is not None and t >= self.duration
+
+
+class Transition(Animation):
+    '''Fade the layer in from transparent over the given duration'''
+    def __init__(self, color, duration, ease=None, rate=WAVEFORM_RATE):
+        self.color = color
+        self.duration = duration
+        self.rate = rate
+        ease = steve.ease.parse(ease) if isinstance(ease, str) else ease
+        self.wave = transition_waveform(duration, ease, rate)
+
+    def __call__(self, t, base, out):
+        # Reach the target exactly once the duration has elapsed, regardless
+        # of the waveform's sampling
+        v = 1.0 if t >= self.duration else self.wave[int(t * self.rate)]
+        out[..., :3] = base[..., :3]
+        out[..., 3] = base[..., 3] * v
+
+
+class Blink(Animation):
+    '''Alternate between the layer's color and transparency'''
+    def __init__(self, color, on_duration, off_duration=None, duration=None, rate=WAVEFORM_RATE):
+        self.color = color
+        self.duration = duration
+        self.rate = rate
+        self.wave = blink_waveform(on_duration, on_duration if off_duration is None else off_duration, rate)
+
+    def __call__(self, t, base, out):
+        out[..., :3] = base[..., :3]
+        out[..., 3] = base[..., 3] * self.wave[int(t * self.rate) % len(self.wave)]
+
+
+class Breathe(Animation):
+    '''Periodically brighten and dim the layer's color with a Gaussian curve'''
+    def __init__(self, color, period=4, gamma=0.12, duration=None, rate=WAVEFORM_RATE):
+        self.color = color
+        self.duration = duration
+        self.rate = rate
+        self.wave = breathe_waveform(period, gamma, rate)
+
+        # If the animation has a single color, the colors of the entire
+        # period can be looked up directly.
+        c = _float_color(color)
+        self.table = breathe_table(c, period, gamma, rate) if c is not None else None
+
+    def __call__(self, t, base, out):
+        i = int(t * self.rate) % len(self.wave)
+        if self.table is not None:
+            out[..., :3] = self.table[i]
+        else:
+            out[..., :3] = base[..., :3] * self.wave[i]
+        out[..., 3] = base[..., 3]
+
+
+class CoroutineAnimation(Animation):
+    '''Adapter for animations implemented as coroutines
+
+    The coroutine runs in its own task and modifies the layer directly (see
+    current_layer). Evaluating the animation does nothing, the compositor just
+    keeps recompositing until the task finishes.
+    '''
+    def __init__(self, coro):
+        self.coro = coro
+        self.task = None
+
+    def __call__(self, t, base, out):
+        pass
+
+    def done(self, t):
+        return self.task is not None and self.task.done()
+
+
+class Timeline(Animation):
+    '''Play back a precompiled light show timeline
+
+    The frames are a float32 array with the shape (frames, pixels, 4) sampled
+    at the given rate, see steve.timeline. Each evaluation copies a single
+    frame into the layer, so no interpolation takes place at playback time.
+    '''
+    def __init__(self, frames: np.ndarray, rate: int, loop: bool = False):
+        self.frames = frames
+        self.rate = rate
+        self.loop = loop
+        self.duration = None if loop else (len(frames) - 1) / rate
+
+    def __call__(self, t, base, out):
+        i = int(t * self.rate)
+        out[:] = self.frames[i % len(self.frames) if self.loop else min(i, len(self.frames) - 1)]
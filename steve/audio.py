@@ -1,92 +1,285 @@
-import wave
-import pyaudio
+import os
+import mmap
+import struct
 import logging
-from contextlib import suppress
-from queue import Queue, Full, Empty
+import threading
+from collections import OrderedDict
 
-audio = pyaudio.PyAudio()
+import numpy as np
+
+import steve.stats
+from steve.capture import RingBuffer, RingReader, get_capture_hub
+from steve.mixer import ClipSource, get_mixer
+from steve.resample import resample, to_float
 
 
 log = logging.getLogger(__name__)
 
+# The directory with the sound clips shipped with the robot
+SOUNDS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'sounds')
+
+# The maximum amount of memory (in bytes) used by converted clips in the clip
+# cache
+DEFAULT_CLIP_CACHE_SIZE = 32 * 1024 * 1024
+
+WAVE_FORMAT_PCM        = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def read_wav(filename: str) -> tuple[np.ndarray, int]:
+    '''Memory-map a WAV file and return its samples as mono float32
+
+    The samples are decoded directly from the mapped file without reading it
+    into an intermediate buffer. Returns the samples and the sample rate.
+    '''
+    with open(filename, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[0:4] != b'RIFF' or mm[8:12] != b'WAVE':
+                raise Exception(f'{filename} is not a WAV file')
+
+            fmt = None
+            pos = 12
+            while pos + 8 <= len(mm):
+                id, size = struct.unpack_from('<4sI', mm, pos)
+                pos += 8
+                if id == b'fmt ':
+                    fmt = struct.unpack_from('<HHIIHH', mm, pos)
+                    if fmt[0] == WAVE_FORMAT_EXTENSIBLE:
+                        fmt = (struct.unpack_from('<H', mm, pos + 24)[0],) + fmt[1:]
+                elif id == b'data':
+                    if fmt is None:
+                        raise Exception(f'Missing format chunk in {filename}')
+
+                    tag, channels, rate, _, _, bits = fmt
+                    size = min(size, len(mm) - pos)
+                    if tag == WAVE_FORMAT_IEEE_FLOAT and bits == 32:
+                        x = np.frombuffer(mm, dtype='<f4', count=size // 4, offset=pos)
+                        if channels > 1:
+                            x = x.reshape(-1, channels).mean(axis=1)
+                        x = x.astype(np.float32)
+                    elif tag == WAVE_FORMAT_PCM:
+                        width = bits // 8
+                        x = to_float(memoryview(mm)[pos:pos + size - size % (width * channels)], width, channels)
+                    else:
+                        raise Exception(f'Unsupported WAV format {tag} in {filename}')
+
+                    return x, rate
+                pos += size + (size & 1)
+
+    raise Exception(f'Missing data chunk in {filename}')
+
+
+class ClipCache:
+    '''A cache of sound clips converted to the mixer's format
+
+    Clips are decoded from memory-mapped WAV files, converted to the mixer's
+    rate once, and kept as read-only float32 arrays that can be played
+    without any further decoding or copying. The least recently used clips
+    are evicted when the total size of the cached clips exceeds max_size
+    bytes. Relative file names that do not exist are looked up in SOUNDS_DIR.
+    '''
+    def __init__(self, mixer, max_size: int = DEFAULT_CLIP_CACHE_SIZE):
+        self.mixer = mixer
+        self.max_size = max_size
+        self.size = 0
+        self.lock = threading.Lock()
+        self._clip = OrderedDict()
+
+    def _path(self, filename: str) -> str:
+        if not os.path.isabs(filename) and not os.path.exists(filename):
+            filename = os.path.join(SOUNDS_DIR, filename)
+        return os.path.realpath(filename)
+
+    def get(self, filename: str) -> np.ndarray:
+        path = self._path(filename)
+        st = os.stat(path)
+        key = (path, st.st_mtime_ns, st.st_size)
+
+        with self.lock:
+            try:
+                self._clip.move_to_end(key)
+                return self._clip[key]
+            except KeyError:
+                pass
+
+        x, rate = read_wav(path)
+        x = resample(x, rate, self.mixer.rate)
+        x.flags.writeable = False
+        log.debug(f'Loaded clip {path} ({len(x) / self.mixer.rate:.2f} s)')
+
+        with self.lock:
+            if key not in self._clip:
+                self._clip[key] = x
+                self.size += x.nbytes
+                while self.size > self.max_size and len(self._clip) > 1:
+                    _, old = self._clip.popitem(last=False)
+                    self.size -= old.nbytes
+        return x
+
+    def preload(self, directory: str = SOUNDS_DIR):
+        '''Load all WAV files from the directory into the cache'''
+        for name in sorted(os.listdir(directory)):
+            if name.endswith('.wav'):
+                try:
+                    self.get(os.path.join(directory, name))
+                except Exception as e:
+                    log.warning(f'Could not load clip {name}: {e}')
+
+
+# The process-wide clip cache, created on first use
+_clip_cache = None
+_clip_cache_lock = threading.Lock()
+
+
+def get_clip_cache() -> ClipCache:
+    global _clip_cache
+    with _clip_cache_lock:
+        if _clip_cache is None:
+            _clip_cache = ClipCache(get_mixer())
+        return _clip_cache
+
 
 class AudioClip:
     def __init__(self,  filename):
-        file = wave.open(filename, 'rb')
+        # The clip cache converts the clip to the mixer's format once, so
+        # that play() only needs to hand the samples over to the mixer.
+        self._mixer = get_mixer()
+        self._samples = get_clip_cache().get(filename)
 
-        self._width = file.getsampwidth()
-        self._channels = file.getnchannels()
-        self._rate = file.getframerate()
+    def play(self, block=True):
+        '''Play the clip through the shared output mixer
 
-        self._data = file.readframes(file.getnframes())
+        Returns a Playback handle that can be used to cancel the clip. If
+        block is True, the method returns after the clip has been played.
+        '''
+        playback = self._mixer.play(ClipSource(self._samples))
+        if block:
+            playback.wait()
+        return playback
 
-    def play(self):
-        stream = audio.open(format=audio.get_format_from_width(self._width), channels=self._channels, rate=self._rate, output=True)
-        stream.write(self._data)
-        stream.stop_stream()
-        stream.close()
+
+# The maximum amount of audio captured before a streaming session started
+# (in seconds) that BufferedAudioInput replays at the beginning of the session
+DEFAULT_MAX_PREROLL = 3
 
 
 class BufferedAudioInput:
-    def __init__(self, sample_rate, sample_width, channels, chunk_duration, max_queue_duration=1):
+    '''Stream microphone audio captured by the shared CaptureHub in chunks
+
+    While the context is entered, the input is registered as a listener with
+    the capture hub, which pushes each captured buffer to it from the
+    PortAudio callback. The buffers are copied into a preallocated RingBuffer
+    of chunks of chunk_duration seconds, so the callback neither allocates
+    memory nor takes a lock. Iterating over the input yields memoryviews of
+    complete chunks. The microphone itself stays open between streaming
+    sessions.
+
+    If the start attribute is set to a frame position of the capture hub
+    before the context is entered, the stream begins with the audio captured
+    since that position, up to max_preroll seconds, followed by live audio.
+    '''
+    def __init__(self, sample_rate, sample_width, channels, chunk_duration, max_queue_duration=1, max_preroll=DEFAULT_MAX_PREROLL, hub=None):
         self.sample_rate = sample_rate
         self.sample_width = sample_width
         self.channels = channels
         self.chunk_duration = chunk_duration
-        self.stream = None
+        self.max_preroll = max_preroll
+        self.hub = hub
+        self.streaming = False
+        self.start = None
 
-        log.debug(f'Using {pyaudio.get_portaudio_version_text()}')
+        # The position (in bytes) in the hub's ring up to which the audio has
+        # been copied as pre-roll, None until the copy is complete
+        self._live = None
 
         log.debug(f'Chunk duration is {chunk_duration} seconds')
+        chunk_size = round(sample_rate * chunk_duration) * sample_width * channels
 
-        maxsize = round(max_queue_duration / chunk_duration)
-        log.debug(f'Setting max audio queue size to {maxsize} chunks')
-        self.queue = Queue(maxsize=maxsize)
+        # The ring must be able to hold the pre-roll audio in addition to the
+        # queued live audio. One extra slot holds the chunk being processed
+        # by the consumer.
+        slots = round((max_queue_duration + max_preroll) / chunk_duration) + 1
+        log.debug(f'Setting max audio queue size to {slots - 1} chunks')
+        self.ring = RingBuffer(chunk_size, slots)
+        steve.stats.register('stt_input', self.ring.stats)
 
-    def flush(self):
-        while True:
-            try:
-                self.queue.get(block=False)
-            except Empty:
-                break
-            self.queue.task_done()
+    @property
+    def overruns(self):
+        return self.ring.overruns
 
-    def _enqueue(self, in_data, frame_count, time_info, status_flags):
-        try:
-            self.queue.put(in_data, block=False)
-        except Full:
-            log.warning('Audio queue overrun (STT too slow?)')
-            self.flush()
+    @property
+    def depth(self):
+        return self.ring.depth
 
-        return None, pyaudio.paContinue
+    def _enqueue(self, in_data):
+        if in_data is None:
+            self.ring.close()
+            return
+
+        # Listeners are called after the buffer has been written to the hub's
+        # ring, so the ring's position is the end of the buffer. Buffers that
+        # end before the live position have been copied by __enter__.
+        live = self._live
+        if live is None or self.hub.ring.written <= live:
+            return
+
+        overruns = self.ring.overruns
+        self.ring.write(in_data)
+        if self.ring.overruns != overruns:
+            log.warning('Audio queue overrun (STT too slow?), dropped oldest chunk')
 
     def __enter__(self):
-        self.flush()
-        self.stream = audio.open(
-            input             = True,
-            rate              = self.sample_rate,
-            format            = pyaudio.get_format_from_width(self.sample_width),
-            channels          = self.channels,
-            frames_per_buffer = round(self.sample_rate * self.chunk_duration),
-            stream_callback   = self._enqueue)
+        if self.hub is None:
+            self.hub = get_capture_hub(self.sample_rate, self.sample_width, self.channels)
+
+        self.ring.clear()
+        self.ring.blocking = False
+        self._live = None
+        self.streaming = True
+
+        # Copy the audio captured since the start position from the hub's
+        # ring. The listener ignores captured buffers until the copy has
+        # caught up with the ring's position, which is checked with the
+        # ring's lock held, so that no audio is duplicated or lost. A reader
+        # following the copy keeps a file input from overwriting audio that
+        # has not been copied yet.
+        ring = self.hub.ring
+        frame = self.sample_width * self.channels
+        pos = ring.written
+        if self.start is not None:
+            pos = max(self.start * frame, pos - round(self.max_preroll * self.sample_rate) * frame)
+
+        guard = RingReader(ring, ring.tail, frame, start=pos)
+        try:
+            self.hub.subscribe(self._enqueue)
+            while True:
+                with ring.cond:
+                    guard.held = pos
+                    ring.cond.notify_all()
+                    stop = ring.written
+                    if pos >= stop:
+                        self._live = stop
+                        break
+                for data in ring.history(pos, stop):
+                    self.ring.write(data)
+                pos = stop
+        finally:
+            guard.close()
+
+        # Without a sound card pacing the input, block the hub instead of
+        # dropping audio when the consumer falls behind
+        self.ring.blocking = self.hub.backpressure
         return self
 
     def stop_streaming(self):
-        if self.stream is not None:
-            with suppress(Exception): self.stream.stop_stream()
-            with suppress(Exception): self.stream.close()
-            self.stream = None
-            self.queue.put(None)
+        if self.streaming:
+            self.streaming = False
+            self.hub.unsubscribe(self._enqueue)
+            self.ring.close()
 
     def __exit__(self, type, value, traceback):
         self.stop_streaming()
 
     def __iter__(self):
-        while True:
-            chunk = self.queue.get()
-            self.queue.task_done()
-            if chunk is None:
-                return
-
-            yield chunk
-
+        return iter(self.ring)
@@ -0,0 +1,239 @@
+import os
+import time
+import wave
+import logging
+import threading
+
+import numpy as np
+import pyaudio
+
+import steve.stats
+from steve.resample import from_float, resample
+
+log = logging.getLogger(__name__)
+
+# The environment variables that select the audio input and output. The input
+# can be "device" (the default) for the sound card, or the path of a WAV file
+# or of a directory with WAV files. The output can be "device", "null", or the
+# path of a WAV file to be written.
+INPUT_ENV       = 'AUDIO_INPUT'
+INPUT_SPEED_ENV = 'AUDIO_INPUT_SPEED'
+OUTPUT_ENV      = 'AUDIO_OUTPUT'
+
+DEVICE   = 'device'
+NULL     = 'null'
+REALTIME = 'realtime'
+FAST     = 'fast'
+
+# The sample rate reported as the default output rate by the file and null
+# outputs
+DEFAULT_OUTPUT_RATE = 48000
+
+# The duration of silence (in seconds) inserted between the files of a
+# directory input, so that each file is recognized as a separate utterance
+DEFAULT_FILE_GAP = 1
+
+
+class _Pacer:
+    '''Sleep so that frames are produced or consumed at the given rate'''
+    def __init__(self, rate: int):
+        self.rate = rate
+        self.start = time.monotonic()
+        self.frames = 0
+
+    def __call__(self, frames: int):
+        self.frames += frames
+        delay = self.start + self.frames / self.rate - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class FileInputStream:
+    '''An input stream that plays WAV files to a stream callback
+
+    The files are converted to the requested format and passed to the
+    callback in buffers of frames_per_buffer frames from a separate thread,
+    either at the stream's rate or as fast as the callback can consume them.
+    When all files have been played, the stream stops and calls on_finished.
+    '''
+    def __init__(self, files, rate, format, channels, frames_per_buffer, stream_callback, realtime=True, on_finished=None):
+        if stream_callback is None:
+            raise Exception('File input requires a stream callback')
+
+        self.files = files
+        self.rate = rate
+        self.width = pyaudio.get_sample_size(format)
+        self.channels = channels
+        self.period = frames_per_buffer
+        self.callback = stream_callback
+        self.realtime = realtime
+        self.on_finished = on_finished
+        self.stopping = False
+
+        self.thread = threading.Thread(target=self._run, name='file-input', daemon=True)
+        self.thread.start()
+
+    def _samples(self):
+        from steve.audio import read_wav
+
+        gap = np.zeros(round(DEFAULT_FILE_GAP * self.rate), dtype=np.float32)
+        for i, filename in enumerate(self.files):
+            log.debug(f'Playing {filename} to the audio input')
+            x, rate = read_wav(filename)
+            if i:
+                yield gap
+            yield resample(x, rate, self.rate)
+
+    def _run(self):
+        pacer = _Pacer(self.rate)
+        try:
+            for x in self._samples():
+                x = np.concatenate((x, np.zeros(-len(x) % self.period, dtype=np.float32)))
+                for i in range(0, len(x), self.period):
+                    if self.stopping:
+                        return
+
+                    if self.realtime:
+                        pacer(self.period)
+
+                    _, flag = self.callback(from_float(x[i:i + self.period], self.width, self.channels), self.period, {}, 0)
+                    if flag != pyaudio.paContinue:
+                        return
+        finally:
+            log.debug('Audio input finished')
+            if self.on_finished is not None and not self.stopping:
+                self.on_finished()
+
+    def is_active(self):
+        return self.thread.is_alive()
+
+    def stop_stream(self):
+        self.stopping = True
+        if self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def close(self):
+        self.stop_stream()
+
+
+class FileOutputStream:
+    '''An output stream that writes to a WAV file, or discards the data
+
+    Writes are paced at the stream's rate, as they would be by a sound card,
+    so that the mixer and the rest of the pipeline run at normal speed.
+    '''
+    def __init__(self, filename, rate, format, channels, frames_per_buffer=None, stream_callback=None):
+        if stream_callback is not None:
+            raise Exception('File output does not support stream callbacks')
+
+        self.frame = pyaudio.get_sample_size(format) * channels
+        self.pacer = _Pacer(rate)
+        self.wav = None
+        if filename is not None:
+            log.debug(f'Writing audio output to {filename}')
+            self.wav = wave.open(filename, 'wb')
+            self.wav.setnchannels(channels)
+            self.wav.setsampwidth(pyaudio.get_sample_size(format))
+            self.wav.setframerate(rate)
+
+    def write(self, data, exception_on_underflow=False):
+        if self.wav is not None:
+            self.wav.writeframes(data)
+        self.pacer(len(data) // self.frame)
+
+    def get_output_latency(self) -> float:
+        return 0.0
+
+    def stop_stream(self):
+        pass
+
+    def close(self):
+        if self.wav is not None:
+            self.wav.close()
+            self.wav = None
+
+
+class Backend:
+    '''Open audio streams on the sound card, or on files for offline runs
+
+    The open() method accepts the same arguments as PyAudio.open. Input and
+    output streams are opened independently on the configured input and
+    output. PyAudio is only initialized once a stream needs the sound card.
+    '''
+    def __init__(self, input=DEVICE, output=DEVICE, realtime=True):
+        self.input = input
+        self.output = output
+        self.realtime = realtime
+        self._pyaudio = None
+        self._lock = threading.Lock()
+        self.open_time = steve.stats.Series()
+        steve.stats.register('backend', self.stats)
+
+    def stats(self) -> dict:
+        return self.open_time.stats('open_ms', 1000)
+
+    @property
+    def pyaudio(self) -> pyaudio.PyAudio:
+        with self._lock:
+            if self._pyaudio is None:
+                log.debug(f'Initializing {pyaudio.get_portaudio_version_text()}')
+                self._pyaudio = pyaudio.PyAudio()
+            return self._pyaudio
+
+    def _input_files(self):
+        if os.path.isdir(self.input):
+            files = sorted(os.path.join(self.input, f) for f in os.listdir(self.input) if f.lower().endswith('.wav'))
+            if not files:
+                raise Exception(f'No WAV files in {self.input}')
+            return files
+        return [self.input]
+
+    def get_default_output_device_info(self) -> dict:
+        if self.output == DEVICE:
+            return self.pyaudio.get_default_output_device_info()
+        return {'defaultSampleRate': float(DEFAULT_OUTPUT_RATE)}
+
+    def open(self, rate, format, channels, input=False, output=False, frames_per_buffer=1024, stream_callback=None, on_finished=None):
+        '''Open an input or output stream
+
+        on_finished is called when a file input has been played completely.
+        Device streams never finish.
+        '''
+        start = time.monotonic()
+        try:
+            if input and self.input != DEVICE:
+                return FileInputStream(self._input_files(), rate, format, channels, frames_per_buffer, stream_callback,
+                    realtime=self.realtime, on_finished=on_finished)
+
+            if output and self.output != DEVICE:
+                return FileOutputStream(None if self.output == NULL else self.output, rate, format, channels,
+                    frames_per_buffer, stream_callback)
+
+            return self.pyaudio.open(rate=rate, format=format, channels=channels, input=input, output=output,
+                frames_per_buffer=frames_per_buffer, stream_callback=stream_callback)
+        finally:
+            elapsed = time.monotonic() - start
+            self.open_time.add(elapsed)
+            log.debug(f'Opened audio {"input" if input else "output"} in {elapsed * 1000:.1f} ms')
+
+
+# The process-wide audio backend, created on first use
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> Backend:
+    '''Return the process-wide audio backend configured by the environment'''
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            speed = os.environ.get(INPUT_SPEED_ENV, REALTIME)
+            if speed not in (REALTIME, FAST):
+                raise Exception(f'Invalid {INPUT_SPEED_ENV} {speed}, expected {REALTIME} or {FAST}')
+
+            _backend = Backend(
+                input    = os.environ.get(INPUT_ENV, DEVICE),
+                output   = os.environ.get(OUTPUT_ENV, DEVICE),
+                realtime = speed == REALTIME)
+            log.debug(f'Using audio input {_backend.input} ({speed}) and output {_backend.output}')
+        return _backend
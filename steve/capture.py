@@ -0,0 +1,542 @@
+import os
+import time
+import logging
+import weakref
+import threading
+
+import pyaudio
+
+import steve.stats
+from steve.backend import DEVICE, get_backend
+
+log = logging.getLogger(__name__)
+
+DEFAULT_SAMPLE_RATE  = 16000   # The sampling rate of the microphone in Hz
+DEFAULT_SAMPLE_WIDTH = 2       # The width of a single audio sample in bytes
+DEFAULT_CHANNELS     = 1       # The number of audio channels
+DEFAULT_PERIOD       = 0.02    # The duration of a single PortAudio buffer in seconds
+DEFAULT_CAPACITY     = 10      # The amount of audio kept in the ring in seconds
+DEFAULT_MAX_CHUNK    = 1       # The longest chunk a reader can request in seconds
+
+# The environment variable that enables acoustic echo cancellation of the
+# output mixer's audio in the capture hub
+AEC_ENV = 'AUDIO_AEC'
+
+
+class SharedRing:
+    '''A byte ring buffer with a single writer and any number of readers
+
+    Data is addressed by absolute position, i.e., the number of bytes written
+    before it. The first tail bytes of the ring are mirrored after its end,
+    so that any range of up to tail bytes is contiguous in memory and can be
+    returned as a memoryview slice without copying, even if it wraps around.
+
+    The ring keeps track of its open readers, so that a writer that must not
+    overwrite unread data can wait for them with wait_writable().
+    '''
+    def __init__(self, capacity: int, tail: int):
+        if tail > capacity:
+            raise Exception('The mirrored tail cannot be larger than the ring')
+
+        self.capacity = capacity
+        self.tail = tail
+        self.buf = bytearray(capacity + tail)
+        self.view = memoryview(self.buf)
+        self.written = 0
+        self.closed = False
+        self.overruns = 0
+        self.readers = weakref.WeakSet()
+        self.cond = threading.Condition()
+
+    def _mirror(self, start: int, stop: int):
+        lo, hi = max(start, 0), min(stop, self.tail)
+        if lo < hi:
+            self.view[self.capacity + lo:self.capacity + hi] = self.view[lo:hi]
+
+    def write(self, data: bytes):
+        n = len(data)
+        if n > self.capacity:
+            data = memoryview(data)[n - self.capacity:]
+            with self.cond:
+                self.written += n - self.capacity
+            n = self.capacity
+
+        pos = self.written % self.capacity
+        first = min(n, self.capacity - pos)
+        self.view[pos:pos + first] = data[:first]
+        self.view[:n - first] = data[first:]
+        self._mirror(pos, pos + first)
+        self._mirror(0, n - first)
+
+        with self.cond:
+            self.written += n
+            self.cond.notify_all()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def wait_writable(self, n: int):
+        '''Wait until n bytes can be written without overwriting unread data
+
+        The chunk most recently returned by each reader counts as unread,
+        since the reader may still be processing it.
+        '''
+        def writable():
+            return self.closed or all(self.written + n - r.held <= self.capacity for r in list(self.readers))
+
+        with self.cond:
+            self.cond.wait_for(writable)
+
+    def slice(self, pos: int, n: int) -> memoryview:
+        '''Return n bytes starting at absolute position pos without copying
+
+        The returned memoryview refers to the ring's memory. It remains valid
+        until the writer wraps around, i.e., until another capacity - n bytes
+        have been written.
+        '''
+        if n > self.tail:
+            raise Exception(f'Cannot read more than {self.tail} bytes at once')
+        off = pos % self.capacity
+        return self.view[off:off + n]
+
+    def history(self, start: int, stop: int):
+        '''Iterate over the data between the absolute positions start and stop
+
+        Yields memoryview slices of at most tail bytes. Data that has already
+        been overwritten is skipped.
+        '''
+        start = max(start, self.written - self.capacity)
+        while start < stop:
+            n = min(stop - start, self.tail)
+            yield self.slice(start, n)
+            start += n
+
+
+class RingReader:
+    '''A consumer reading fixed-size chunks from a SharedRing
+
+    Each reader has its own position, so readers with different chunk sizes
+    can consume the same data independently. A reader that falls behind by
+    more than the capacity of the ring skips the overwritten data. Once the
+    ring has been closed, the reader returns the remaining complete chunks
+    before it stops.
+    '''
+    def __init__(self, ring: SharedRing, chunk: int, frame: int, start: int | None = None):
+        self.ring = ring
+        self.chunk = chunk
+        self.frame = frame
+        self.pos = ring.written if start is None else start
+        self.closed = False
+        self.overruns = 0
+
+        # The position of the chunk the consumer may still be processing
+        self.held = self.pos
+
+        with ring.cond:
+            ring.readers.add(self)
+
+    @property
+    def position(self) -> int:
+        '''The frame position of the next chunk to be read'''
+        return self.pos // self.frame
+
+    def close(self):
+        with self.ring.cond:
+            self.closed = True
+            self.ring.readers.discard(self)
+            self.ring.cond.notify_all()
+
+    def read(self, timeout=None) -> memoryview | None:
+        '''Return the next chunk, waiting for it if necessary
+
+        Returns None if the reader has been closed, if the ring has been
+        closed and holds no more complete chunks, or if the timeout expired.
+        '''
+        ring = self.ring
+        with ring.cond:
+            if not ring.cond.wait_for(lambda: self.closed or ring.closed or ring.written - self.pos >= self.chunk, timeout):
+                return None
+            if self.closed:
+                return None
+
+            behind = ring.written - self.pos
+            if behind > ring.capacity:
+                skip = behind - ring.capacity
+                self.pos += skip + (-skip % self.frame)
+                self.overruns += 1
+                ring.overruns += 1
+                log.warning(f'Capture reader overrun, skipped {skip} bytes')
+
+            if ring.written - self.pos < self.chunk:
+                return None
+
+            self.held = self.pos
+            self.pos += self.chunk
+            ring.cond.notify_all()
+
+        return ring.slice(self.held, self.chunk)
+
+    def __iter__(self):
+        while True:
+            chunk = self.read()
+            if chunk is None:
+                return
+            yield chunk
+
+
+class RingBuffer:
+    '''A preallocated single-producer single-consumer ring of audio chunks
+
+    The producer, typically a PortAudio callback, copies data into the slot
+    at the write index and advances the index once the slot holds a complete
+    chunk. The consumer reads whole chunks at the read index. Writing
+    allocates no memory and in the common case neither side takes a lock.
+
+    The chunk returned by the last read() is held by the consumer and its
+    slot is never written to. Up to slots - 1 chunks can thus be waiting to be
+    read. If the consumer falls behind and all of them hold unread chunks,
+    the producer drops the oldest unread chunk, counts an overrun, and reuses
+    its slot for the new data, so the consumer always gets the most recent
+    audio. Ring positions are mapped to slots through a table, which lets the
+    producer swap the dropped chunk's slot with the consumer's. Dropping a
+    chunk and reading one take a short lock, since both move the read index.
+
+    If blocking is set, the producer waits for the consumer instead of
+    dropping audio, e.g., when the data comes from a file input rather than
+    a sound card.
+    '''
+    def __init__(self, chunk_size: int, slots: int):
+        if slots < 2:
+            raise Exception('A ring buffer needs at least two slots')
+
+        self.chunk_size = chunk_size
+        self.slots = slots
+        self.buf = bytearray(chunk_size * slots)
+        self.view = memoryview(self.buf)
+        self.slot = list(range(slots))  # The slot of each ring position
+        self.head = 0      # The index of the chunk being written
+        self.tail = 0      # The index of the next chunk to be read
+        self.fill = 0      # The number of bytes in the chunk being written
+        self.overruns = 0
+        self.max_depth = 0
+        self.closed = False
+        self.blocking = False
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._space = threading.Event()
+
+        # The time each chunk was completed by the producer, used to measure
+        # the latency from the callback to the consumer
+        self.stamp = [0.0] * slots
+        self.latency = steve.stats.Series()
+
+        # The depth seen by the consumer over the last minute
+        self.depths = steve.stats.Window()
+
+    @property
+    def depth(self) -> int:
+        '''The number of complete chunks waiting to be read'''
+        return self.head - self.tail
+
+    def clear(self):
+        '''Drop all data, must not be called while the producer is writing'''
+        self.fill = 0
+        self.tail = self.head
+        self.closed = False
+        self._ready.clear()
+
+    def _drop_oldest(self):
+        with self._lock:
+            if self.head - self.tail < self.slots - 1:
+                # The consumer has made room in the meantime
+                return
+
+            # The position at head maps to the slot held by the consumer
+            # (the one before tail). Give it the oldest chunk's slot instead.
+            h, t = self.head % self.slots, self.tail % self.slots
+            self.slot[h], self.slot[t] = self.slot[t], self.slot[h]
+            self.tail += 1
+            self.overruns += 1
+
+    def write(self, data):
+        '''Append data, called by the producer'''
+        data = memoryview(data).cast('B')
+        while len(data):
+            if self.fill == 0 and self.head - self.tail >= self.slots - 1:
+                if not self.blocking or not self._wait_space():
+                    self._drop_oldest()
+
+            off = self.slot[self.head % self.slots] * self.chunk_size + self.fill
+            n = min(len(data), self.chunk_size - self.fill)
+            self.view[off:off + n] = data[:n]
+            data = data[n:]
+
+            self.fill += n
+            if self.fill == self.chunk_size:
+                self.stamp[self.head % self.slots] = time.monotonic()
+                self.fill = 0
+                self.head += 1
+                depth = self.head - self.tail
+                if depth > self.max_depth:
+                    self.max_depth = depth
+
+                # The consumer only waits when the ring is empty
+                if depth == 1:
+                    self._ready.set()
+
+    def _wait_space(self) -> bool:
+        while not self.closed:
+            self._space.clear()
+            if self.head - self.tail < self.slots - 1:
+                return True
+            if not self.closed:
+                self._space.wait()
+        return False
+
+    def close(self):
+        '''Wake up the consumer and make the iterator stop'''
+        self.closed = True
+        self._ready.set()
+        self._space.set()
+
+    def read(self, timeout=None) -> memoryview | None:
+        '''Return the next chunk, waiting for it if necessary
+
+        The returned memoryview refers to the ring's memory. It remains valid
+        until the next call to read(). Returns None once the ring has been
+        closed and all complete chunks have been read, or if the timeout
+        expired.
+        '''
+        while True:
+            # The producer moves tail too when it drops the oldest chunk
+            with self._lock:
+                pos, head = self.tail, self.head
+                if pos < head:
+                    slot = self.slot[pos % self.slots]
+                    stamp = self.stamp[pos % self.slots]
+                    self.tail = pos + 1
+                    break
+
+            if self.closed:
+                return None
+
+            self._ready.clear()
+            if self.head == head and not self.closed and not self._ready.wait(timeout):
+                return None
+
+        self.latency.add(time.monotonic() - stamp)
+        self.depths.add(head - pos)
+        self._space.set()
+
+        off = slot * self.chunk_size
+        return self.view[off:off + self.chunk_size]
+
+    def __iter__(self):
+        while True:
+            chunk = self.read()
+            if chunk is None:
+                return
+            yield chunk
+
+    def stats(self) -> dict:
+        return {
+            'overruns': self.overruns,
+            **self.latency.stats('latency_ms', 1000),
+            'depth': self.depth,
+            **self.depths.stats('depth_window'),
+            'depth_max': self.max_depth
+        }
+
+
+class CaptureHub:
+    '''A single owner of the microphone shared by all audio consumers
+
+    The input stream is opened when the first consumer attaches and then stays
+    open. Captured audio is written into a shared ring that keeps the last few
+    seconds of audio. Consumers such as the wake word detector read from the
+    ring through their own RingReader, each at its own chunk size. Consumers
+    that need to be pushed the data as it arrives can register a listener,
+    which is called from the PortAudio callback with each captured buffer, and
+    with None once the input has ended.
+
+    Since the ring always holds the most recent audio, a consumer can also
+    start in the past, e.g., speech recognition can start at the frame where
+    the wake word was detected, and receive the audio captured in the
+    meantime before live audio (pre-roll).
+
+    If a processor such as EchoCancellation is given, the callback only
+    copies the captured audio into a RingBuffer. A dedicated thread passes it
+    to the processor in frames of processor.frame_size frames and delivers
+    the processed audio to the ring and the listeners instead.
+
+    A file input played as fast as possible (AUDIO_INPUT_SPEED=fast) waits
+    for the slowest reader before it overwrites unread audio in the ring, and
+    listeners are expected to block rather than drop audio, see backpressure.
+    '''
+    def __init__(self, sample_rate=DEFAULT_SAMPLE_RATE, sample_width=DEFAULT_SAMPLE_WIDTH, channels=DEFAULT_CHANNELS,
+                 period=DEFAULT_PERIOD, capacity=DEFAULT_CAPACITY, max_chunk=DEFAULT_MAX_CHUNK, processor=None):
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.channels = channels
+        self.period = period
+        self.frame = sample_width * channels
+
+        self.ring = SharedRing(round(capacity * sample_rate) * self.frame, round(max_chunk * sample_rate) * self.frame)
+        self.listeners = []
+        self.stream = None
+        self.overflows = 0
+        self._lock = threading.Lock()
+        steve.stats.register('capture', self.stats)
+
+        # True if the input is not paced by a sound card, so nothing is lost
+        # by making it wait for slow consumers
+        backend = get_backend()
+        self.backpressure = backend.input != DEVICE and not backend.realtime
+
+        self.processor = processor
+        if processor is not None:
+            self._raw = RingBuffer(processor.frame_size * self.frame, round(sample_rate / processor.frame_size) + 1)
+            self._raw.blocking = self.backpressure
+            self._thread = threading.Thread(target=self._process, name='capture', daemon=True)
+
+    def start(self):
+        '''Open the input stream unless it is already open'''
+        with self._lock:
+            if self.stream is None:
+                self._open()
+
+    def _open(self):
+        if self.processor is not None:
+            self._thread.start()
+
+        log.debug(f'Opening audio input at {self.sample_rate} Hz')
+        self.stream = get_backend().open(
+            input             = True,
+            rate              = self.sample_rate,
+            format            = pyaudio.get_format_from_width(self.sample_width),
+            channels          = self.channels,
+            frames_per_buffer = round(self.sample_rate * self.period),
+            stream_callback   = self._callback,
+            on_finished       = self._finished)
+
+    def stop(self):
+        with self._lock:
+            if self.stream is not None:
+                self.stream.stop_stream()
+                self.stream.close()
+                self.stream = None
+        if self.processor is not None:
+            self._raw.close()
+        self.ring.close()
+
+    def _callback(self, in_data, frame_count, time_info, status_flags):
+        if status_flags & pyaudio.paInputOverflow:
+            self.overflows += 1
+
+        if self.processor is None:
+            self._deliver(in_data)
+        else:
+            self._raw.write(in_data)
+        return None, pyaudio.paContinue
+
+    def _process(self):
+        for frame in self._raw:
+            try:
+                data = self.processor(frame)
+            except Exception as e:
+                log.error(f'Error while processing captured audio: {e}')
+                data = bytes(frame)
+            self._deliver(data)
+        self._end()
+
+    def _deliver(self, data):
+        if self.backpressure:
+            self.ring.wait_writable(len(data))
+        self.ring.write(data)
+        for listener in list(self.listeners):
+            listener(data)
+
+    def _finished(self):
+        # The input has ended, e.g., a file input has been played completely.
+        # With a processor, the processing thread ends the stream once it has
+        # processed all the captured audio.
+        if self.processor is None:
+            self._end()
+        else:
+            self._raw.close()
+
+    def _end(self):
+        # Readers are woken up by closing the ring, listeners are passed None
+        self.ring.close()
+        for listener in list(self.listeners):
+            listener(None)
+
+    @property
+    def position(self) -> int:
+        '''The number of frames captured so far'''
+        return self.ring.written // self.frame
+
+    def stats(self) -> dict:
+        return {
+            'frames'         : self.position,
+            'input_overflows': self.overflows,
+            'reader_overruns': self.ring.overruns
+        }
+
+    def reader(self, chunk_frames: int, start: int | None = None) -> RingReader:
+        '''Create a reader returning chunks of chunk_frames frames
+
+        The reader starts at the given frame position, or with the next
+        captured frame if start is None.
+        '''
+        rv = RingReader(self.ring, chunk_frames * self.frame, self.frame,
+            None if start is None else start * self.frame)
+        self.start()
+        return rv
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+        self.start()
+
+    def unsubscribe(self, listener):
+        try:
+            self.listeners.remove(listener)
+        except ValueError:
+            pass
+
+
+# The process-wide capture hub, created on first use
+_hub = None
+_hub_lock = threading.Lock()
+
+
+def get_capture_hub(sample_rate=DEFAULT_SAMPLE_RATE, sample_width=DEFAULT_SAMPLE_WIDTH, channels=DEFAULT_CHANNELS) -> CaptureHub:
+    '''Return the process-wide capture hub
+
+    The hub opens the input when the first consumer attaches to it. If the
+    environment variable AUDIO_AEC is set to 1, the output mixer's audio is
+    removed from the captured audio by echo cancellation. The echo reference
+    is only available in the process that plays the audio, e.g., the
+    assistant that runs text-to-speech. The hub does not open an output of
+    its own. It uses the process's mixer once some audio is played and
+    passes the captured audio through unchanged until then, or forever in
+    processes that play no audio, such as the STT service.
+    '''
+    global _hub
+    with _hub_lock:
+        if _hub is None:
+            processor = None
+            if os.environ.get(AEC_ENV, '0').lower() in ('1', 'true', 'yes'):
+                from steve.aec import EchoCancellation
+                from steve.mixer import when_created
+                if (sample_width, channels) != (2, 1):
+                    raise Exception('Echo cancellation requires 16-bit mono audio')
+                processor = EchoCancellation(None, sample_rate)
+                when_created(processor.attach)
+
+            _hub = CaptureHub(sample_rate, sample_width, channels, processor=processor)
+        elif (_hub.sample_rate, _hub.sample_width, _hub.channels) != (sample_rate, sample_width, channels):
+            raise Exception('The microphone is already open with a different configuration')
+        return _hub
@@ -154,12 +154,7 @@ def high_five():
     wrist_lr = roboarm.wrist_lr
     clamp = roboarm.clamp
 
-    roboarm.move('torso', '-0.429', opts)
-    roboarm.move('shoulder', '18.799', opts)
-    roboarm.move('elbow', '61.7', opts)
-    roboarm.move('wrist_ud', '-5.632', opts)
-    roboarm.move('wrist_lr', '0.282', opts)
-    roboarm.move('clamp', '0.03', opts)
+    roboarm.goto_pose('high_five', opts)
     sleep(2)
     for i in range(5):
         roboarm.clamp = '0'
@@ -1,5 +1,8 @@
+import functools
 from collections import namedtuple
 
+import numpy as np
+
 
 RGB  = namedtuple('RGB', 'r g b')
 RGBA = namedtuple('RGBA', 'r g b alpha')
@@ -109,17 +112,21 @@ def scale(minimum: float, maximum: float, val: float):
 
 
 # Dim the RGB color by the given ratio. Ratio 0 means completely dark, ratio 1.0
-# would return the color unmodified.
+# would return the color unmodified. Fades call this repeatedly with the same
+# arguments, so the results are memoized.
+@functools.lru_cache(maxsize=1024)
 def dim(rgb: RGB, ratio: float):
     hsl = rgb_to_hsl(rgb)
     return hsl_to_rgb(HSL(hsl.h, hsl.s, scale(0.15, hsl.l, ratio)))
 
 
-def blend(dst: RGB, src: RGBA):
-    ia = 1 - src.alpha
-    dst.r = src.alpha * src.r + ia * dst.r
-    dst.g = src.alpha * src.g + ia * dst.g
-    dst.b = src.alpha * src.b + ia * dst.b
+# Blend the color src with the given alpha over the color dst and return the
+# resulting color. Both arguments can be any sequences with the color
+# components in the RGB(A) order.
+def blend(dst: RGB, src: RGBA) -> RGB:
+    a = src[3]
+    ia = 1 - a
+    return RGB(a * src[0] + ia * dst[0], a * src[1] + ia * dst[1], a * src[2] + ia * dst[2])
 
 
 def rgb_to_float(src: RGB | RGBA):
@@ -131,5 +138,91 @@ def rgb_to_float(src: RGB | RGBA):
         raise Exception('Unsupported source value type')
 
 
+# Convert a color given by name (see the color dictionary above) or as a
+# sequence of three or four floats (RGB[A]) in the range from 0 to 1 into a
+# tuple of floats.
+def parse_color(v) -> tuple:
+    if isinstance(v, str):
+        try:
+            return tuple(rgb_to_float(color[v]))
+        except KeyError:
+            raise Exception(f'Unknown color {v}')
+
+    if len(v) != 3 and len(v) != 4:
+        raise Exception('Invalid color, 3 or 4 values expected')
+    return tuple(float(c) for c in v)
+
+
 def rgb_to_css(rgb: RGB) -> str:
     return f'#{rgb.r:02x}{rgb.g:02x}{rgb.b:02x}'
+
+
+# Array versions of the conversions above. Each function converts an array of
+# colors with the shape (N, 3), or any shape ending with 3, in a single
+# vectorized operation. RGB arrays hold values from 0 to 255 like the RGB
+# tuple, HSL and linear arrays hold floats from 0 to 1.
+
+def rgb_to_hsl_array(rgb: np.ndarray) -> np.ndarray:
+    x = np.asarray(rgb, dtype=np.float64) / 255
+    r, g, b = x[..., 0], x[..., 1], x[..., 2]
+
+    high = x.max(axis=-1)
+    low = x.min(axis=-1)
+    l = (high + low) / 2
+
+    d = high - low
+    gray = d == 0
+    d = np.where(gray, 1, d)
+
+    s = np.where(l > 0.5, d / np.where(gray, 1, 2 - high - low), d / np.where(gray, 1, high + low))
+    h = np.select(
+        [high == r, high == g],
+        [(g - b) / d + np.where(g < b, 6, 0), (b - r) / d + 2],
+        (r - g) / d + 4) / 6
+
+    return np.stack((np.where(gray, 0, h), np.where(gray, 0, s), l), axis=-1)
+
+
+def hue_to_rgb_array(p: np.ndarray, q: np.ndarray, t: np.ndarray) -> np.ndarray:
+    t = np.where(t < 0, t + 1, t)
+    t = np.where(t > 1, t - 1, t)
+    return np.select(
+        [t < 1 / 6, t < 1 / 2, t < 2 / 3],
+        [p + (q - p) * 6 * t, q, p + (q - p) * (2 / 3 - t) * 6],
+        p)
+
+
+def hsl_to_rgb_array(hsl: np.ndarray) -> np.ndarray:
+    hsl = np.asarray(hsl, dtype=np.float64)
+    h, s, l = hsl[..., 0], hsl[..., 1], hsl[..., 2]
+
+    q = np.where(l < 0.5, l * (1 + s), l + s - l * s)
+    p = 2 * l - q
+    rgb = np.stack((
+        hue_to_rgb_array(p, q, h + 1 / 3),
+        hue_to_rgb_array(p, q, h),
+        hue_to_rgb_array(p, q, h - 1 / 3)), axis=-1)
+
+    rgb = np.where((s == 0)[..., None], l[..., None], rgb)
+    return np.rint(rgb * 255).astype(np.uint8)
+
+
+# Convert sRGB colors (0-255) to linear light intensities (0-1) and back, using
+# the sRGB transfer function.
+def rgb_to_linear_array(rgb: np.ndarray) -> np.ndarray:
+    x = np.asarray(rgb, dtype=np.float64) / 255
+    return np.where(x <= 0.04045, x / 12.92, ((x + 0.055) / 1.055) ** 2.4)
+
+
+def linear_to_rgb_array(linear: np.ndarray) -> np.ndarray:
+    x = np.clip(np.asarray(linear, dtype=np.float64), 0, 1)
+    x = np.where(x <= 0.0031308, x * 12.92, 1.055 * x ** (1 / 2.4) - 0.055)
+    return np.rint(x * 255).astype(np.uint8)
+
+
+# The array version of dim. The ratio can be a scalar or an array that
+# broadcasts against the colors without the last axis.
+def dim_array(rgb: np.ndarray, ratio) -> np.ndarray:
+    hsl = rgb_to_hsl_array(rgb)
+    hsl[..., 2] = scale(0.15, hsl[..., 2], np.asarray(ratio))
+    return hsl_to_rgb_array(hsl)
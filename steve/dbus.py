@@ -8,12 +8,16 @@ log = logging.getLogger(__name__)
 
 
 class DBusAPI(Thread):
-    def __init__(self, bus_name):
+    def __init__(self, bus_name, objects=()):
         super().__init__()
         self.dbus_loop = None
         self.started = False
         self.bus_name = bus_name
 
+        # Additional (path, object) tuples to be published under the bus name
+        # together with this object
+        self.objects = list(objects)
+
     def start(self):
         super().start()
         self.started = True
@@ -21,7 +25,7 @@ class DBusAPI(Thread):
     def run(self):
         log.debug(f'Publishing {self.bus_name} on the system DBus')
         self.bus = SystemBus()
-        self.bus.publish(self.bus_name, self)
+        self.bus.publish(self.bus_name, self, *self.objects)
 
         self.dbus_loop = GLib.MainLoop()
         self.dbus_loop.run()
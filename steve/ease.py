@@ -1,5 +1,9 @@
+import re
+import functools
 from math import cos, pi, sin, pow, sqrt
 
+import numpy as np
+
 # The following functions have been inspired by the easing functions over at
 # https://easings.net
 
@@ -165,17 +169,352 @@ def out_bounce(x):
     if x < 1 / d1:
         return n1 * x * x
     elif x < 2 / d1:
-        x = x - 1.5
-        return n1 * x / d1 * x + 0.75
+        x = x - 1.5 / d1
+        return n1 * x * x + 0.75
     elif x < 2.5 / d1:
-        x = x - 2.25
-        return n1 * x / d1 * x + 0.9375
+        x = x - 2.25 / d1
+        return n1 * x * x + 0.9375
     else:
-        x = x - 2.625
-        return n1 * x / d1 * x + 0.984375
+        x = x - 2.625 / d1
+        return n1 * x * x + 0.984375
 
 def in_out_bounce(x):
     if x < 0.5:
         return (1 - out_bounce(1 - 2 * x)) / 2
     else:
         return (1 + out_bounce(2 * x - 1)) / 2
+
+
+# NumPy-vectorized forms of the easing functions above. Each function accepts
+# an array of positions and evaluates the curve for all of them in a single
+# call, e.g., to compute an entire trajectory at once. Piece-wise functions
+# evaluate all pieces and select the result with numpy.where, so the
+# arguments of sqrt are clipped to keep invalid pieces from producing NaNs.
+
+# The default number of points in lookup tables created by lut()
+DEFAULT_LUT_SIZE = 1025
+
+
+def _in_sine(x):
+    return 1 - np.cos((x * pi) / 2)
+
+def _out_sine(x):
+    return np.sin((x * pi) / 2)
+
+def _in_out_sine(x):
+    return -(np.cos(pi * x) - 1) / 2
+
+
+def _in_quad(x):
+    return x * x
+
+def _out_quad(x):
+    return 1 - (1 - x) * (1 - x)
+
+def _in_out_quad(x):
+    return np.where(x < 0.5, 2 * x * x, 1 - np.power(-2 * x + 2, 2) / 2)
+
+
+def _in_cubic(x):
+    return x * x * x
+
+def _out_cubic(x):
+    return 1 - np.power(1 - x, 3)
+
+def _in_out_cubic(x):
+    return np.where(x < 0.5, 4 * x * x * x, 1 - np.power(-2 * x + 2, 3) / 2)
+
+
+def _in_quart(x):
+    return x * x * x * x
+
+def _out_quart(x):
+    return 1 - np.power(1 - x, 4)
+
+def _in_out_quart(x):
+    return np.where(x < 0.5, 8 * x * x * x * x, 1 - np.power(-2 * x + 2, 4) / 2)
+
+
+def _in_quint(x):
+    return x * x * x * x * x
+
+def _out_quint(x):
+    return 1 - np.power(1 - x, 5)
+
+def _in_out_quint(x):
+    return np.where(x < 0.5, 16 * x * x * x * x * x, 1 - np.power(-2 * x + 2, 5) / 2)
+
+
+def _in_expo(x):
+    return np.where(x == 0, 0, np.power(2, 10 * x - 10))
+
+def _out_expo(x):
+    return np.where(x == 1, 1, 1 - np.power(2, -10 * x))
+
+def _in_out_expo(x):
+    return np.select(
+        [x == 0, x == 1, x < 0.5],
+        [0, 1, np.power(2, 20 * x - 10) / 2],
+        (2 - np.power(2, -20 * x + 10)) / 2)
+
+
+def _in_circ(x):
+    return 1 - np.sqrt(np.clip(1 - x * x, 0, None))
+
+def _out_circ(x):
+    return np.sqrt(np.clip(1 - np.power(x - 1, 2), 0, None))
+
+def _in_out_circ(x):
+    return np.where(x < 0.5,
+        (1 - np.sqrt(np.clip(1 - np.power(2 * x, 2), 0, None))) / 2,
+        (np.sqrt(np.clip(1 - np.power(-2 * x + 2, 2), 0, None)) + 1) / 2)
+
+
+def _in_back(x):
+    c1 = 1.70158
+    c3 = c1 + 1
+    return c3 * x * x * x - c1 * x * x
+
+def _out_back(x):
+    c1 = 1.70158
+    c3 = c1 + 1
+    return 1 + c3 * np.power(x - 1, 3) + c1 * np.power(x - 1, 2)
+
+def _in_out_back(x):
+    c1 = 1.70158
+    c2 = c1 * 1.525
+    return np.where(x < 0.5,
+        (np.power(2 * x, 2) * ((c2 + 1) * 2 * x - c2)) / 2,
+        (np.power(2 * x - 2, 2) * ((c2 + 1) * (x * 2 - 2) + c2) + 2) / 2)
+
+
+def _in_elastic(x):
+    c4 = (2 * pi) / 3
+    return np.select(
+        [x == 0, x == 1], [0, 1],
+        -np.power(2, 10 * x - 10) * np.sin((x * 10 - 10.75) * c4))
+
+def _out_elastic(x):
+    c4 = (2 * pi) / 3
+    return np.select(
+        [x == 0, x == 1], [0, 1],
+        np.power(2, -10 * x) * np.sin((x * 10 - 0.75) * c4) + 1)
+
+def _in_out_elastic(x):
+    c5 = (2 * pi) / 4.5
+    return np.select(
+        [x == 0, x == 1, x < 0.5],
+        [0, 1, -(np.power(2, 20 * x - 10) * np.sin((20 * x - 11.125) * c5)) / 2],
+        (np.power(2, -20 * x + 10) * np.sin((20 * x - 11.125) * c5)) / 2 + 1)
+
+
+def _in_bounce(x):
+    return 1 - _out_bounce(1 - x)
+
+def _out_bounce(x):
+    n1 = 7.5625
+    d1 = 2.75
+    return np.select(
+        [x < 1 / d1, x < 2 / d1, x < 2.5 / d1],
+        [n1 * x * x,
+         n1 * (x - 1.5 / d1) * (x - 1.5 / d1) + 0.75,
+         n1 * (x - 2.25 / d1) * (x - 2.25 / d1) + 0.9375],
+        n1 * (x - 2.625 / d1) * (x - 2.625 / d1) + 0.984375)
+
+def _in_out_bounce(x):
+    return np.where(x < 0.5, (1 - _out_bounce(1 - 2 * x)) / 2, (1 + _out_bounce(2 * x - 1)) / 2)
+
+
+# The names of all easing functions provided by this module
+names = [
+    'in_sine',    'out_sine',    'in_out_sine',
+    'in_quad',    'out_quad',    'in_out_quad',
+    'in_cubic',   'out_cubic',   'in_out_cubic',
+    'in_quart',   'out_quart',   'in_out_quart',
+    'in_quint',   'out_quint',   'in_out_quint',
+    'in_expo',    'out_expo',    'in_out_expo',
+    'in_circ',    'out_circ',    'in_out_circ',
+    'in_back',    'out_back',    'in_out_back',
+    'in_elastic', 'out_elastic', 'in_out_elastic',
+    'in_bounce',  'out_bounce',  'in_out_bounce'
+]
+
+# Vectorized easing functions keyed by name
+vector = { name: globals()[f'_{name}'] for name in names }
+
+
+class LUT:
+    '''An easing curve precomputed into a lookup table
+
+    The curve is sampled at size equidistant points in the range <0, 1>.
+    Calling the object interpolates linearly between the two nearest samples.
+    Both scalars and NumPy arrays are accepted.
+    '''
+    def __init__(self, fn, size=DEFAULT_LUT_SIZE, vectorized=False):
+        self.x = np.linspace(0, 1, size)
+        self.y = (fn if vectorized else vectorize(fn))(self.x)
+
+    def __call__(self, x):
+        y = np.interp(x, self.x, self.y)
+        return float(y) if np.ndim(y) == 0 else y
+
+
+def vectorize(fn):
+    '''Return a function that evaluates the easing function fn on arrays
+
+    The argument can be one of the easing functions in this module, its name,
+    or any callable. Objects that already accept arrays, i.e., lookup tables,
+    are returned as is. Other callables are evaluated element by element.
+    '''
+    if isinstance(fn, str):
+        return vector[fn]
+
+    if isinstance(fn, LUT):
+        return fn
+
+    name = getattr(fn, '__name__', None)
+    if name in vector and globals()[name] is fn:
+        return vector[name]
+
+    return lambda x: np.array([fn(v) for v in np.ravel(x)], dtype=float).reshape(np.shape(x))
+
+
+@functools.lru_cache(maxsize=None)
+def lut(name: str, size: int = DEFAULT_LUT_SIZE) -> LUT:
+    '''Return a cached lookup table for the named easing function'''
+    return LUT(vector[name], size)
+
+
+# Custom easing curves. The curves are solved once for the given parameters
+# and turned into lookup tables. The tables are cached, so repeated use of a
+# curve with the same parameters costs only the table lookup.
+
+# Keywords of the CSS transition-timing-function property and their Bézier
+# control points
+CSS_KEYWORDS = {
+    'ease'       : (0.25, 0.1, 0.25, 1.0),
+    'ease-in'    : (0.42, 0.0, 1.0, 1.0),
+    'ease-out'   : (0.0, 0.0, 0.58, 1.0),
+    'ease-in-out': (0.42, 0.0, 0.58, 1.0)
+}
+
+# A spring curve is considered settled when it stays within this distance
+# from the target value.
+SPRING_EPSILON = 1e-3
+
+
+@functools.lru_cache(maxsize=64)
+def cubic_bezier(x1: float, y1: float, x2: float, y2: float, size: int = DEFAULT_LUT_SIZE) -> LUT:
+    '''Return a CSS-style cubic Bézier easing curve
+
+    The curve starts at (0, 0), ends at (1, 1) and has control points (x1, y1)
+    and (x2, y2). As in CSS, x1 and x2 must be within <0, 1>, which makes x a
+    monotonic function of the curve parameter t. The curve is sampled densely
+    in t and inverted with linear interpolation, so no per-tick root finding
+    is needed.
+    '''
+    if not (0 <= x1 <= 1 and 0 <= x2 <= 1):
+        raise ValueError('The x coordinates of cubic Bézier control points must be within <0, 1>')
+
+    t = np.linspace(0, 1, size * 8)
+    mt = 1 - t
+    bx = 3 * mt * mt * t * x1 + 3 * mt * t * t * x2 + t * t * t
+    by = 3 * mt * mt * t * y1 + 3 * mt * t * t * y2 + t * t * t
+    return LUT(lambda x: np.interp(x, bx, by), size, vectorized=True)
+
+
+@functools.lru_cache(maxsize=64)
+def spring(mass: float = 1, stiffness: float = 100, damping: float = 10, velocity: float = 0, size: int = DEFAULT_LUT_SIZE) -> LUT:
+    '''Return a damped spring easing curve
+
+    The parameters follow the WebKit spring() timing function: the mass, the
+    spring's stiffness, the damping coefficient, and the initial velocity.
+    The physical simulation runs until the spring settles and the settling
+    time is mapped to the range <0, 1>.
+    '''
+    if mass <= 0 or stiffness <= 0 or damping < 0:
+        raise ValueError('Invalid spring parameters')
+
+    w0 = sqrt(stiffness / mass)
+    zeta = damping / (2 * sqrt(stiffness * mass))
+
+    if zeta < 1:
+        wd = w0 * sqrt(1 - zeta * zeta)
+        a, b = 1, (zeta * w0 - velocity) / wd
+        fn = lambda t: 1 - np.exp(-zeta * w0 * t) * (a * np.cos(wd * t) + b * np.sin(wd * t))
+        decay = zeta * w0
+    elif zeta == 1:
+        a, b = 1, w0 - velocity
+        fn = lambda t: 1 - np.exp(-w0 * t) * (a + b * t)
+        decay = w0
+    else:
+        # Overdamped, the sum of two decaying exponentials. The slower one
+        # (r1) determines the settling time.
+        s = sqrt(zeta * zeta - 1)
+        r1, r2 = -w0 * (zeta - s), -w0 * (zeta + s)
+        b = (-velocity - r1) / (r2 - r1)
+        a = 1 - b
+        fn = lambda t: 1 - (a * np.exp(r1 * t) + b * np.exp(r2 * t))
+        decay = -r1
+
+    if decay <= 0:
+        raise ValueError('An undamped spring never settles')
+
+    # Find the time after which the spring stays within SPRING_EPSILON from
+    # the target value.
+    t = np.linspace(0, 20 / decay, size * 8)
+    unsettled = np.nonzero(np.abs(1 - fn(t)) > SPRING_EPSILON)[0]
+    duration = t[unsettled[-1] + 1] if len(unsettled) and unsettled[-1] + 1 < len(t) else t[-1]
+
+    table = LUT(lambda x: fn(x * duration), size, vectorized=True)
+    table.y[-1] = 1.0
+    return table
+
+
+@functools.lru_cache(maxsize=128)
+def parse(spec: str):
+    '''Convert easing specification string into an easing function
+
+    The following specifications are supported:
+
+      - the name of an easing function from this module, e.g., in_out_cubic
+      - linear, which returns None (no easing)
+      - CSS keywords ease, ease-in, ease-out, ease-in-out
+      - cubic-bezier(x1, y1, x2, y2)
+      - spring(mass, stiffness, damping, velocity), trailing parameters can be
+        omitted
+
+    Returned functions accept both scalars and NumPy arrays.
+    '''
+    spec = spec.strip()
+    if spec == 'linear':
+        return None
+
+    if spec in names:
+        return globals()[spec]
+
+    try:
+        return cubic_bezier(*CSS_KEYWORDS[spec])
+    except KeyError:
+        pass
+
+    m = re.fullmatch(r'([a-z_-]+)\s*\(([^)]*)\)', spec)
+    if m is None:
+        raise ValueError(f'Unsupported easing function {spec}')
+
+    name = m.group(1).replace('_', '-')
+    try:
+        args = tuple(float(v) for v in m.group(2).split(',')) if m.group(2).strip() else ()
+    except ValueError as e:
+        raise ValueError(f'Invalid parameters in easing function {spec}') from e
+
+    if name == 'cubic-bezier':
+        if len(args) != 4:
+            raise ValueError('cubic-bezier requires four parameters')
+        return cubic_bezier(*args)
+    elif name == 'spring':
+        if len(args) > 4:
+            raise ValueError('spring accepts at most four parameters')
+        return spring(*args)
+    else:
+        raise ValueError(f'Unsupported easing function {spec}')
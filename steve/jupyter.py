@@ -1,4 +1,5 @@
 from steve.color import RGB, rgb_to_css
+from steve.model import DEFAULT_MODEL, load, state_range
 import ipywidgets as widgets
 
 led_html = '''
@@ -69,7 +70,9 @@ class Servo:
     def __init__(self, description, min, max, type='angular', step=0.1):
         self._widget = widgets.FloatSlider(
             min=min, max=max, description=description,
-            step=step, readout=True, readout_format='.1f', continuous_update=False)
+            step=step, readout=True, continuous_update=False,
+            # Linear actuators move by fractions of a millimeter
+            readout_format='.1f' if type == 'angular' else '.4f')
         self._widget.disabled = True
         self.type = type
 
@@ -96,32 +99,34 @@ class Servo:
         return self._widget.__str__()
 
 
+# Human-readable labels for the sliders. Actuators not listed here are labeled
+# with their capitalized name.
+LABELS = {
+    'wrist_lr': 'Wrist ⇆',
+    'wrist_ud': 'Wrist ⇅'
+}
+
+
 class Servos:
     '''A collection of servos emulating a robotic arm with six degrees of freedom.
+
+    The servos and their ranges are taken from the robotic arm's model file.
     '''
-    def __init__(self):
-        self.torso = Servo('Torso', -90, 90, type='angular')
-        self.clamp = Servo('Clamp', 0, 1, type='linear', step=0.01)
-        self.wrist_lr = Servo('Wrist ⇆', -90, 90, type='angular')
-        self.wrist_ud = Servo('Wrist ⇅', -90, 90, type='angular')
-        self.elbow = Servo('Elbow', -58.4, 61.7, type='angular')
-        self.shoulder = Servo('Shoulder', -90, 90, type='angular')
-        self._vbox = widgets.VBox([
-            self.torso._widget,
-            self.clamp._widget,
-            self.wrist_lr._widget,
-            self.wrist_ud._widget,
-            self.elbow._widget,
-            self.shoulder._widget
-        ])
+    def __init__(self, model=DEFAULT_MODEL):
+        self._model = load(model)
+        self._servo = {}
+        for name, actuator in self._model['actuators'].items():
+            min, max = state_range(self._model, name)
+            type_ = actuator['type']
+            step = 0.1 if type_ == 'angular' else (max - min) / 100
+            self._servo[name] = Servo(LABELS.get(name, name.capitalize()), min, max, type=type_, step=step)
+            setattr(self, name, self._servo[name])
+
+        self._vbox = widgets.VBox([servo._widget for servo in self._servo.values()])
 
     def power_off(self):
-        self.torso.power_off()
-        self.clamp.power_off()
-        self.wrist_lr.power_off()
-        self.wrist_ud.power_off()
-        self.elbow.power_off()
-        self.shoulder.power_off()
+        for servo in self._servo.values():
+            servo.power_off()
 
     def _repr_mimebundle_(self, *args, **kwargs):
         return self._vbox._repr_mimebundle_(*args, **kwargs)
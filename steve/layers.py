@@ -0,0 +1,249 @@
+import threading
+
+import numpy as np
+
+# Blend modes. A normal layer is blended over the layers below it using its
+# alpha. An add layer adds its color weighted by alpha to the layers below. A
+# multiply layer multiplies the layers below by its color, with alpha
+# controlling how strongly.
+NORMAL   = 'normal'
+ADD      = 'add'
+MULTIPLY = 'multiply'
+
+BLEND_MODES = (NORMAL, ADD, MULTIPLY)
+
+# The default maximum number of layers in a stack
+DEFAULT_CAPACITY = 64
+
+
+class Layer:
+    '''A layer in a LayerStack
+
+    The layer's pixel values are stored in the stack's preallocated arrays at
+    index slot. Layers are ordered by priority first and by z within the same
+    priority. Layers with the same priority and z are ordered by the time they
+    were added (seq).
+    '''
+    __slots__ = ('id', 'slot', 'z', 'priority', 'mode', 'seq')
+
+    def __init__(self, id, slot, z, priority, mode, seq):
+        self.id = id
+        self.slot = slot
+        self.z = z
+        self.priority = priority
+        self.mode = mode
+        self.seq = seq
+
+
+class LayerView:
+    '''A handle to the value of a layer that outlives the layer safely
+
+    Code that modifies a layer outside of the stack's lock, e.g., an animation
+    coroutine, may still hold the layer after it has been removed and its slot
+    has been handed out to a new layer. The view remembers the generation of
+    the slot when it was created and ignores writes once the generation has
+    changed. Reads return copies, so in-place operators on the returned arrays
+    go through __setitem__ as well.
+    '''
+    __slots__ = ('stack', 'slot', 'generation')
+
+    def __init__(self, stack, slot, generation):
+        self.stack = stack
+        self.slot = slot
+        self.generation = generation
+
+    @property
+    def valid(self) -> bool:
+        return self.stack.generation[self.slot] == self.generation
+
+    def __getitem__(self, key) -> np.ndarray:
+        return self.stack.value[self.slot][key].copy()
+
+    def __setitem__(self, key, v):
+        with self.stack.lock:
+            if self.valid:
+                self.stack.value[self.slot][key] = v
+
+
+def composite(stack: np.ndarray, mask: np.ndarray | None = None, background: np.ndarray | None = None) -> np.ndarray:
+    '''Blend a stack of normal layers over the background
+
+    The stack is an array with the shape (layers, pixels, 4) ordered from the
+    bottom layer to the top layer. The optional mask with the shape (layers,
+    pixels) multiplies the alpha of each layer. Blending the layers one after
+    another with the "over" operator is equivalent to weighting the color of
+    each layer by its alpha and by the transparency of all layers above it,
+    which is what this function computes for all layers and pixels at once.
+    The background defaults to black. Returns an array of RGB values with the
+    shape (pixels, 3).
+    '''
+    alpha = stack[..., 3] if mask is None else stack[..., 3] * mask
+
+    # above[i] is the product of (1 - alpha) of all layers above layer i
+    above = np.ones_like(alpha)
+    if len(alpha) > 1:
+        above[:-1] = np.cumprod((1 - alpha)[:0:-1], axis=0)[::-1]
+
+    rv = np.einsum('lp,lpc->pc', alpha * above, stack[..., :3])
+    if background is not None:
+        rv += (above[0] * (1 - alpha[0]))[:, None] * background
+    return rv
+
+
+class LayerStack:
+    '''An ordered set of LED layers backed by preallocated arrays
+
+    The values of all layers are kept in a single float32 array with the
+    shape (capacity, pixels, 4) and the masks in an array with the shape
+    (capacity, pixels). Array slots are handed out from a free list, so adding
+    and removing a layer takes constant time and allocates no memory. The
+    stacking order is recomputed only when the set of layers or their order
+    changes.
+
+    All methods can be called from any thread. Callers that need to perform
+    several operations atomically, or to modify the array returned by
+    __getitem__, should hold the lock.
+    '''
+    def __init__(self, pixels: int, capacity: int = DEFAULT_CAPACITY):
+        self.pixels = pixels
+        self.capacity = capacity
+        self.value = np.zeros((capacity, pixels, 4), dtype=np.float32)
+        self.mask = np.ones((capacity, pixels), dtype=np.float32)
+        self.lock = threading.RLock()
+
+        # Incremented whenever a slot is freed, see LayerView
+        self.generation = [0] * capacity
+
+        self._free = list(range(capacity - 1, -1, -1))
+        self._layer = {}
+        self._order = None
+        self._next_id = 0
+        self._seq = 0
+
+    def __len__(self):
+        return len(self._layer)
+
+    def __contains__(self, id):
+        return id in self._layer
+
+    def __getitem__(self, id) -> np.ndarray:
+        '''Return the value of the layer, a view into the stack's array'''
+        return self.value[self._layer[id].slot]
+
+    def view(self, id) -> LayerView:
+        '''Return a view of the layer that ignores writes after its removal'''
+        with self.lock:
+            slot = self._layer[id].slot
+            return LayerView(self, slot, self.generation[slot])
+
+    def ids(self) -> list:
+        with self.lock:
+            return [l.id for l in self.order()]
+
+    def to_mask(self, v) -> np.ndarray:
+        '''Convert a mask specification into a per-pixel mask array
+
+        The mask can be given as a sequence of pixel indices, or as a sequence
+        with one value in the range from 0 to 1 per pixel.
+        '''
+        v = np.asarray(v)
+        if v.dtype.kind in 'iu':
+            mask = np.zeros(self.pixels, dtype=np.float32)
+            mask[v] = 1
+            return mask
+
+        if v.shape != (self.pixels,):
+            raise Exception(f'Invalid mask, {self.pixels} values expected')
+        return v.astype(np.float32)
+
+    def add(self, alpha=1.0, mask=None, z=0, priority=0, mode=NORMAL) -> int:
+        '''Add a new transparent black layer and return its ID'''
+        if mode not in BLEND_MODES:
+            raise Exception(f'Unsupported blend mode {mode}')
+
+        m = self.to_mask(mask) if mask is not None else None
+
+        with self.lock:
+            try:
+                slot = self._free.pop()
+            except IndexError:
+                raise Exception(f'Too many layers, at most {self.capacity} supported')
+
+            id = self._next_id
+            self._next_id += 1
+            self._seq += 1
+
+            self.value[slot, :, :3] = 0
+            self.value[slot, :, 3] = alpha
+            self.mask[slot] = 1 if m is None else m
+
+            self._layer[id] = Layer(id, slot, z, priority, mode, self._seq)
+            self._order = None
+        return id
+
+    def remove(self, id) -> bool:
+        '''Remove the layer, return False if there is no such layer'''
+        with self.lock:
+            layer = self._layer.pop(id, None)
+            if layer is None:
+                return False
+
+            self.generation[layer.slot] += 1
+            self._free.append(layer.slot)
+            self._order = None
+        return True
+
+    def set_mask(self, id, mask=None):
+        with self.lock:
+            self.mask[self._layer[id].slot] = 1 if mask is None else self.to_mask(mask)
+
+    def restack(self, id, z=None, priority=None, mode=None):
+        '''Change the z-order, priority, or blend mode of the layer'''
+        if mode is not None and mode not in BLEND_MODES:
+            raise Exception(f'Unsupported blend mode {mode}')
+
+        with self.lock:
+            layer = self._layer[id]
+            if z is not None: layer.z = z
+            if priority is not None: layer.priority = priority
+            if mode is not None: layer.mode = mode
+            self._order = None
+
+    def order(self) -> tuple:
+        '''Return the layers ordered from the bottom to the top'''
+        with self.lock:
+            if self._order is None:
+                self._order = tuple(sorted(self._layer.values(), key=lambda l: (l.priority, l.z, l.seq)))
+            return self._order
+
+    def _runs(self):
+        '''Split the ordered layers into runs of layers with the same blend mode'''
+        runs = []
+        for layer in self.order():
+            if runs and runs[-1][0] == layer.mode:
+                runs[-1][1].append(layer.slot)
+            else:
+                runs.append((layer.mode, [layer.slot]))
+        return runs
+
+    def compose(self) -> np.ndarray:
+        '''Blend all layers and return an array of RGB values, one per pixel
+
+        Each run of consecutive layers with the same blend mode is blended in
+        a single vectorized operation.
+        '''
+        rv = np.zeros((self.pixels, 3), dtype=np.float32)
+
+        with self.lock:
+            for mode, slots in self._runs():
+                value = self.value[slots]
+                alpha = value[..., 3] * self.mask[slots]
+
+                if mode == NORMAL:
+                    rv = composite(value, self.mask[slots], rv)
+                elif mode == ADD:
+                    rv += np.einsum('lp,lpc->pc', alpha, value[..., :3])
+                elif mode == MULTIPLY:
+                    rv *= np.prod(1 - alpha[..., None] * (1 - value[..., :3]), axis=0)
+
+        return np.clip(rv, 0, 1, out=rv)
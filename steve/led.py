@@ -1,34 +1,50 @@
+import time
 import logging
-from collections import OrderedDict
+from collections import namedtuple
 
 import click
-##import board   # adafruit-blinka
-##mport busio   # adafruit-blinka
+import numpy as np
 from pydbus import SystemBus
 import asyncio
-##import adafruit_tlc59711
 
-from steve.color import RGB, RGBA, blend, rgb_to_float
+from steve.color import RGB, RGBA, rgb_to_float, parse_color
 from steve.config import dbus_prefix
-from steve.animation import current_layer, blink, breathe
+from steve.animation import current_layer, Animation, Transition, Blink, Breathe, Timeline, CoroutineAnimation
 from steve.utils import init_logging
+from steve.ledout import OutputStage, TLC59711Output, DEFAULT_GAMMA
+from steve.layers import LayerStack, NORMAL
 from steve.dbus import DBusAPI
+import steve.timeline
 
 log = logging.getLogger(__name__)
 
 BUS_NAME = f'{dbus_prefix}.LED'
 
-# This variable is used to generate unique layer IDs
-layer_id = 0
+# The number of RGB pixels (LEDs) in the TLC59711 chain. Each TLC59711 drives
+# four RGB LEDs.
+PIXEL_COUNT = 16
 
-# An ordered set of LED layers. Each layer is a list of four values: red, green,
-# blue, alpha. All values are in the range from 0 to 1.
-layers = OrderedDict()
+# The default maximum frame rate of the compositor in Hz
+DEFAULT_RATE = 100
 
-# A dictionary per-layer animation tasks, keyed by layer id. Animations are
-# optional. There is no need for constant layers to have an animation task.
+# The LED layers. Each layer is a float32 NumPy array with one row per pixel.
+# Each row has four values: red, green, blue, alpha. All values are in the
+# range from 0 to 1. The stack's lock also protects the animations below.
+layers = LayerStack(PIXEL_COUNT)
+
+# A dictionary of per-layer animations, keyed by layer id. Animations are
+# optional. There is no need for constant layers to have an animation.
 animations = {}
 
+# A running animation. The attribute start is the time (time.monotonic) when
+# the animation started and base is the value of the layer at that time. If
+# remove is True, the layer is removed when the animation finishes.
+Running = namedtuple('Running', 'animation start base remove')
+
+# The IDs of layers whose animations finished with remove=True. The layers are
+# removed on the next frame, so that the final value is composed first.
+finished = []
+
 # A reference to the layer that is used to indicate that the servos are moving.
 # This layer exists if and only if at least one servo is moving.
 moving_layer = None
@@ -45,86 +61,323 @@ actuator_layer = None
 
 old_active = None
 
+# The asyncio loop running the compositor and the animations
+asyncio_loop = None
 
-def update_ipywidget_leds(c):
-    pass
+# The compositor that blends the layers and sends the result to the LEDs
+compositor = None
 
+# The hardware output backend, if any
+output = None
 
-## def update_tlc_leds(c):
-##     tlc.set_pixel_all(c)
-##     tlc.show()
+# The directory with light show timeline files
+lights_dir = steve.timeline.LIGHTS_DIR
 
 
-async def led_updater(callback, rate=100):
-    while True:
-        c = [0, 0, 0]
-        for l in layers.values():
-            blend(c, l)
+def update_ipywidget_leds(c):
+    pass
 
-        callback(c)
-        await asyncio.sleep(1 / rate)
 
+class Compositor:
+    '''Blend the LED layers and send the result to the output callback
+
+    The compositor does nothing until the framebuffer is invalidated, i.e.,
+    until a layer is added, modified, or removed. It then evaluates the
+    running animations, blends all layers and passes the result to the
+    callback, unless the result is identical to the last output. While at
+    least one animation is running, the compositor keeps recompositing, but
+    never more often than the given rate (in Hz). Once all animations are
+    done, the compositor goes idle until it is invalidated again.
+
+    If an output stage is given, composited frames are converted with it to
+    16-bit PWM values before they are passed to the callback.
+
+    The attribute frames counts the composited frames and unchanged counts
+    the frames not passed to the callback because they were identical to the
+    last output. If a budget (in seconds) is given, frames that take longer to
+    compose are counted in the overruns attribute and logged. If trace is set
+    to a list, a (start, duration) tuple is appended to it for each frame.
+    '''
+    def __init__(self, callback, rate=DEFAULT_RATE, output=None, budget=None):
+        self.callback = callback
+        self.rate = rate
+        self.output = output
+        self.budget = budget
+        self.loop = None
+        self.last = None
+        self.frames = 0
+        self.unchanged = 0
+        self.overruns = 0
+        self.trace = None
+        self._dirty = asyncio.Event()
+        self._dirty.set()
+
+    def stats(self) -> dict:
+        return {
+            'frames'   : self.frames,
+            'unchanged': self.unchanged,
+            'overruns' : self.overruns
+        }
+
+    def invalidate(self):
+        '''Mark the framebuffer dirty
+
+        This method can be called from any thread.
+        '''
+        if self.loop is None:
+            return
+
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+
+        if running is self.loop:
+            self._dirty.set()
+        else:
+            self.loop.call_soon_threadsafe(self._dirty.set)
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        period = 1 / self.rate
+        deadline = self.loop.time()
+
+        while True:
+            await self._dirty.wait()
+            self._dirty.clear()
+            start = self.loop.time()
+
+            # Schedule the next frame one period after the previous deadline,
+            # so that the frame rate does not drift. If the compositor was
+            # idle or fell behind by more than a frame, start over.
+            deadline = deadline + period if start - deadline < period else start + period
+
+            # Keep the framebuffer dirty for as long as any animation is
+            # running.
+            animating = animate(time.monotonic())
+            if animating:
+                self._dirty.set()
+
+            c = layers.compose()
+            if self.output is not None:
+                c = self.output(c, dither=animating)
+
+            if self.last is None or not np.array_equal(c, self.last):
+                self.last = c
+                self.callback(c)
+            else:
+                self.unchanged += 1
+
+            now = self.loop.time()
+            self.frames += 1
+            if self.trace is not None:
+                self.trace.append((start, now - start))
+
+            if self.budget is not None and now - start > self.budget:
+                self.overruns += 1
+                log.warning(f'Frame took {(now - start) * 1000:.2f} ms, over the budget of {self.budget * 1000:.2f} ms ({self.overruns} overruns)')
+
+            # Enforce the frame rate cap
+            await asyncio.sleep(max(0, deadline - now))
+
+
+def animate(now: float) -> bool:
+    '''Evaluate all running animations at the given time
+
+    Animations that have finished are removed, leaving their layers at the
+    final value, or removing the layers too if requested. Such layers are
+    removed on the next call, once their final value has been composed.
+    Returns True if at least one animation is still running or a layer is
+    waiting to be removed.
+    '''
+    running = False
+    with layers.lock:
+        for id in finished:
+            if id not in animations:
+                layers.remove(id)
+        finished.clear()
+
+        for id, r in list(animations.items()):
+            try:
+                layer = layers[id]
+            except KeyError:
+                continue
+
+            t = now - r.start
+            r.animation(t, r.base, layer)
+            if not r.animation.done(t):
+                running = True
+            else:
+                del animations[id]
+                if r.remove:
+                    finished.append(id)
+                    running = True
+    return running
+
+
+def invalidate():
+    if compositor is not None:
+        compositor.invalidate()
+
+
+def add_layer(v=None, alpha=1.0, mask=None, z=0, priority=0, mode=NORMAL):
+    '''Add a new layer
+
+    The new layer is placed on top of all existing layers with the same
+    priority and z. The optional mask restricts the layer to a subset of the
+    pixels, see LayerStack.to_mask for the supported formats. Returns the ID
+    of the new layer.
+    '''
+    with layers.lock:
+        id = layers.add(alpha=alpha, mask=mask, z=z, priority=priority, mode=mode)
+        if v is not None:
+            update_layer(v, id)
+    invalidate()
+    return id
 
-def add_layer(v=None, alpha=1.0):
-    global layer_id
-    id = layer_id
-    layer_id += 1
 
-    layers[id] = [0, 0, 0, alpha]
-    if v is not None:
-        update_layer(v, id)
-    return id
+def set_animation(layer_id, animation, remove=False):
+    '''Start the animation on the given layer
+
+    The animation is either an Animation object or a coroutine. Coroutines
+    are run in their own tasks through the CoroutineAnimation adapter. If
+    remove is True, the layer is removed once the animation finishes.
+    '''
+    with layers.lock:
+        remove_animation(layer_id)
+        layer = layers[layer_id]
 
+        if asyncio.iscoroutine(animation):
+            animation = CoroutineAnimation(animation)
+            # The coroutine may not stop writing into the layer immediately
+            # after it is cancelled, so it gets a view that ignores writes
+            # once the layer's slot has been reused.
+            current_layer.set((layer_id, layers.view(layer_id), update_layer))
+            animation.task = asyncio.run_coroutine_threadsafe(animation.coro, asyncio_loop)
+        elif animation.color is not None:
+            set_color(layer, animation.color)
 
-def set_animation(layer_id, coro):
-    remove_animation(layer_id)
-    current_layer.set((layer_id, layers[layer_id], update_layer))
-    animations[layer_id] = asyncio.run_coroutine_threadsafe(coro, asyncio_loop)
+        animations[layer_id] = Running(animation, time.monotonic(), layer.copy(), remove)
+    invalidate()
 
 
 def remove_animation(layer_id):
-    animation = animations.get(layer_id, None)
-    if animation is not None:
-        animation.cancel()
-        del animations[layer_id]
+    with layers.lock:
+        running = animations.pop(layer_id, None)
+    if running is not None and isinstance(running.animation, CoroutineAnimation):
+        running.animation.task.cancel()
 
 
 def remove_layer(id):
-    remove_animation(id)
+    with layers.lock:
+        remove_animation(id)
+        removed = layers.remove(id)
 
-    try:
-        del layers[id]
-    except KeyError:
-        pass
+    if removed:
+        invalidate()
 
 
 def update_layer(v, id=None):
     if id is None:
-        id, layer, _ = current_layer.get()
-    else:
-        layer = layers[id]
+        id, _, _ = current_layer.get()
 
-    if isinstance(v, RGB) or isinstance(v, RGBA):
-        v = rgb_to_float(v)
-    elif isinstance(v, list) or isinstance(v, tuple):
-        if len(v) < 3:
-            raise Exception('Invalid value, at least 3 items expected')
+    if asyncio.iscoroutine(v) or isinstance(v, Animation):
+        set_animation(id, v)
+        return
 
-    layer[0] = v[0]
-    layer[1] = v[1]
-    layer[2] = v[2]
+    with layers.lock:
+        set_color(layers[id], v)
+    invalidate()
 
-    if len(v) >= 4:
-        layer[3] = v[3]
 
-    elif asyncio.iscoroutine(v):
-        set_animation(id, v)
+def set_color(layer, v):
+    # A value can be a single color applied to all pixels in the layer, or an
+    # array with one color per pixel.
+    if isinstance(v, RGB) or isinstance(v, RGBA):
+        v = rgb_to_float(v)
+    elif isinstance(v, list) or isinstance(v, tuple) or isinstance(v, np.ndarray):
+        if np.shape(v)[-1] < 3:
+            raise Exception('Invalid value, at least 3 items expected')
     else:
         raise Exception('Bug: Unsupported value type')
 
+    v = np.asarray(v, dtype=np.float32)
+    layer[..., :v.shape[-1]] = v[..., :4]
+
+
+def parse_animation(spec: dict):
+    '''Create an animation from a declarative specification
+
+    The specification is a dictionary with the following keys, all optional:
+
+      type     : solid (default), transition, blink, breathe, or timeline
+      color    : color name from steve.color or a list of 3-4 floats (RGB[A])
+      period   : the period of blink and breathe animations in seconds
+      on, off  : on and off durations of blink, half the period by default
+      gamma    : the width of the breathe curve
+      ease     : easing specification for transitions, see steve.ease.parse
+      duration : the duration of the animation in seconds
+      repeat   : the number of periods of blink and breathe animations
+      name     : the name of a timeline file in lights_dir, see steve.timeline
+
+    Returns the animation, or the color for solid layers.
+    '''
+    type_ = spec.get('type', 'solid')
+    color = parse_color(spec.get('color', 'white'))
+    period = spec.get('period', 1.0)
+    on = spec.get('on', period / 2)
+    off = spec.get('off', period / 2)
+
+    # The length of a single cycle, which repeat multiplies. A blink with
+    # explicit on and off durations cycles in on + off seconds.
+    cycle = on + off if type_ == 'blink' else period
+
+    duration = spec.get('duration', None)
+    if duration is None and 'repeat' in spec:
+        duration = cycle * spec['repeat']
+
+    if type_ == 'solid':
+        return color
+    elif type_ == 'transition':
+        return Transition(color, 1.0 if duration is None else duration, ease=spec.get('ease', None))
+    elif type_ == 'blink':
+        return Blink(color, on, off, duration=duration)
+    elif type_ == 'breathe':
+        return Breathe(color, period=period, gamma=spec.get('gamma', 0.12), duration=duration)
+    elif type_ == 'timeline':
+        # Timelines are compiled at the compositor's rate so that each frame
+        # of the timeline is shown exactly once.
+        rate = compositor.rate if compositor is not None else DEFAULT_RATE
+        frames, loop = steve.timeline.load(spec['name'], rate, PIXEL_COUNT, directory=lights_dir)
+        return Timeline(frames, rate, loop)
+    else:
+        raise Exception(f'Unsupported animation type {type_}')
+
+
+def start_animation(spec: dict) -> int:
+    '''Create a new layer running the animation described by spec
+
+    In addition to the keys supported by parse_animation, the specification
+    can include the layer's alpha, mask (list of pixel indices), z, priority,
+    and blend mode. If remove is True, the layer is removed when the animation
+    finishes. That is the default for blink, breathe, and timeline animations
+    with a duration. Returns the ID of the new layer.
+    '''
+    v = parse_animation(spec)
+    remove = spec.get('remove', isinstance(v, (Blink, Breathe, Timeline)) and v.duration is not None)
+
+    with layers.lock:
+        id = add_layer(alpha=spec.get('alpha', 1.0), mask=spec.get('mask', None), z=spec.get('z', 0),
+            priority=spec.get('priority', 0), mode=spec.get('mode', NORMAL))
+        if isinstance(v, Animation):
+            set_animation(id, v, remove=remove)
+        else:
+            update_layer(v, id)
+    return id
+
 
 def off():
-    for layer in list(layers.keys()):
+    for layer in layers.ids():
         remove_layer(layer)
 
 
@@ -133,8 +386,11 @@ class LEDDBusAPI(DBusAPI):
         f = asyncio.run_coroutine_threadsafe(coro, asyncio_loop)
         return f.result()
 
-    def add_layer(self, opacity):
-        return add_layer(opacity)
+    def add_layer(self, red, green, blue, opacity):
+        return add_layer((red, green, blue, opacity))
+
+    def animate(self, spec):
+        return start_animation(spec)
 
     def remove_layer(self, id):
         remove_layer(id)
@@ -142,6 +398,17 @@ class LEDDBusAPI(DBusAPI):
     def off(self):
         off()
 
+    @property
+    def stats(self):
+        # The compositor's counters are always present, the counters of the
+        # hardware output only if there is one.
+        rv = { 'frames': 0, 'unchanged': 0, 'overruns': 0 }
+        if compositor is not None:
+            rv.update(compositor.stats())
+        if output is not None:
+            rv.update(output.stats())
+        return rv
+
 
 LEDDBusAPI.__doc__ = f'''
 <node>
@@ -154,9 +421,14 @@ LEDDBusAPI.__doc__ = f'''
             <arg type='d' name='opacity' direction='in'/>
             <arg type='i' name='id' direction='out'/>
         </method>
+        <method name='animate'>
+            <arg type='a{{sv}}' name='spec' direction='in'/>
+            <arg type='i' name='id' direction='out'/>
+        </method>
         <method name='remove_layer'>
             <arg type='i' name='id' direction='in'/>
         </method>
+        <property name='stats' type='a{{st}}' access='read'/>
     </interface>
 </node>
 '''
@@ -171,7 +443,7 @@ def sync_moving_layer(props):
     else:
         if moving:
             if moving_layer is None:
-                moving_layer = add_layer(blink(RGB(255, 0, 0), 0.1))
+                moving_layer = add_layer(Blink(RGB(255, 0, 0), 0.1))
         else:
             if moving_layer is not None:
                 remove_layer(moving_layer)
@@ -189,9 +461,9 @@ def sync_actuator_layer(props):
         if old_active is None or old_active ^ active:
             old_active = active
             if active:
-                update_layer(breathe(RGB(0, 64, 0), period=3, gamma=0.14), actuator_layer)
+                update_layer(Breathe(RGB(0, 64, 0), period=3, gamma=0.14), actuator_layer)
             else:
-                update_layer(breathe(RGB(103, 46, 0), period=6, gamma=0.08), actuator_layer)
+                update_layer(Breathe(RGB(103, 46, 0), period=6, gamma=0.08), actuator_layer)
 
 
 def on_roboarm_props_change(name, props, opts):
@@ -221,7 +493,7 @@ def on_stt_props_change(name, props, opts):
     else:
         if voice_activity:
             if stt_vad_layer is None:
-                stt_vad_layer = add_layer(blink(RGB(0, 0, 127), 0.1))
+                stt_vad_layer = add_layer(Blink(RGB(0, 0, 127), 0.1))
         else:
             if stt_vad_layer is not None:
                 remove_layer(stt_vad_layer)
@@ -229,42 +501,69 @@ def on_stt_props_change(name, props, opts):
 
 
 @click.command()
+@click.option('--rate', '-r', envvar='LED_RATE', default=DEFAULT_RATE, help='Maximum frame rate in Hz', show_default=True)
+@click.option('--gamma', '-g', envvar='LED_GAMMA', default=DEFAULT_GAMMA, help='Gamma of the LED output', show_default=True)
+@click.option('--output', '-o', 'output_', envvar='LED_OUTPUT', type=click.Choice(['tlc59711', 'none']), default='tlc59711', help='LED output backend', show_default=True)
+@click.option('--lights', '-l', envvar='LED_LIGHTS', type=click.Path(exists=True, file_okay=False), default=steve.timeline.LIGHTS_DIR, help='Directory with light show timeline files')
+@click.option('--budget', '-b', envvar='LED_BUDGET', type=float, default=None, help='Log frames that take longer than this many milliseconds to compose')
 @click.option('--verbose', '-v', envvar='VERBOSE', count=True, help='Increase logging verbosity')
-def main(verbose):
-    global actuator_layer, updater
+def main(rate, gamma, output_, lights, budget, verbose):
+    global actuator_layer, asyncio_loop, compositor, output, lights_dir
 
     init_logging(verbose)
+    lights_dir = lights
+
+    asyncio_loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(asyncio_loop)
+
+    if output_ == 'tlc59711':
+        import board                # adafruit-blinka
+        import busio                # adafruit-blinka
+        import adafruit_tlc59711
+
+        spi = busio.SPI(clock=board.SCK, MOSI=board.MOSI)
+        tlc = adafruit_tlc59711.TLC59711(spi, pixel_count=PIXEL_COUNT)
+        output = TLC59711Output(tlc, PIXEL_COUNT)
+        output.start()
+        callback = output
+    else:
+        callback = update_ipywidget_leds
+
+    compositor = Compositor(callback, rate=rate, output=OutputStage(gamma=gamma),
+        budget=budget / 1000 if budget is not None else None)
+    updater = asyncio_loop.create_task(compositor.run())
+    actuator_layer = add_layer(Breathe(RGB(103, 46, 0), period=6, gamma=0.08))
 
-    updater = asyncio_loop.create_task(led_updater(update_ipywidget_leds))
-    actuator_layer = add_layer(breathe(RGB(103, 46, 0), period=6, gamma=0.08))
+    try:
+        start_animation({ 'type': 'timeline', 'name': 'boot', 'priority': 1 })
+    except Exception as e:
+        log.warning(f'Could not play the boot light show: {e}')
 
-##    bus = SystemBus()
+    bus = SystemBus()
 
-##    roboarm = bus.get(f'{dbus_prefix}.RoboArm')
-##    roboarm['org.freedesktop.DBus.Properties'].onPropertiesChanged = on_roboarm_props_change
+    roboarm = bus.get(f'{dbus_prefix}.RoboArm')
+    roboarm['org.freedesktop.DBus.Properties'].onPropertiesChanged = on_roboarm_props_change
 
-##    stt = bus.get(f'{dbus_prefix}.SpeechToText')
-##    stt['org.freedesktop.DBus.Properties'].onPropertiesChanged = on_stt_props_change
+    stt = bus.get(f'{dbus_prefix}.SpeechToText')
+    stt['org.freedesktop.DBus.Properties'].onPropertiesChanged = on_stt_props_change
 
-##    sync_moving_layer({ 'moving': roboarm.moving })
-##    sync_actuator_layer({ 'active': roboarm.active })
+    sync_moving_layer({ 'moving': roboarm.moving })
+    sync_actuator_layer({ 'active': roboarm.active })
 
-##    api = LEDDBusAPI(BUS_NAME)
-##    try:
-##        api.start()
-##        try:
-##            asyncio_loop.run_forever()
-##        finally:
-##            updater.cancel()
-##            asyncio_loop.stop()
-##    finally:
-##        api.quit()
-##        off()
+    api = LEDDBusAPI(BUS_NAME)
+    try:
+        api.start()
+        try:
+            asyncio_loop.run_forever()
+        finally:
+            updater.cancel()
+            asyncio_loop.stop()
+    finally:
+        api.quit()
+        off()
+        if output is not None:
+            output.stop()
 
 
 if __name__ == '__main__':
-    asyncio_loop = asyncio.get_running_loop()
-##    asyncio_loop = asyncio.new_event_loop()
-##    spi = busio.SPI(clock=board.SCK, MOSI=board.MOSI)
-##    tlc = adafruit_tlc59711.TLC59711(spi, pixel_count=16)
     main()
@@ -0,0 +1,163 @@
+import logging
+import threading
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+# The TLC59711 drives each LED channel with 16-bit PWM
+MAX_VALUE = 0xFFFF
+
+# Perceived brightness is not linear in PWM duty cycle. Composited values are
+# treated as perceptual brightness and raised to this power on output.
+DEFAULT_GAMMA = 2.2
+
+# The number of entries in the output lookup tables. Composited values are
+# quantized to this many levels before the lookup.
+DEFAULT_TABLE_SIZE = 4096
+
+# The length of the temporal dithering cycle in frames. Must be a power of 2.
+DEFAULT_DITHER_FRAMES = 8
+
+
+def _thresholds(frames: int) -> np.ndarray:
+    '''Return the dithering thresholds for each frame of the cycle
+
+    The thresholds are ordered by bit-reversed frame number, so that
+    consecutive frames alternate between low and high thresholds and the
+    flicker has the highest possible frequency.
+    '''
+    bits = frames.bit_length() - 1
+    if frames != 1 << bits:
+        raise ValueError('The number of dithering frames must be a power of 2')
+
+    order = [int(f'{i:0{bits}b}'[::-1], 2) if bits else 0 for i in range(frames)]
+    return (np.array(order, dtype=np.float64) + 0.5) / frames
+
+
+class OutputStage:
+    '''Convert composited frames to 16-bit PWM values
+
+    Frames are float arrays with values in the range <0, 1>. The gamma curve
+    is evaluated once for the whole input range when the object is created,
+    so the conversion of a frame is a single vectorized table lookup.
+
+    Gamma correction maps many low input levels to fractions of the lowest PWM
+    step, which shows up as visible steps in slow fades. To hide them, frames
+    can be temporally dithered: a precomputed table for each frame of the
+    dithering cycle rounds the fractional part up or down so that the average
+    output over the cycle matches the exact value. Dithering only helps while
+    the frames are being refreshed at the frame rate, i.e., while animations
+    are running. Static frames are converted with plain rounding.
+    '''
+    def __init__(self, gamma=DEFAULT_GAMMA, size=DEFAULT_TABLE_SIZE, frames=DEFAULT_DITHER_FRAMES):
+        self.gamma = gamma
+        self.size = size
+        self.phase = 0
+
+        v = np.linspace(0, 1, size) ** gamma * MAX_VALUE
+        self.plain = np.rint(v).astype(np.uint16)
+
+        t = _thresholds(frames)
+        self.dither = np.minimum(np.floor(v[None, :] + t[:, None]), MAX_VALUE).astype(np.uint16)
+
+    def __call__(self, frame: np.ndarray, dither: bool = False) -> np.ndarray:
+        i = np.rint(np.clip(frame, 0, 1) * (self.size - 1)).astype(np.intp)
+        if not dither:
+            return self.plain[i]
+
+        table = self.dither[self.phase]
+        self.phase = (self.phase + 1) % len(self.dither)
+        return table[i]
+
+
+class TLC59711Output:
+    '''Send 16-bit frames to a chain of TLC59711 LED drivers
+
+    Frames are handed over by calling the object, typically from the
+    compositor. The SPI transfer is performed by a dedicated thread, so that
+    the caller never waits for the bus. The frames are double buffered: the
+    caller writes into the back buffer while the thread sends the front
+    buffer. If the caller delivers several frames while the thread is busy,
+    only the latest one is sent. Frames identical to the last frame sent are
+    not transferred at all.
+
+    The attributes composed, sent, and skipped count the frames received from
+    the caller, the frames transferred over SPI, and the frames dropped,
+    either because they did not change or because a newer frame replaced
+    them before they could be sent.
+    '''
+    def __init__(self, tlc, pixels: int):
+        self.tlc = tlc
+        self.pixels = pixels
+        self.buffer = [np.zeros((pixels, 3), dtype=np.uint16) for _ in range(2)]
+        self.back = 0
+        self.last = None
+        self.pending = False
+        self.stopping = False
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run, name='tlc59711', daemon=True)
+
+        self.composed = 0
+        self.sent = 0
+        self.skipped = 0
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        with self.cond:
+            self.stopping = True
+            self.cond.notify()
+        if self.thread.is_alive():
+            self.thread.join()
+
+    def stats(self) -> dict:
+        return {
+            'composed': self.composed,
+            'sent'    : self.sent,
+            'skipped' : self.skipped
+        }
+
+    def __call__(self, frame: np.ndarray):
+        with self.cond:
+            self.composed += 1
+            if self.pending:
+                self.skipped += 1
+            np.copyto(self.buffer[self.back], frame, casting='unsafe')
+            self.pending = True
+            self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self.stopping:
+                    self.cond.wait()
+
+                if self.stopping:
+                    return
+
+                front = self.back
+                self.back ^= 1
+                self.pending = False
+
+            frame = self.buffer[front]
+            if self.last is not None and np.array_equal(frame, self.last):
+                with self.cond:
+                    self.skipped += 1
+                continue
+
+            try:
+                self._send(frame)
+            except Exception as e:
+                log.error(f'Error while updating LEDs: {e}')
+                continue
+
+            self.last = frame.copy()
+            with self.cond:
+                self.sent += 1
+
+    def _send(self, frame: np.ndarray):
+        for i, pixel in enumerate(frame.tolist()):
+            self.tlc[i] = tuple(pixel)
+        self.tlc.show()
@@ -1,4 +1,33 @@
+import os
+
 from steve import *
+import steve.stats
+from steve.config import dbus_prefix
+from steve.dbus import DBusAPI
+from steve.utils import init_logging
+
+BUS_NAME = f'{dbus_prefix}.Assistant'
+
+
+class AssistantDBusAPI(DBusAPI):
+    # The wake word detector, speech recognition, text-to-speech, the mixer,
+    # and echo cancellation all run in this process, so their statistics are
+    # published here rather than by the STT service.
+    @property
+    def audio_stats(self):
+        return steve.stats.collect()
+
+
+AssistantDBusAPI.__doc__ = f'''
+<node>
+    <interface name='{BUS_NAME}'>
+        <property name='audio_stats' type='a{{sd}}' access='read'/>
+    </interface>
+</node>
+'''
+
+
+init_logging(int(os.environ.get('VERBOSE', 0)))
 
 chirp = AudioClip('sounds/chirp.wav')
 wake = WakeWord()
@@ -6,32 +35,42 @@ stt = SpeechToText()
 tts = TextToSpeech()
 gpt = ChatGPT()
 
+# Log a summary of the audio statistics every STATS_INTERVAL seconds (0
+# disables the log)
+stats_interval = float(os.environ.get('STATS_INTERVAL', steve.stats.DEFAULT_LOG_INTERVAL))
+if stats_interval > 0:
+    steve.stats.start_logging(stats_interval)
+
+api = AssistantDBusAPI(BUS_NAME)
+api.start()
 
-while True:
-    print('Waiting for "Hey Steve"...', end='', flush=True)
-    wake.detect()
-    print('done.')
-    chirp.play()
-
-    for text in stt.recognize():
-        print(f'##{text}##')
-        if isinstance(text, str):
-            if text.startswith('wake up'):
-                stt.stop()
-                for word in gpt.respond('Good morning!'):
-                    tts.say(word)
-            elif text.startswith('sleep'):
-                stt.stop()
-                for word in gpt.respond('Good night!'):
-                    tts.say(word)
-            elif text.startswith('high five'):
-                stt.stop()
-                for word in gpt.respond('High five!'):
-                    tts.say(word)
-            elif text.startswith('reset'):
-                stt.stop()
-                for word in gpt.respond('Resetting!'):
-                    tts.say(word)
-            elif text.startswith('move'):
-                print(gpt.program(text))
+try:
+    while True:
+        print('Waiting for "Hey Steve"...', end='', flush=True)
+        wake.detect()
+        print('done.')
+        chirp.play()
 
+        for text in stt.recognize(start=wake.position):
+            print(f'##{text}##')
+            if isinstance(text, str):
+                if text.startswith('wake up'):
+                    stt.stop()
+                    for word in gpt.respond('Good morning!'):
+                        tts.say(word)
+                elif text.startswith('sleep'):
+                    stt.stop()
+                    for word in gpt.respond('Good night!'):
+                        tts.say(word)
+                elif text.startswith('high five'):
+                    stt.stop()
+                    for word in gpt.respond('High five!'):
+                        tts.say(word)
+                elif text.startswith('reset'):
+                    stt.stop()
+                    for word in gpt.respond('Resetting!'):
+                        tts.say(word)
+                elif text.startswith('move'):
+                    print(gpt.program(text))
+finally:
+    api.quit()
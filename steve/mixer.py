@@ -0,0 +1,334 @@
+import abc
+import math
+import time
+import logging
+import threading
+from collections import deque
+
+import numpy as np
+import pyaudio
+
+import steve.stats
+from steve.backend  import get_backend
+from steve.resample import Resampler, to_float
+
+log = logging.getLogger(__name__)
+
+# The number of frames the mixer renders per iteration. The output stream is
+# opened with the same buffer size, so a new source starts playing within one
+# period (about 5 ms at 48 kHz).
+DEFAULT_PERIOD = 256
+
+# The number of output channels. All sources are mixed in mono and PortAudio
+# (ALSA plug) takes care of channel duplication if the device needs it.
+DEFAULT_CHANNELS = 1
+
+# The maximum amount of audio (in seconds) a StreamSource buffers before
+# write() blocks
+DEFAULT_STREAM_BUFFER = 2
+
+
+class Source(abc.ABC):
+    '''Base class for audio sources played by the mixer
+
+    The mixer calls read() from its thread once per period to obtain up to n
+    float32 samples at the mixer's rate. Returning fewer than n samples means
+    the source has finished.
+    '''
+    @abc.abstractmethod
+    def read(self, n: int) -> np.ndarray:
+        pass
+
+
+class ClipSource(Source):
+    '''Play a buffer of samples that are already at the mixer's rate'''
+    def __init__(self, samples: np.ndarray):
+        self.samples = samples
+        self.pos = 0
+
+    def read(self, n):
+        rv = self.samples[self.pos:self.pos + n]
+        self.pos += len(rv)
+        return rv
+
+
+class ToneSource(Source):
+    '''A sine wave with the given frequency (Hz) and duration (seconds)'''
+    def __init__(self, frequency: float, duration: float, rate: int, volume: float = 0.5):
+        self.step = 2 * math.pi * frequency / rate
+        self.remaining = round(duration * rate)
+        self.volume = volume
+        self.pos = 0
+
+    def read(self, n):
+        n = min(n, self.remaining)
+        rv = self.volume * np.sin(self.step * np.arange(self.pos, self.pos + n), dtype=np.float32)
+        self.pos += n
+        self.remaining -= n
+        return rv
+
+
+class StreamSource(Source):
+    '''A source fed incrementally with PCM data, e.g., from a TTS service
+
+    The data passed to write() can have any rate, sample width, and number of
+    channels. It is converted to the mixer's format as it arrives. If the
+    source runs dry, the mixer plays silence until more data arrives or the
+    source is closed. write() blocks while more than max_duration seconds of
+    audio are waiting to be played.
+    '''
+    def __init__(self, mixer, rate: int, width: int = 2, channels: int = 1, max_duration: float = DEFAULT_STREAM_BUFFER):
+        self.width = width
+        self.channels = channels
+        self.resampler = Resampler(rate, mixer.rate)
+        self.max_samples = round(max_duration * mixer.rate)
+        self.chunks = deque()
+        self.size = 0
+        self.closed = False
+        self.cond = threading.Condition()
+
+        # The time write() spent waiting for the mixer to play buffered audio
+        self.stalls = steve.stats.Series()
+
+        # The number of times the source ran dry in the middle of a period
+        self.underruns = 0
+
+    def write(self, data: bytes):
+        x = self.resampler(to_float(data, self.width, self.channels))
+        with self.cond:
+            if self.size > self.max_samples and not self.closed:
+                start = time.monotonic()
+                while self.size > self.max_samples and not self.closed:
+                    self.cond.wait()
+                self.stalls.add(time.monotonic() - start)
+            self.chunks.append(x)
+            self.size += len(x)
+
+    def stats(self) -> dict:
+        return {
+            'underruns': self.underruns,
+            **self.stalls.stats('write_stall_ms', 1000)
+        }
+
+    def close(self):
+        x = self.resampler.flush()
+        with self.cond:
+            if len(x):
+                self.chunks.append(x)
+                self.size += len(x)
+            self.closed = True
+            self.cond.notify_all()
+
+    def read(self, n):
+        with self.cond:
+            parts = []
+            need = n
+            while need and self.chunks:
+                chunk = self.chunks[0]
+                if len(chunk) <= need:
+                    parts.append(self.chunks.popleft())
+                    need -= len(chunk)
+                else:
+                    parts.append(chunk[:need])
+                    self.chunks[0] = chunk[need:]
+                    need = 0
+
+            self.size -= n - need
+            self.cond.notify_all()
+
+            if need and not self.closed:
+                parts.append(np.zeros(need, dtype=np.float32))
+                if need < n:
+                    self.underruns += 1
+
+        if not parts:
+            return np.zeros(0, dtype=np.float32)
+        return np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+
+class Playback:
+    '''A handle for a source being played by the mixer'''
+    def __init__(self, source: Source, volume: float = 1.0):
+        self.source = source
+        self.volume = volume
+        self.cancelled = False
+        self._done = threading.Event()
+
+    def cancel(self):
+        '''Stop playing the source at the next mixer period'''
+        self.cancelled = True
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None) -> bool:
+        '''Wait until the source finishes playing or is cancelled'''
+        return self._done.wait(timeout)
+
+
+class Mixer(threading.Thread):
+    '''An always-open audio output that mixes any number of sources
+
+    The output stream is opened once, at the default output device's native
+    rate unless a rate is given, and stays open. Every period, the mixer
+    thread reads the next block from each source, sums them, and writes the
+    result to the stream. When there is nothing to play, the mixer writes
+    silence, so that new sources start without the latency of opening the
+    device.
+    '''
+    def __init__(self, rate: int | None = None, period: int = DEFAULT_PERIOD, channels: int = DEFAULT_CHANNELS):
+        super().__init__(name='mixer', daemon=True)
+        backend = get_backend()
+        if rate is None:
+            rate = int(backend.get_default_output_device_info()['defaultSampleRate'])
+
+        self.rate = rate
+        self.period = period
+        self.channels = channels
+        self.playing = []
+        self.lock = threading.Lock()
+        self.stopping = False
+        self.closed = False
+        self.underruns = 0
+        self.monitors = []
+        steve.stats.register('mixer', self.stats)
+
+        log.debug(f'Opening audio output at {rate} Hz with {period} frame periods')
+        self.stream = backend.open(format=pyaudio.paInt16, channels=channels, rate=rate, output=True,
+            frames_per_buffer=period)
+
+    def play(self, source: Source, volume: float = 1.0) -> Playback:
+        '''Start playing the source and return a handle for it
+
+        If the mixer has stopped, the playback is done immediately.
+        '''
+        playback = Playback(source, volume)
+        with self.lock:
+            if self.closed:
+                playback._done.set()
+            else:
+                self.playing.append(playback)
+        return playback
+
+    def monitor(self, fn):
+        '''Call fn with each mixed period, e.g., to use it as an echo reference
+
+        The function is called from the mixer's thread with a float32 array
+        that is reused for the next period, so it must copy the data it needs
+        to keep.
+        '''
+        self.monitors.append(fn)
+
+    def stop(self):
+        self.stopping = True
+        if self.is_alive():
+            self.join()
+
+    def stats(self) -> dict:
+        with self.lock:
+            playing = len(self.playing)
+        return {
+            'playing'  : playing,
+            'underruns': self.underruns
+        }
+
+    def _mix(self, buf: np.ndarray):
+        buf[:] = 0
+
+        with self.lock:
+            playing = list(self.playing)
+
+        finished = []
+        for playback in playing:
+            if playback.cancelled:
+                finished.append(playback)
+                continue
+
+            try:
+                x = playback.source.read(self.period)
+            except Exception as e:
+                log.error(f'Error while reading audio source: {e}')
+                finished.append(playback)
+                continue
+
+            buf[:len(x)] += x if playback.volume == 1 else x * playback.volume
+            if len(x) < self.period:
+                finished.append(playback)
+
+        if finished:
+            with self.lock:
+                self.playing = [p for p in self.playing if p not in finished]
+            for playback in finished:
+                playback._done.set()
+
+    def run(self):
+        buf = np.zeros(self.period, dtype=np.float32)
+        try:
+            while not self.stopping:
+                self._mix(buf)
+                np.clip(buf, -1, 1, out=buf)
+                for fn in self.monitors:
+                    fn(buf)
+
+                out = (buf * 32767).astype('<i2')
+                if self.channels > 1:
+                    out = np.repeat(out, self.channels)
+                try:
+                    self.stream.write(out.tobytes(), exception_on_underflow=True)
+                except OSError as e:
+                    # The device ran out of data before this period arrived
+                    if e.errno != pyaudio.paOutputUnderflowed:
+                        raise
+                    self.underruns += 1
+        except Exception as e:
+            log.error(f'Error in audio mixer: {e}')
+        finally:
+            # Release everybody waiting for a playback to finish, nothing
+            # will be played anymore
+            with self.lock:
+                self.closed = True
+                playing, self.playing = self.playing, []
+            for playback in playing:
+                playback._done.set()
+
+            try:
+                self.stream.stop_stream()
+                self.stream.close()
+            except Exception as e:
+                log.error(f'Error while closing audio output: {e}')
+
+
+# The process-wide mixer, created on first use
+_mixer = None
+_mixer_lock = threading.Lock()
+
+# Functions waiting for the process-wide mixer to be created, see when_created
+_on_create = []
+
+
+def get_mixer() -> Mixer:
+    '''Return the process-wide mixer, opening the output device if needed'''
+    global _mixer
+    with _mixer_lock:
+        if _mixer is None:
+            _mixer = Mixer()
+            for fn in _on_create:
+                fn(_mixer)
+            _on_create.clear()
+            _mixer.start()
+        return _mixer
+
+
+def when_created(fn):
+    '''Call fn with the process-wide mixer once it exists
+
+    Unlike get_mixer, this does not open the output device. If the process
+    never plays any audio, fn is never called.
+    '''
+    with _mixer_lock:
+        if _mixer is None:
+            _on_create.append(fn)
+            return
+        mixer = _mixer
+    fn(mixer)
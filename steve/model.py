@@ -0,0 +1,353 @@
+import os
+import json
+import math
+import hashlib
+import logging
+import tomllib
+from collections import namedtuple
+
+import numpy as np
+
+import steve.ease
+from steve.utils import cache_dir
+
+log = logging.getLogger(__name__)
+
+# The model file used when no other model file is given. The file is shipped
+# as package data so that it is available in installed packages, too.
+DEFAULT_MODEL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'roboarm.toml')
+
+# Version of the compiled model format. Bump this whenever the output of
+# compile() changes so that stale cache files are not used.
+VERSION = 1
+
+# The default speed used to move between poses. Radians per second for angular
+# actuators and meters per second for linear actuators.
+DEFAULT_SPEED = 1.0
+
+# The default rate (in Hz) at which planned trajectories are sampled
+DEFAULT_RATE = 50
+
+
+# A planned movement of a single actuator. The attribute start is the state at
+# the beginning of the movement, stop is the final state, rate is the sampling
+# rate in Hz, and fractions is a tuple of servo fractions (0-1), one per tick.
+Trajectory = namedtuple('Trajectory', 'start stop rate fractions')
+
+
+def _is_pair(v):
+    return isinstance(v, (list, tuple)) and len(v) == 2 and all(isinstance(x, (int, float)) for x in v)
+
+
+def validate(model: dict):
+    '''Check that the model has the correct format
+
+    Raises an exception describing the first problem found.
+    '''
+    try:
+        actuators = model['actuators']
+    except KeyError as e:
+        raise Exception('Missing actuators in model') from e
+
+    for name, actuator in actuators.items():
+        try:
+            type_ = actuator['type']
+            if type_ != 'linear' and type_ != 'angular':
+                raise Exception(f'Unsupported type {type_} for actuator {name}')
+        except KeyError as e:
+            raise Exception(f'Missing type for actuator {name}') from e
+
+        if not isinstance(actuator.get('servo', None), int):
+            raise Exception(f'Invalid servo number in actuator {name}')
+
+        if not _is_pair(actuator.get('pulse', None)):
+            raise Exception(f'Invalid servo pulse widths in actuator {name}')
+
+        if 'range' in actuator and not _is_pair(actuator['range']):
+            raise Exception(f'Invalid range in actuator {name}')
+
+        if 'map' in actuator:
+            if type(actuator['map']) is not dict:
+                raise Exception(f'Invalid map in actuator {name}')
+            try:
+                for k, v in actuator['map'].items():
+                    float(k), float(v)
+            except ValueError as e:
+                raise Exception(f'Invalid map in actuator {name}') from e
+
+    poses = model.get('poses', {})
+    for name, pose in poses.items():
+        for actuator, state in pose.items():
+            if actuator not in actuators:
+                raise Exception(f'Unknown actuator {actuator} in pose {name}')
+            if not isinstance(state, (int, float)):
+                raise Exception(f'Invalid state of actuator {actuator} in pose {name}')
+
+    for transition in model.get('transitions', []):
+        if len(transition) != 2 or any(p not in poses for p in transition):
+            raise Exception(f'Invalid transition {transition}')
+
+
+def compile(model: dict) -> dict:
+    '''Validate the model and build the lookup tables needed at runtime
+
+    The returned dictionary is JSON serializable, so that it can be stored in
+    the cache. If the model includes a list of transitions, the trajectories
+    between the listed pose pairs are planned here as well.
+    '''
+    validate(model)
+
+    compiled = {
+        'version'    : VERSION,
+        'actuators'  : model['actuators'],
+        'dimensions' : model.get('dimensions', {}),
+        'poses'      : model.get('poses', {}),
+        'transitions': [list(t) for t in model.get('transitions', [])],
+        'set_map'    : {},
+        'get_map'    : {},
+        'plans'      : []
+    }
+
+    # If the actuator has a map attribute, convert it into a sorted list of
+    # pairs where the first element in each pair is the input coordinate and
+    # the second element is the target value in the 0-1 range. The set map is
+    # sorted by input coordinates, the get map by target values.
+    for name, actuator in compiled['actuators'].items():
+        if 'map' in actuator:
+            l = [(float(k), float(v)) for k, v in actuator['map'].items()]
+            compiled['set_map'][name] = sorted(l, key=lambda v: v[0])
+            compiled['get_map'][name] = sorted(l, key=lambda v: v[1])
+
+    for src, dst in compiled['transitions']:
+        p = plan(compiled, src, dst)
+        compiled['plans'].append([src, dst, DEFAULT_SPEED, DEFAULT_RATE, {
+            name: list(t) for name, t in p.items()
+        }])
+
+    return compiled
+
+
+def is_compiled(model: dict) -> bool:
+    return model.get('version', None) == VERSION and 'set_map' in model
+
+
+def state_range(model: dict, name: str) -> tuple[float, float]:
+    try:
+        m = model['set_map'][name]
+        return (m[0][0], m[-1][0])
+    except KeyError:
+        return (0.0, 1.0)
+
+
+def to_fraction(model: dict, name: str, state: float) -> float:
+    '''Convert actuator state to servo fraction in the range <0, 1>'''
+    actuator = model['actuators'][name]
+
+    v = state
+    mm = state_range(model, name)
+    if v == float('-inf'): v = mm[0]
+    if v == float('+inf'): v = mm[1]
+
+    # If the actuator has a map element, map input coordinates to the
+    # 0.0-1.0 range using the map element.
+    try:
+        m = model['set_map'][name]
+    except KeyError:
+        if v < 0 or v > 1:
+            raise ValueError(f'State {v} for actuator {name} out of the range <0, 1>')
+    else:
+        if v < m[0][0] or v > m[-1][0]:
+            raise ValueError(f'State {v} for actuator {name} is out of the range <{m[0][0]}, {m[-1][0]}>')
+
+        for i in range(1, len(m)):
+            if v <= m[i][0]:
+                break
+
+        min = m[i - 1]
+        max = m[i]
+        v = (v - min[0]) / (max[0] - min[0])
+        v = min[1] + (max[1] - min[1]) * v
+
+    # If the actuator has a physical range limit, scale the range 0-1 to the
+    # more restricted range.
+    try:
+        r = actuator['range']
+    except KeyError:
+        pass
+    else:
+        v = r[0] + (r[1] - r[0]) * v
+
+    return v
+
+
+def to_fractions(model: dict, name: str, states: np.ndarray) -> np.ndarray:
+    '''Convert an array of actuator states to servo fractions
+
+    This is the vectorized form of to_fraction.
+    '''
+    actuator = model['actuators'][name]
+
+    mm = state_range(model, name)
+    v = np.where(states == float('-inf'), mm[0], states)
+    v = np.where(v == float('+inf'), mm[1], v)
+
+    if v.size and (v.min() < mm[0] or v.max() > mm[1]):
+        bad = v[(v < mm[0]) | (v > mm[1])][0]
+        raise ValueError(f'State {bad} for actuator {name} is out of the range <{mm[0]}, {mm[1]}>')
+
+    # Map input coordinates to the 0.0-1.0 range using the actuator's map
+    # element. The map is piece-wise linear, which is exactly what np.interp
+    # computes.
+    try:
+        m = model['set_map'][name]
+    except KeyError:
+        pass
+    else:
+        v = np.interp(v, [p[0] for p in m], [p[1] for p in m])
+
+    # If the actuator has a physical range limit, scale the range 0-1 to the
+    # more restricted range.
+    try:
+        r = actuator['range']
+    except KeyError:
+        pass
+    else:
+        v = r[0] + (r[1] - r[0]) * v
+
+    return v
+
+
+def duration(type_: str, from_: float, to: float, speed: float | None) -> float:
+    '''Calculate how long it takes to move an actuator from from_ to to
+
+    Speed is in radians per second for angular actuators and in meters per
+    second for linear actuators. None means maximum speed supported by the
+    servo, i.e., zero duration.
+    '''
+    if speed is None:
+        return 0
+    if type_ == 'linear':
+        return abs(to - from_) / speed
+    elif type_ == 'angular':
+        return abs(to - from_) / 180 * math.pi / speed
+    else:
+        raise Exception(f'Unsupported type {type_}')
+
+
+def trajectory(model: dict, name: str, from_: float, to: float, speed: float | None = None, rate: int = DEFAULT_RATE, ease=None) -> Trajectory:
+    '''Plan the movement of actuator name from state from_ to state to
+
+    The movement is sampled at the given rate and each sample is converted to
+    servo fraction, so that the planned trajectory can be played back without
+    any further computation.
+    '''
+    if speed is not None and speed < 0:
+        raise Exception('Speed must be >= 0')
+
+    n = max(1, math.ceil(duration(model['actuators'][name]['type'], from_, to, speed) * rate))
+
+    # Evaluate the easing function for the entire trajectory at once. The
+    # last sample is set to the target state explicitly so that rounding
+    # errors cannot push it out of the actuator's range.
+    x = np.linspace(0, 1, n + 1)
+    v = steve.ease.vectorize(ease)(x) if ease is not None else x
+    states = (to - from_) * v + from_
+    states[-1] = to
+
+    return Trajectory(from_, to, rate, tuple(to_fractions(model, name, states).tolist()))
+
+
+def resolve_pose(model: dict, name: str) -> dict:
+    '''Return the pose with infinite states replaced by actuator range limits'''
+    try:
+        pose = model['poses'][name]
+    except KeyError:
+        raise Exception(f'Unknown pose {name}')
+
+    rv = {}
+    for actuator, state in pose.items():
+        mm = state_range(model, actuator)
+        if state == float('-inf'): state = mm[0]
+        if state == float('+inf'): state = mm[1]
+        rv[actuator] = state
+    return rv
+
+
+def plan(model: dict, src: str, dst: str, speed=DEFAULT_SPEED, rate=DEFAULT_RATE, ease=None) -> dict:
+    '''Plan the transition from pose src to pose dst
+
+    The ease parameter is an easing specification accepted by
+    steve.ease.parse. Returns a dictionary that maps actuator names to
+    trajectories. Actuators not included in the source pose are omitted from
+    the plan.
+    '''
+    start = resolve_pose(model, src)
+    fn = steve.ease.parse(ease) if ease is not None else None
+
+    rv = {}
+    for actuator, to in resolve_pose(model, dst).items():
+        try:
+            from_ = start[actuator]
+        except KeyError:
+            continue
+        rv[actuator] = trajectory(model, actuator, from_, to, speed=speed, rate=rate, ease=fn)
+    return rv
+
+
+def parse(filename: str) -> dict:
+    '''Load a model from a TOML or YAML file
+
+    TOML does not allow numeric keys, so map keys may be strings holding
+    numbers. They are converted to floats by compile().
+    '''
+    _, ext = os.path.splitext(filename)
+    if ext == '.toml':
+        with open(filename, 'rb') as f:
+            return tomllib.load(f)
+    elif ext in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError as e:
+            raise Exception('PyYAML must be installed to load YAML model files') from e
+        with open(filename, 'r') as f:
+            return yaml.safe_load(f)
+    else:
+        raise Exception(f'Unsupported model file format {ext}')
+
+
+def load(filename: str = DEFAULT_MODEL, cache: bool = True) -> dict:
+    '''Load and compile a model file
+
+    Compiled models are cached in the user's cache directory under a key
+    derived from the content of the model file. If the file has not changed
+    since the last time it was compiled, the compiled model is loaded from the
+    cache, skipping validation and table building.
+    '''
+    with open(filename, 'rb') as f:
+        data = f.read()
+
+    digest = hashlib.sha256(data + f'\0{VERSION}'.encode()).hexdigest()
+    path = os.path.join(cache_dir(), f'model-{digest}.json')
+
+    if cache:
+        try:
+            with open(path, 'r') as f:
+                model = json.load(f)
+            log.debug(f'Loaded compiled model {filename} from {path}')
+            return model
+        except (OSError, ValueError):
+            pass
+
+    model = compile(parse(filename))
+    log.debug(f'Compiled model {filename}')
+
+    if cache:
+        try:
+            tmp = f'{path}.{os.getpid()}'
+            with open(tmp, 'w') as f:
+                json.dump(model, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            log.warning(f'Could not store compiled model in {path}: {e}')
+
+    return model
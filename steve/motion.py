@@ -0,0 +1,204 @@
+import time
+import struct
+import asyncio
+import logging
+from collections import namedtuple
+
+log = logging.getLogger(__name__)
+
+# The address of the LED0_ON_L register in the PCA9685. The four registers of
+# each channel (ON_L, ON_H, OFF_L, OFF_H) follow each other and the channels
+# are laid out one after another, so with auto-increment enabled, a range of
+# consecutive channels can be updated with a single I2C write.
+PCA9685_LED0_ON_L = 0x06
+
+# The default rate (in Hz) at which the scheduler updates the servos
+DEFAULT_RATE = 50
+
+
+# An active movement registered with the scheduler
+Motion = namedtuple('Motion', 'controller channel trajectory start future')
+
+
+class ServoController:
+    '''A PCA9685 PWM controller with batched channel updates
+
+    Channel updates are staged with stage() and written to the controller
+    with flush(). Updates of consecutive channels are merged into a single
+    I2C write, so one scheduler tick costs a single bus transaction per
+    controller instead of one per servo.
+
+    The controller remembers the last fraction commanded on each channel, so
+    the position of a servo can be looked up without reading the PWM
+    registers over I2C.
+
+    Batched writes rely on private attributes of the adafruit_servokit,
+    adafruit_pca9685, and adafruit_motor objects. If a library version does
+    not provide them, the controller falls back to setting each servo's
+    fraction through the public API.
+    '''
+    def __init__(self, kit):
+        self.kit = kit
+        self.servo = kit.servo
+        self.pending = {}
+        self.commanded = {}
+
+        try:
+            servo = kit.servo[0]
+            self.batched = all((
+                hasattr(kit._pca, 'i2c_device'),
+                hasattr(servo, '_min_duty'),
+                hasattr(servo, '_duty_range')))
+        except Exception:
+            self.batched = False
+
+        if not self.batched:
+            log.warning('Unsupported adafruit_servokit version, servo updates will not be batched')
+
+    def stage(self, channel: int, fraction: float | None):
+        self.pending[channel] = fraction
+        self.commanded[channel] = fraction
+
+    def set(self, channel: int, fraction: float | None):
+        '''Write the fraction to the servo immediately'''
+        self.servo[channel].fraction = fraction
+        self.commanded[channel] = fraction
+
+    def _registers(self, channel: int, fraction: float | None) -> bytes:
+        # Mirror the conversion done by adafruit_motor's Servo.fraction and
+        # adafruit_pca9685's PWMChannel.duty_cycle setters.
+        if fraction is None:
+            duty = 0
+        else:
+            servo = self.servo[channel]
+            duty = servo._min_duty + int(fraction * servo._duty_range)
+
+        if duty == 0xFFFF:
+            on, off = 0x1000, 0
+        elif duty < 0x0010:
+            on, off = 0, 0x1000
+        else:
+            on, off = 0, duty >> 4
+        return struct.pack('<HH', on, off)
+
+    def flush(self):
+        if not self.pending:
+            return
+
+        channels = sorted(self.pending.items())
+        self.pending.clear()
+
+        if not self.batched:
+            for channel, fraction in channels:
+                self.servo[channel].fraction = fraction
+            return
+
+        # Split the channels into runs of consecutive channel numbers
+        runs = [[channels[0]]]
+        for item in channels[1:]:
+            if item[0] == runs[-1][-1][0] + 1:
+                runs[-1].append(item)
+            else:
+                runs.append([item])
+
+        with self.kit._pca.i2c_device as i2c:
+            for run in runs:
+                buf = bytearray([PCA9685_LED0_ON_L + 4 * run[0][0]])
+                for channel, fraction in run:
+                    buf += self._registers(channel, fraction)
+                i2c.write(buf)
+
+
+class MotionScheduler:
+    '''A single scheduler driving all servos of all arms in the process
+
+    Each tick, the scheduler advances every active movement, stages the new
+    servo positions with their controllers, and flushes each controller once.
+    Movements of different arms are thus updated in lockstep. When there are
+    no active movements, the scheduler sleeps until a new movement is added.
+    '''
+    def __init__(self, rate=DEFAULT_RATE):
+        self.rate = rate
+        self.motion = {}
+        self._task = None
+        self._wakeup = asyncio.Event()
+
+    async def play(self, controller: ServoController, channel: int, trajectory):
+        '''Play a planned trajectory on the given servo
+
+        Returns after the last sample of the trajectory has been written to
+        the controller. Cancelling the coroutine stops the movement.
+        '''
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name='motion-scheduler')
+
+        future = asyncio.get_running_loop().create_future()
+        key = (controller, channel)
+
+        old = self.motion.get(key, None)
+        if old is not None:
+            old.future.cancel()
+
+        motion = Motion(controller, channel, trajectory, time.monotonic(), future)
+        self.motion[key] = motion
+        self._wakeup.set()
+
+        try:
+            return await future
+        finally:
+            if self.motion.get(key, None) is motion:
+                del self.motion[key]
+
+    async def _run(self):
+        while True:
+            if not self.motion:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            try:
+                self._tick(time.monotonic())
+            except Exception as e:
+                # Fail all active movements rather than leaving their
+                # futures pending forever, and keep the scheduler running
+                log.error(f'Error in motion scheduler: {e}')
+                for motion in list(self.motion.values()):
+                    self._finish(motion, exception=e)
+
+            await asyncio.sleep(1 / self.rate)
+
+    def _finish(self, motion, exception=None):
+        key = (motion.controller, motion.channel)
+        if self.motion.get(key, None) is motion:
+            del self.motion[key]
+
+        if not motion.future.done():
+            if exception is None:
+                motion.future.set_result(motion.trajectory.stop)
+            else:
+                motion.future.set_exception(exception)
+
+    def _tick(self, now):
+        controllers = {}
+        done = []
+
+        for motion in list(self.motion.values()):
+            fractions = motion.trajectory.fractions
+            i = round((now - motion.start) * motion.trajectory.rate)
+            if i >= len(fractions) - 1:
+                i = len(fractions) - 1
+                done.append(motion)
+
+            motion.controller.stage(motion.channel, fractions[i])
+            controllers.setdefault(motion.controller, []).append(motion)
+
+        # A failed write only fails the movements of the affected controller
+        for controller, motions in controllers.items():
+            try:
+                controller.flush()
+            except Exception as e:
+                log.error(f'Error while updating servos: {e}')
+                for motion in motions:
+                    self._finish(motion, exception=e)
+
+        for motion in done:
+            self._finish(motion)
@@ -0,0 +1,122 @@
+import logging
+
+import steve.ease
+from steve.model import Trajectory, DEFAULT_SPEED, DEFAULT_RATE, plan, resolve_pose, trajectory
+
+log = logging.getLogger(__name__)
+
+# A cached plan starts at the current position of the arm if the first servo
+# fraction of each trajectory is within this distance from the fraction last
+# commanded on the servo.
+TOLERANCE = 0.01
+
+
+class PoseLibrary:
+    '''A collection of named poses with a cache of planned transitions
+
+    A pose is a dictionary that maps actuator names to target states. A pose
+    does not need to include all actuators. Actuators missing from the pose
+    are left alone when the arm moves to the pose.
+
+    Planning a transition means converting the movement of each actuator into
+    a sequence of servo fractions, one per tick. Transitions between the pose
+    pairs listed in the model's transitions attribute are planned when the
+    model is compiled, so that those movements can start without any planning
+    at request time. Other transitions are planned on first use and cached for
+    later.
+
+    Cached plans are indexed by the target pose. The plan matching the arm's
+    current position is found by comparing the start of each trajectory with
+    the fraction last commanded on the servo, so no servo registers are read.
+    '''
+    def __init__(self, roboarm, model):
+        self.roboarm = roboarm
+        self.model = model
+        self.pose = model['poses']
+
+        # Maps (dst, speed, rate, ease) to a dictionary of plans keyed by the
+        # source pose
+        self._plan = {}
+
+        for src, dst, speed, rate, p in model['plans']:
+            self._plan.setdefault((dst, speed, rate, None), {})[src] = {
+                name: Trajectory(t[0], t[1], t[2], tuple(t[3])) for name, t in p.items()
+            }
+
+        count = sum(len(v) for v in self._plan.values())
+        if count:
+            log.debug(f'Loaded {count} precomputed pose transitions')
+
+    def __getitem__(self, name):
+        return self.pose[name]
+
+    def __contains__(self, name):
+        return name in self.pose
+
+    def names(self):
+        return list(self.pose.keys())
+
+    def plan(self, src: str, dst: str, speed=DEFAULT_SPEED, rate=DEFAULT_RATE, ease=None):
+        '''Plan the transition from pose src to pose dst
+
+        The ease parameter is an easing specification accepted by
+        steve.ease.parse, e.g., in_out_cubic or cubic-bezier(0.4,0,0.2,1). The
+        planned transition is cached and subsequent calls with the same
+        arguments return the cached value.
+        '''
+        plans = self._plan.setdefault((dst, speed, rate, ease), {})
+        try:
+            return plans[src]
+        except KeyError:
+            pass
+
+        rv = plans[src] = plan(self.model, src, dst, speed=speed, rate=rate, ease=ease)
+        return rv
+
+    def lookup(self, dst: str, speed=DEFAULT_SPEED, rate=DEFAULT_RATE, ease=None):
+        '''Find a cached plan from the arm's current position to pose dst
+
+        Returns a tuple with the name of the source pose and the plan, or
+        (None, None) if there is no cached plan that starts at the arm's
+        current position.
+        '''
+        commanded = self.roboarm.controller.commanded
+        actuators = self.model['actuators']
+
+        for src, p in self._plan.get((dst, speed, rate, ease), {}).items():
+            for actuator, t in p.items():
+                fraction = commanded.get(actuators[actuator]['servo'], None)
+                if fraction is None or abs(fraction - t.fractions[0]) > TOLERANCE:
+                    break
+            else:
+                return src, p
+
+        return None, None
+
+    def prepare(self, dst: str, speed=DEFAULT_SPEED, rate=DEFAULT_RATE, ease=None):
+        '''Prepare a plan to move the arm from its current position to pose dst
+
+        A cached plan is used if there is one. Actuators not covered by the
+        cached plan are planned now. The returned dictionary maps actuator
+        names to trajectories. Actuators that are turned off map to None and
+        need to be set to the target state directly.
+        '''
+        src, cached = self.lookup(dst, speed=speed, rate=rate, ease=ease)
+        if cached is not None:
+            log.debug(f'Using cached plan from pose {src} to pose {dst}')
+            rv = dict(cached)
+        else:
+            rv = {}
+
+        fn = steve.ease.parse(ease) if ease is not None else None
+        for actuator, to in resolve_pose(self.model, dst).items():
+            if actuator in rv:
+                continue
+
+            from_ = self.roboarm.get(actuator)
+            if from_ is None:
+                rv[actuator] = None
+            else:
+                rv[actuator] = trajectory(self.model, actuator, from_, to, speed=speed, rate=rate, ease=fn)
+
+        return rv
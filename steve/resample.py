@@ -0,0 +1,160 @@
+import math
+from functools import lru_cache
+
+import numpy as np
+
+# The number of input samples on each side of an output sample that contribute
+# to it (when upsampling). When downsampling, the filter is widened
+# proportionally to keep the same transition band relative to the output rate.
+DEFAULT_HALF_TAPS = 16
+
+# The cutoff frequency of the anti-aliasing filter relative to the lower of the
+# two Nyquist frequencies
+DEFAULT_ROLLOFF = 0.92
+
+# The shape parameter of the Kaiser window applied to the filter
+DEFAULT_BETA = 8.6
+
+# The maximum number of output samples computed in one vectorized operation,
+# limits the size of temporary arrays
+BLOCK_SIZE = 4096
+
+
+def to_float(data: bytes, width: int, channels: int) -> np.ndarray:
+    '''Convert interleaved PCM data into mono float32 samples in <-1, 1>'''
+    if width == 1:
+        x = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        x = np.frombuffer(data, dtype='<i2').astype(np.float32) / 32768
+    elif width == 3:
+        b = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        x = ((b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)) << 8 >> 8).astype(np.float32) / 8388608
+    elif width == 4:
+        x = np.frombuffer(data, dtype='<i4').astype(np.float32) / 2147483648
+    else:
+        raise Exception(f'Unsupported sample width {width}')
+
+    if channels > 1:
+        x = x.reshape(-1, channels).mean(axis=1)
+    return x
+
+
+def from_float(x: np.ndarray, width: int, channels: int) -> bytes:
+    '''Convert mono float32 samples in <-1, 1> into interleaved PCM data'''
+    x = np.clip(x, -1, 1)
+    if width == 1:
+        y = (x * 127 + 128).astype(np.uint8)
+    elif width == 2:
+        y = (x * 32767).astype('<i2')
+    elif width == 4:
+        y = (x.astype(np.float64) * 2147483647).astype('<i4')
+    else:
+        raise Exception(f'Unsupported sample width {width}')
+
+    if channels > 1:
+        y = np.repeat(y, channels)
+    return y.tobytes()
+
+
+@lru_cache
+def polyphase_filter(up: int, down: int, half_taps=DEFAULT_HALF_TAPS, rolloff=DEFAULT_ROLLOFF, beta=DEFAULT_BETA):
+    '''Design a windowed-sinc low-pass filter split into up phases
+
+    The filter works at the rate up times higher than the input rate. Returns
+    a tuple (filter, H), where H is the number of input samples on each side
+    of an output sample and filter is a read-only array with the shape (up,
+    2 * H + 1). Row p holds the coefficients applied to the input samples
+    around an output sample that falls p / up samples after an input sample.
+    Each row is normalized to unity gain at DC.
+    '''
+    width = half_taps * max(up, down)
+    H = math.ceil(width / up)
+    fc = 0.5 * rolloff / max(up, down)
+
+    j = np.arange(up)[:, None] + np.arange(-H, H + 1)[None, :] * up
+    h = np.sinc(2 * fc * j) * np.kaiser(2 * width + 1, beta)[np.clip(j + width, 0, 2 * width)]
+    h[np.abs(j) > width] = 0
+
+    # The rows are indexed by k = -H..H and applied to the input sample n - k,
+    # so reverse them to apply them to consecutive input samples.
+    h = h[:, ::-1] / h.sum(axis=1, keepdims=True)
+    h = h.astype(np.float32)
+    h.flags.writeable = False
+    return h, H
+
+
+class Resampler:
+    '''Streaming polyphase conversion from one sample rate to another
+
+    The ratio of the two rates is reduced to up / down. Every output sample is
+    computed as the dot product of 2 * H + 1 consecutive input samples with
+    the filter phase selected by the output sample's fractional position, all
+    output samples of a chunk at once. The input samples still needed by
+    future output samples and the position of the next output sample are
+    carried over between chunks, so a signal can be converted chunk by chunk
+    with exactly the same result as converting it at once. Each chunk is
+    delayed by H input samples until the filter has seen enough of the
+    following input. Call flush() at the end of the stream to obtain the
+    remaining output.
+    '''
+    def __init__(self, src_rate: int, dst_rate: int, half_taps: int = DEFAULT_HALF_TAPS):
+        g = math.gcd(src_rate, dst_rate)
+        self.up = dst_rate // g
+        self.down = src_rate // g
+        self.filter, self.H = polyphase_filter(self.up, self.down, half_taps)
+
+        # The input samples kept for the next chunk, starting with H samples
+        # of silence before the beginning of the signal
+        self.buf = np.zeros(self.H, dtype=np.float32)
+
+        # The position of the next output sample in units of 1 / up input
+        # samples relative to the first sample in buf
+        self.pos = self.H * self.up
+
+    def _convert(self, last: int) -> np.ndarray:
+        '''Compute all output samples that fall on or before buf[last]'''
+        up, down, H = self.up, self.down, self.H
+
+        # Output samples are only computed once all the input samples they
+        # depend on are in the buffer
+        last = min(last, len(self.buf) - 1 - H)
+        end = (last + 1) * up
+        n = max(0, (end - self.pos + down - 1) // down)
+
+        rv = np.empty(n, dtype=np.float32)
+        k = np.arange(-H, H + 1)
+        for i in range(0, n, BLOCK_SIZE):
+            t = self.pos + np.arange(i, min(i + BLOCK_SIZE, n)) * down
+            idx = (t // up)[:, None] + k
+            rv[i:i + len(t)] = np.einsum('mk,mk->m', self.filter[t % up], self.buf[idx])
+
+        self.pos += n * down
+
+        # Drop the input samples that no future output sample depends on
+        drop = self.pos // up - H
+        if drop > 0:
+            self.buf = self.buf[drop:]
+            self.pos -= drop * up
+        return rv
+
+    def __call__(self, x: np.ndarray) -> np.ndarray:
+        if self.up == self.down:
+            return x
+        self.buf = np.concatenate((self.buf, np.asarray(x, dtype=np.float32)))
+        return self._convert(len(self.buf) - 1)
+
+    def flush(self) -> np.ndarray:
+        '''Return the output samples still held back at the end of the stream'''
+        if self.up == self.down:
+            return np.zeros(0, dtype=np.float32)
+        last = len(self.buf) - 1
+        self.buf = np.concatenate((self.buf, np.zeros(self.H, dtype=np.float32)))
+        return self._convert(last)
+
+
+def resample(x: np.ndarray, src_rate: int, dst_rate: int) -> np.ndarray:
+    '''Convert a complete signal from one sample rate to another'''
+    if src_rate == dst_rate:
+        return x
+    r = Resampler(src_rate, dst_rate)
+    return np.concatenate((r(x), r.flush()))
@@ -1,18 +1,21 @@
 import logging
-import math
 import asyncio
 import logging
 from copy     import deepcopy
 from typing   import Union
-from datetime import datetime, timedelta
 
 import click
+import board                                # adafruit-blinka
 from pymitter          import EventEmitter
 from adafruit_servokit import ServoKit
 
 import steve.ease as ease
 from steve.config import dbus_prefix
 from steve.dbus   import DBusAPI
+from steve.motion import MotionScheduler, ServoController
+from steve.model  import DEFAULT_MODEL, DEFAULT_SPEED as POSE_SPEED, Trajectory, is_compiled, load, state_range, to_fraction, trajectory
+from steve.model  import compile as compile_model
+from steve.pose   import PoseLibrary
 from steve.utils  import init_logging
 
 log = logging.getLogger(__name__)
@@ -23,60 +26,27 @@ State = Union[float, None]
 
 
 class RoboArm(EventEmitter):
-    def __init__(self, kit, model):
+    def __init__(self, kit, model, scheduler=None):
         super().__init__(wildcard=True)
         self.servo = kit.servo
-        self.actuator = deepcopy(model['actuators'])
-        self.set_map = {}
-        self.get_map = {}
+        self.controller = ServoController(kit)
+        self.scheduler = scheduler if scheduler is not None else MotionScheduler()
+
+        # Models loaded with steve.model.load are already compiled. Anything
+        # else, e.g., a model given as a Python dictionary, is validated and
+        # compiled here.
+        self.model = model if is_compiled(model) else compile_model(deepcopy(model))
+        self.actuator = self.model['actuators']
+        self.set_map = self.model['set_map']
+        self.get_map = self.model['get_map']
         self.task = {}
 
-        # First check that all parameters within each actuator definition have
-        # the correct format.
-        for name, actuator in self.actuator.items():
-            try:
-                type_ = actuator['type']
-                if type_ != 'linear' and type_ != 'angular':
-                    raise Exception(f'Unsupported type {type_} for actuator {name}')
-            except KeyError as e:
-                raise Exception(f'Missing type for actuator {name}') from e
-
-            if len(actuator['pulse']) != 2 or (
-                not isinstance(actuator['pulse'][0], (int, float)) or
-                not isinstance(actuator['pulse'][1], (int, float))):
-                raise Exception(f'Invalid servo pulse widths in actuator {name}')
-
-            try:
-                if len(actuator['range']) != 2 or (
-                    not isinstance(actuator['range'][0], (int, float)) or
-                    not isinstance(actuator['range'][1], (int, float))):
-                    raise Exception(f'Invalid range in actuator {name}')
-            except KeyError:
-                pass
-
-            # If the actuator has a map attribute, convert it into a sorted list
-            # of tuples where the first element in each tuple is the input
-            # coordinate and the second element is the target value in the 0-1
-            # range. The tuples are sorted in an ascending order of their input
-            # coordinates.
-            try:
-                if type(actuator['map']) is not dict:
-                    raise Exception(f'Invalid map in actuator {name}')
-
-                l = list(map(lambda v: (float(v[0]), float(v[1])), actuator['map'].items()))
-                self.set_map[name] = sorted(l, key=lambda v: v[0])
-                self.get_map[name] = sorted(l, key=lambda v: v[1])
-            except KeyError:
-                pass
-            except ValueError as e:
-                raise Exception(f'Invalid map in actuator {name}') from e
-
-        # If everything appears correct, apply the settings to the servos
         self.power_off()
         for actuator in self.actuator.values():
             self.servo[actuator['servo']].set_pulse_width_range(
                 actuator['pulse'][0], actuator['pulse'][1])
 
+        self.pose = PoseLibrary(self, self.model)
         self.emit('moving', False)
 
     def stop(self):
@@ -88,7 +58,7 @@ class RoboArm(EventEmitter):
         '''Stop any movement tasks and turn off all actuators'''
         self.stop()
         for name, actuator in self.actuator.items():
-            self.servo[actuator['servo']].fraction = None
+            self.controller.set(actuator['servo'], None)
             self.emit('actuator.%s' % name, name, None)
 
     def get(self, name: str) -> State:
@@ -125,51 +95,16 @@ class RoboArm(EventEmitter):
         return state
 
     def _get_range(self, name: str) -> tuple[float, float]:
-        try:
-            m = self.set_map[name]
-            return (m[0][0], m[-1][0])
-        except KeyError:
-            return (0.0, 1.0)
+        return state_range(self.model, name)
+
+    def _fraction(self, name: str, state: float) -> float:
+        return to_fraction(self.model, name, state)
 
     def set(self, name: str, state: State, emit=True):
         actuator = self.actuator[name]
+        v = self._fraction(name, state) if state is not None else None
 
-        v = state
-        if v is not None:
-            mm = self._get_range(name)
-            if v == float('-inf'): v = mm[0]
-            if v == float('+inf'): v = mm[1]
-
-            # If the actuator has a map element, map input coordinates to the
-            # 0.0-1.0 range using the map element.
-            try:
-                m = self.set_map[name]
-            except KeyError:
-                if v < 0 or v > 1:
-                    raise ValueError(f'State {v} for actuator {name} out of the range <0, 1>')
-            else:
-                if v < m[0][0] or v > m[-1][0]:
-                    raise ValueError(f'State {v} for actuator {name} is out of the range <{m[0][0]}, {m[-1][0]}>')
-
-                for i in range(1, len(m)):
-                    if v <= m[i][0]:
-                        break
-
-                min = m[i - 1]
-                max = m[i]
-                v = (v - min[0]) / (max[0] - min[0])
-                v = min[1] + (max[1] - min[1]) * v
-
-            # If the actuator has a physical range limit, scale the range 0-1 to
-            # the more restricted range.
-            try:
-                r = actuator['range']
-            except KeyError:
-                pass
-            else:
-                v = r[0] + (r[1] - r[0]) * v
-
-        self.servo[actuator['servo']].fraction = v
+        self.controller.set(actuator['servo'], v)
         if emit:
             self.emit('actuator.%s' % name, name, state)
 
@@ -191,37 +126,25 @@ class RoboArm(EventEmitter):
         if to == float('-inf'): to = mm[0]
         if to == float('+inf'): to = mm[1]
 
-        if speed is not None:
-            type_ = self.actuator[name]['type']
-            if type_ == 'linear':
-                duration = abs(to - from_) / speed
-            elif type_ == 'angular':
-                duration = abs(to - from_) / 180 * math.pi / speed
-            else:
-                raise Exception(f'Unsupported type {type_} in actuator {name}')
+        # If speed is unset, move as quickly as the actuator allows, i.e.,
+        # degrade to a single set operation.
+        if speed is None:
+            self.set(name, to)
+            return to
 
-            if duration > moving_threshold:
-                self.emit('moving', True)
-        else:
-            # If speed is unset, move as quickly as the actuator allows. With
-            # duration of 0 the code below will simply degrade to a single set
-            # operation.
-            duration = 0
-
-        start = datetime.now()
-        stop = start + timedelta(seconds=duration)
-        while True:
-            now = datetime.now()
-            if now >= stop:
-                self.set(name, to)
-                return to
-
-            i = (now - start).total_seconds() / duration
-            if i > 1: i = 1
-
-            v = ease(i) if ease is not None else i
-            self.set(name, (to - from_) * v + from_, emit=False)
-            await asyncio.sleep(1 / rate)
+        trajectory = self.trajectory(name, from_, to, speed=speed, rate=rate, ease=ease)
+        return await self._play(name, trajectory, moving_threshold=moving_threshold)
+
+    def trajectory(self, name: str, from_: float, to: float, speed: Union[float, None] = None, rate: int = 50, ease=None) -> Trajectory:
+        return trajectory(self.model, name, from_, to, speed=speed, rate=rate, ease=ease)
+
+    async def _play(self, name: str, trajectory: Trajectory, moving_threshold=0.2):
+        if len(trajectory.fractions) / trajectory.rate > moving_threshold:
+            self.emit('moving', True)
+
+        await self.scheduler.play(self.controller, self.actuator[name]['servo'], trajectory)
+        self.emit('actuator.%s' % name, name, trajectory.stop)
+        return trajectory.stop
 
     @property
     def moving(self):
@@ -238,39 +161,70 @@ class RoboArm(EventEmitter):
             task.cancel()
 
         if to is not None:
-            coro = self._move(name, to, speed=speed, rate=rate, ease=ease)
-            task = asyncio.create_task(coro, name=name)
-            self.task[name] = task
-
-            def cb(future):
-                if not self.moving:
-                    self.emit('moving', False)
-
-            task.add_done_callback(cb)
+            task = self._start(name, self._move(name, to, speed=speed, rate=rate, ease=ease))
             if block:
                 return await task
             else:
                 return task
 
+    def _start(self, name: str, coro):
+        task = self.task.get(name, None)
+        if task is not None:
+            task.cancel()
+
+        task = asyncio.create_task(coro, name=name)
+        self.task[name] = task
+
+        def cb(future):
+            if not self.moving:
+                self.emit('moving', False)
+
+        task.add_done_callback(cb)
+        return task
+
+    async def goto_pose(self, pose: str, speed: Union[float, None] = POSE_SPEED, rate: int = 50, ease: Union[str, None] = None, block=True):
+        '''Move the arm to the named pose
+
+        The ease parameter is an easing specification accepted by
+        steve.ease.parse. Transitions between poses listed in the model are
+        planned in advance, so the movement starts without any planning delay.
+        '''
+        plan = self.pose.prepare(pose, speed=speed, rate=rate, ease=ease)
+
+        tasks = []
+        for name, trajectory in plan.items():
+            if trajectory is None:
+                task = self.task.get(name, None)
+                if task is not None:
+                    task.cancel()
+                self.set(name, self.pose[pose][name])
+            else:
+                tasks.append(self._start(name, self._play(name, trajectory)))
+
+        if block:
+            await asyncio.gather(*tasks)
+
     async def wakeup(self):
-        self.shoulder = 30
-        self.elbow = 0
+        pose = self.pose['wakeup']
+        self.shoulder = pose['shoulder']
+        self.elbow = pose['elbow']
         await asyncio.sleep(0.3)
-        self.wrist_ud = -90
-        self.wrist_lr = 0
-        self.clamp = float('+inf')
-        self.torso = 0
+        self.wrist_ud = pose['wrist_ud']
+        self.wrist_lr = pose['wrist_lr']
+        self.clamp = pose['clamp']
+        self.torso = pose['torso']
 
     async def sleep(self):
-        await self.move('wrist_lr', 0, 2)
+        pose = self.pose['sleep']
+        await self.move('wrist_lr', pose['wrist_lr'], 2)
 
         await asyncio.gather(
-            self.move('clamp', float('-inf'), 2),
-            self.move('torso', 0, 2),
-            self.move('shoulder', 60, 1),
-            self.move('elbow', -39, 1))
+            self.move('clamp', pose['clamp'], 2),
+            self.move('torso', pose['torso'], 2),
+            self.move('shoulder', pose['shoulder'], 1),
+            self.move('elbow', pose['elbow'], 1))
 
-        await self.move('wrist_ud', -90, 2)
+        await self.move('wrist_ud', pose['wrist_ud'], 2)
 
     @property
     def clamp(self):
@@ -322,15 +276,23 @@ class RoboArm(EventEmitter):
 
 
 class RoboArmDBusAPI(DBusAPI):
-    def __init__(self, roboarm, asyncio_loop):
-        super().__init__(BUS_NAME)
+    '''D-Bus API for one or more robotic arms
+
+    The arm given to the constructor is published on the default object path
+    derived from the bus name. Additional arms can be published on their own
+    object paths via the objects parameter, a list of (path, RoboArmDBusAPI)
+    tuples. Only the first object's thread is started, the additional objects
+    share its bus connection and D-Bus main loop.
+    '''
+    def __init__(self, roboarm, asyncio_loop, objects=()):
+        super().__init__(BUS_NAME, objects)
         self.roboarm = roboarm
         self.asyncio_loop = asyncio_loop
 
         self._old_moving = None
         self._old_active = None
 
-    def run(self):
+    def attach(self):
         self.roboarm.on('moving', self.on_moving)
         self.on_moving(self.roboarm.moving)
 
@@ -338,11 +300,21 @@ class RoboArmDBusAPI(DBusAPI):
         for name in self.roboarm.actuator.keys():
             self.on_actuator(name, getattr(self.roboarm, name))
 
+    def detach(self):
+        self.roboarm.off('moving', self.on_moving)
+        self.roboarm.off('actuator.*', self.on_actuator)
+
+    def run(self):
+        self.attach()
+        for _, api in self.objects:
+            api.attach()
+
         super().run()
 
     def quit(self):
-        self.roboarm.off('moving', self.on_moving)
-        self.roboarm.off('actuator.*', self.on_actuator)
+        for _, api in self.objects:
+            api.detach()
+        self.detach()
         super().quit()
 
     def _invoke_coro(self, coro):
@@ -372,11 +344,23 @@ class RoboArmDBusAPI(DBusAPI):
         kw = {}
         if 'speed' in opts: kw['speed'] = opts['speed']
         if 'rate'  in opts: kw['rate']  = opts['rate']
-        if 'ease'  in opts: kw['ease']  = getattr(ease, opts['ease'])
+        if 'ease'  in opts: kw['ease']  = ease.parse(opts['ease'])
         if 'block' in opts: kw['block'] = opts['block']
 
         self._invoke_coro(self.roboarm.move(name, state, **kw))
 
+    def list_poses(self):
+        return self.roboarm.pose.names()
+
+    def goto_pose(self, name, opts):
+        kw = {}
+        if 'speed' in opts: kw['speed'] = opts['speed']
+        if 'rate'  in opts: kw['rate']  = opts['rate']
+        if 'ease'  in opts: kw['ease']  = opts['ease']
+        if 'block' in opts: kw['block'] = opts['block']
+
+        self._invoke_coro(self.roboarm.goto_pose(name, **kw))
+
     @property
     def moving(self): return self.roboarm.moving
 
@@ -466,6 +450,13 @@ RoboArmDBusAPI.__doc__ = f'''
             <arg type='s' name='state' direction='in'/>
             <arg type='a{{sv}}' name='opts' direction='in'/>
         </method>
+        <method name='list_poses'>
+            <arg type='as' name='names' direction='out'/>
+        </method>
+        <method name='goto_pose'>
+            <arg type='s' name='name' direction='in'/>
+            <arg type='a{{sv}}' name='opts' direction='in'/>
+        </method>
 
         <property name='active' type='b' access='read'>
             <annotation name='org.freedesktop.DBus.Property.EmitsChangedSignal' value='true'/>
@@ -497,88 +488,48 @@ RoboArmDBusAPI.__doc__ = f'''
 '''
 
 
-# How to calibrate the robot
-#
-# Map joint names to servo numbers depending on how the servos are wired to the
-# PWM controller.
-#
-# Find out the minimum and maximum pulse width for each servo. Each servo is
-# different and this step needs to be repeated individually for each servo. Find
-# the range by listening to the servo. It will make sound if you get too far.
-# This is best done before the servos are mounted onto the robot.
-#
-# Set the servos to 90 degrees, i.e., half of the range. Mount it on the chassis
-#
-# Map a custom servo angle range to the range 0 to 1 via a piece-wise linear
-# function.
-#
-# Pulse widths are in microseconds. Dimensions are in millimeters.
+def parse_arm(spec: str) -> tuple[str, int, str | None]:
+    '''Parse arm specification in the form NAME=ADDRESS[:MODEL]
+
+    The address is the I2C address of the arm's PCA9685 controller and can be
+    given in decimal or hexadecimal (0x) notation. The optional model is the
+    pathname of the arm's model file.
+    '''
+    try:
+        name, address = spec.split('=', 1)
+        address, _, model = address.partition(':')
+        return name.strip(), int(address, 0), model or None
+    except ValueError as e:
+        raise click.BadParameter(f'Invalid arm specification {spec}, expected NAME=ADDRESS[:MODEL]') from e
+
 
 @click.command()
 @click.option('--verbose', '-v', envvar='VERBOSE', count=True, help='Increase logging verbosity')
-def main(verbose):
+@click.option('--arm', '-a', 'arms', envvar='ARMS', multiple=True, default=['arm=0x40'], help='Arm name, PCA9685 I2C address, and optional model file (NAME=ADDRESS[:MODEL]), can be repeated', show_default=True)
+@click.option('--model', '-m', envvar='MODEL', type=click.Path(exists=True, dir_okay=False), default=DEFAULT_MODEL, help='Default model (calibration) file in TOML or YAML format')
+@click.option('--no-cache', is_flag=True, help='Do not use or update the compiled model cache')
+def main(verbose, arms, model, no_cache):
     init_logging(verbose)
 
-    roboarm = RoboArm(ServoKit(channels=16), {
-        'actuators': {
-            'torso': {
-                'type' : 'angular',
-                'servo': 0,
-                'pulse': [ 460, 2450 ],
-                'map'  : { -90: 0.01, 0: 0.47, 90: 0.97 }
-            },
-            'clamp': {
-                'type' : 'linear',
-                'servo': 1,               # Servo number on the 16-port PWM chip
-                'pulse': [ 590, 2590 ],   # Minimum and maximum usable pulse width for this servo
-                'range': [ 0.16, 0.78 ],  # The servo can only operate within this physical range (maps to <0, 1>)
-                'map'  : {                # The keys are the width of the open clamp in meters
-                    0     : 1.0,  0.01  : 0.65, 0.02  : 0.42, 0.021 : 0.40,
-                    0.022 : 0.38, 0.023 : 0.37, 0.024 : 0.35, 0.025 : 0.32,
-                    0.026 : 0.30, 0.027 : 0.25, 0.028 : 0.22, 0.029 : 0.15,
-                    0.03  : 0.0
-                }
-            },
-            'wrist_lr': {
-                'type' : 'angular',
-                'servo': 2,
-                'pulse': [ 580, 2580 ],
-                'map'  : { -90: 0.93, 90: 0.04 },
-            },
-            'wrist_ud': {
-                'type' : 'angular',
-                'servo': 3,
-                'pulse': [ 470, 2450 ],
-                'map'  : { -90: 0, 0: 0.42, 90: 0.92 }
-            },
-            'elbow': {
-                'type' : 'angular',
-                'servo': 4,
-                'pulse': [ 460, 2550 ],
-                'range': [ 0.29, 0.89 ],
-                'map'  : { -58.4: 1, 0: 0.51, 61.7: 0 }
-            },
-            'shoulder': {
-                'type' : 'angular',
-                'servo': 5,
-                'pulse': [ 460, 2580 ],
-                'range': [ 0.11, 0.96 ],
-                'map'  : { -90: 1, 0: 0.51, 90: 0 }
-            }
-        },
-        'dimensions': { # Dimensions of the robot's parts in millimeters
-            'torso_height'  : 122,
-            'arm_length'    : 100,
-            'forearm_length': 98,
-            'palm_length'   : 92,
-            'palm_height'   : 10,
-            'fingers_width' : 30
-        }
-    })
+    scheduler = MotionScheduler()
+    i2c = board.I2C()
+
+    roboarm = {}
+    for spec in arms:
+        name, address, filename = parse_arm(spec)
+        log.debug(f'Using PCA9685 at address {address:#04x} for arm {name}')
+        roboarm[name] = RoboArm(ServoKit(channels=16, i2c=i2c, address=address),
+            load(filename or model, cache=not no_cache), scheduler=scheduler)
 
     loop = asyncio.new_event_loop()
 
-    api = RoboArmDBusAPI(roboarm, loop)
+    # The first arm is published on the default object path for compatibility
+    # with single-arm clients. Every other arm gets its own object path under
+    # the default one.
+    names = list(roboarm.keys())
+    path = '/' + BUS_NAME.replace('.', '/')
+    api = RoboArmDBusAPI(roboarm[names[0]], loop, objects=[
+        (f'{path}/{name}', RoboArmDBusAPI(roboarm[name], loop)) for name in names[1:]])
     try:
         api.start()
         try:
@@ -588,7 +539,8 @@ def main(verbose):
             loop.stop()
     finally:
         api.quit()
-        roboarm.power_off()
+        for arm in roboarm.values():
+            arm.power_off()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,139 @@
+import time
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+# The default interval (in seconds) between statistics summaries in the log
+DEFAULT_LOG_INTERVAL = 60
+
+# The default length (in seconds) of the sliding window of Window statistics
+DEFAULT_WINDOW = 60
+
+
+class Series:
+    '''The count, mean, and maximum of a series of observed values
+
+    Each series is meant to be updated from a single thread. Readers may see
+    slightly inconsistent values, which is fine for statistics.
+    '''
+    __slots__ = ('count', 'total', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def reset(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def stats(self, name: str, scale: float = 1) -> dict:
+        '''Return the statistics as a dictionary with keys prefixed by name
+
+        Pass scale=1000 to report durations in seconds as milliseconds.
+        '''
+        return {
+            f'{name}_count': float(self.count),
+            f'{name}_mean' : self.mean * scale,
+            f'{name}_max'  : self.max * scale
+        }
+
+
+class Window:
+    '''The count, mean, and maximum of the values observed recently
+
+    Unlike Series, which summarizes all values since the start, a window only
+    covers the last period seconds, e.g., to see how a queue's depth changes
+    over time. The values are aggregated in one-second buckets, so the window
+    slides in one-second steps and adding a value allocates no memory.
+    '''
+    def __init__(self, period: int = DEFAULT_WINDOW):
+        self.period = period
+        self.bucket = [Series() for _ in range(period)]
+        self.second = [None] * period
+
+    def add(self, value: float, now: float | None = None):
+        second = int(time.monotonic() if now is None else now)
+        i = second % self.period
+        if self.second[i] != second:
+            self.bucket[i].reset()
+            self.second[i] = second
+        self.bucket[i].add(value)
+
+    def stats(self, name: str, scale: float = 1, now: float | None = None) -> dict:
+        '''Return the statistics of the window, see Series.stats'''
+        second = int(time.monotonic() if now is None else now)
+        rv = Series()
+        for start, bucket in zip(self.second, self.bucket):
+            if start is not None and second - self.period < start <= second:
+                rv.count += bucket.count
+                rv.total += bucket.total
+                rv.max = max(rv.max, bucket.max)
+        return rv.stats(name, scale)
+
+
+# The registered statistics providers. Each provider is a function that
+# returns a dictionary of values.
+_providers = {}
+_lock = threading.Lock()
+
+
+def register(name: str, provider):
+    '''Include the values returned by provider in collect() under name'''
+    with _lock:
+        _providers[name] = provider
+
+
+def unregister(name: str):
+    with _lock:
+        _providers.pop(name, None)
+
+
+def collect() -> dict:
+    '''Return the values of all providers as a flat dictionary of floats
+
+    Keys have the form <provider>.<value>.
+    '''
+    with _lock:
+        providers = list(_providers.items())
+
+    rv = {}
+    for name, provider in providers:
+        try:
+            values = provider()
+        except Exception as e:
+            log.debug(f'Error while collecting {name} statistics: {e}')
+            continue
+        for key, value in values.items():
+            rv[f'{name}.{key}'] = float(value)
+    return rv
+
+
+def summary(values: dict) -> str:
+    return ', '.join(f'{k}={v:.4g}' for k, v in sorted(values.items()))
+
+
+def start_logging(interval: float = DEFAULT_LOG_INTERVAL) -> threading.Thread:
+    '''Log a summary of all statistics every interval seconds'''
+    def run():
+        while True:
+            time.sleep(interval)
+            values = collect()
+            if values:
+                log.info(f'Statistics: {summary(values)}')
+
+    thread = threading.Thread(target=run, name='stats', daemon=True)
+    thread.start()
+    return thread
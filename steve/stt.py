@@ -12,6 +12,7 @@ from google.cloud.speech          import (
     StreamingRecognizeRequest,
     StreamingRecognizeResponse)
 
+import steve.stats
 from steve.audio  import BufferedAudioInput
 from steve.config import dbus_prefix
 from steve.dbus   import DBusAPI
@@ -62,6 +63,12 @@ class STTDBusAPI(DBusAPI):
                 'voice_activity': self._voice_activity
             }, [])
 
+    @property
+    def audio_stats(self):
+        # Only the audio components running in the STT service are included.
+        # The assistant (main2) publishes the statistics of its own process.
+        return steve.stats.collect()
+
     def activate(self):
         if self.on_activate is not None:
             log.debug('Got DBus request to activate STT')
@@ -92,6 +99,7 @@ STTDBusAPI.__doc__ = f'''
         <property name='voice_activity' type='b' access='read'>
             <annotation name='org.freedesktop.DBus.Property.EmitsChangedSignal' value='true'/>
         </property>
+        <property name='audio_stats' type='a{{sd}}' access='read'/>
         <signal name="Utterance">
             <arg direction="out" name="text" type="s" />
         </signal>
@@ -127,9 +135,16 @@ class SpeechToText:
 
         self._mic = BufferedAudioInput(sample_rate, DEFAULT_SAMPLE_WIDTH, channels, chunk_duration)
 
-    def recognize(self):
+    def recognize(self, start=None):
+        '''Stream microphone audio to the STT service and yield the results
+
+        If start is a frame position of the capture hub, e.g., the position at
+        which the wake word was detected, the audio captured since then is
+        streamed first, so that speech following the wake word is not lost.
+        '''
+        self._mic.start = start
         with self._mic as stream:
-            requests = (StreamingRecognizeRequest(audio_content=c) for c in stream)
+            requests = (StreamingRecognizeRequest(audio_content=bytes(c)) for c in stream)
             for response in self._client.streaming_recognize(self._config, requests):
                 # Each response may contain multiple results, and each result may
                 # contain multiple alternatives. Here we print only the
@@ -162,10 +177,13 @@ class SpeechToText:
 @click.option('--chunk-duration',  '-d', envvar='CHUNK_DURATION',  type=float, default=DEFAULT_CHUNK_DURATION, help='Audio chunk duration in seconds', show_default=True)
 @click.option('--vad-timeout',     '-t', envvar='VAD_TIMEOUT',     type=float, default=DEFAULT_VAD_TIMEOUT,    help='Voice activity detection timeout', show_default=True)
 @click.option('--language',        '-l', envvar='LANGUAGE',        type=str,   default=DEFAULT_LANGUAGE,       help='Language for speech recognition', show_default=True)
-def main(verbose, sample_rate, channels, chunk_duration, vad_timeout, language):
+@click.option('--stats-interval',  '-s', envvar='STATS_INTERVAL',  type=float, default=steve.stats.DEFAULT_LOG_INTERVAL, help='Audio statistics logging interval in seconds (0 to disable)', show_default=True)
+def main(verbose, sample_rate, channels, chunk_duration, vad_timeout, language, stats_interval):
     global dbus_api
 
     init_logging(verbose)
+    if stats_interval > 0:
+        steve.stats.start_logging(stats_interval)
 
     # The on_activate callback function is called from the thread used by the
     # DBus API.
@@ -0,0 +1,181 @@
+import os
+import hashlib
+import logging
+import tomllib
+
+import numpy as np
+
+import steve.ease
+from steve.color import parse_color
+from steve.utils import cache_dir
+
+log = logging.getLogger(__name__)
+
+# The default directory with light show timeline files. The timelines shipped
+# with the robot are package data.
+LIGHTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lights')
+
+# Version of the compiled timeline format. Bump this whenever the output of
+# compile() changes so that stale cache files are not used.
+VERSION = 1
+
+
+# A timeline is a list of keyframes. Each keyframe has a time (in seconds), a
+# color, an optional alpha, an optional list of pixels it applies to (all
+# pixels by default), and an optional easing specification (see
+# steve.ease.parse) used to interpolate from this keyframe to the next
+# keyframe of the same pixel. Before the first and after the last keyframe,
+# the pixel keeps the keyframe's value. Pixels without keyframes are
+# transparent. The timeline's duration defaults to the time of the last
+# keyframe. Looped timelines start over after the duration.
+#
+#   duration = 2.0
+#   loop = true
+#
+#   [[keyframes]]
+#   time = 0.0
+#   color = "blue"
+#   pixels = [0, 1]
+#   ease = "in_out_sine"
+
+
+def filename(name: str, directory: str = LIGHTS_DIR) -> str:
+    '''Return the path of the timeline file with the given name
+
+    Timeline names come from D-Bus clients, so only plain file names (with
+    or without the .toml extension) are accepted and the resulting path must
+    stay within the directory.
+    '''
+    if not name or name in ('.', '..') or '/' in name or '\\' in name:
+        raise Exception(f'Invalid timeline name {name!r}')
+
+    if not name.endswith('.toml'):
+        name = f'{name}.toml'
+
+    directory = os.path.realpath(directory)
+    path = os.path.realpath(os.path.join(directory, name))
+    if os.path.commonpath((directory, path)) != directory:
+        raise Exception(f'Timeline {name!r} is outside of {directory}')
+    return path
+
+
+def validate(timeline: dict, pixels: int):
+    '''Check that the timeline has the correct format
+
+    Raises an exception describing the first problem found.
+    '''
+    keyframes = timeline.get('keyframes', None)
+    if not isinstance(keyframes, list) or not len(keyframes):
+        raise Exception('Missing keyframes in timeline')
+
+    for i, k in enumerate(keyframes):
+        if not isinstance(k.get('time', None), (int, float)) or k['time'] < 0:
+            raise Exception(f'Invalid time in keyframe {i}')
+
+        if 'color' not in k:
+            raise Exception(f'Missing color in keyframe {i}')
+
+        if 'pixels' in k:
+            if any(not isinstance(p, int) or p < 0 or p >= pixels for p in k['pixels']):
+                raise Exception(f'Invalid pixels in keyframe {i}')
+
+
+def _track(keyframes: list, times: np.ndarray) -> np.ndarray:
+    '''Interpolate the keyframes of a single pixel at the given times'''
+    keyframes = sorted(keyframes, key=lambda k: k['time'])
+    kt = np.array([k['time'] for k in keyframes], dtype=np.float64)
+
+    values = np.empty((len(keyframes), 4), dtype=np.float64)
+    for i, k in enumerate(keyframes):
+        c = parse_color(k['color'])
+        values[i, :3] = c[:3]
+        values[i, 3] = k.get('alpha', c[3] if len(c) > 3 else 1.0)
+
+    rv = np.empty((len(times), 4), dtype=np.float64)
+    seg = np.searchsorted(kt, times, side='right') - 1
+    rv[seg < 0] = values[0]
+    rv[seg >= len(kt) - 1] = values[-1]
+
+    for i in range(len(kt) - 1):
+        sel = seg == i
+        if not sel.any():
+            continue
+
+        span = kt[i + 1] - kt[i]
+        u = (times[sel] - kt[i]) / span if span > 0 else np.ones(sel.sum())
+        ease = keyframes[i].get('ease', None)
+        if ease is not None:
+            fn = steve.ease.parse(ease)
+            if fn is not None:
+                u = steve.ease.vectorize(fn)(u)
+
+        rv[sel] = values[i] + (values[i + 1] - values[i]) * u[:, None]
+    return rv
+
+
+def compile(timeline: dict, rate: int, pixels: int) -> tuple[np.ndarray, bool]:
+    '''Render the timeline into a dense array of frames
+
+    Returns a tuple with a float32 array with the shape (frames, pixels, 4)
+    sampled at the given rate, and a flag indicating whether the timeline
+    loops.
+    '''
+    validate(timeline, pixels)
+    keyframes = timeline['keyframes']
+    loop = bool(timeline.get('loop', False))
+    duration = timeline.get('duration', max(k['time'] for k in keyframes))
+
+    n = max(1, round(duration * rate) + (0 if loop else 1))
+    times = np.arange(n, dtype=np.float64) / rate
+
+    # Group the pixels by the keyframes that apply to them, so that pixels
+    # sharing all keyframes are interpolated only once.
+    groups = {}
+    for p in range(pixels):
+        key = tuple(i for i, k in enumerate(keyframes) if 'pixels' not in k or p in k['pixels'])
+        groups.setdefault(key, []).append(p)
+
+    frames = np.zeros((n, pixels, 4), dtype=np.float32)
+    for key, group in groups.items():
+        if len(key):
+            frames[:, group] = _track([keyframes[i] for i in key], times)[:, None, :]
+
+    return frames, loop
+
+
+def load(name: str, rate: int, pixels: int, cache: bool = True, directory: str = LIGHTS_DIR) -> tuple[np.ndarray, bool]:
+    '''Load and compile a timeline file
+
+    The name is the name of a timeline file in the directory, see filename().
+    Compiled timelines are cached in the user's cache directory under a key
+    derived from the content of the file, the rate, and the number of pixels.
+    '''
+    path = filename(name, directory)
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    digest = hashlib.sha256(data + f'\0{VERSION}\0{rate}\0{pixels}'.encode()).hexdigest()
+    cached = os.path.join(cache_dir(), f'timeline-{digest}.npz')
+
+    if cache:
+        try:
+            with np.load(cached, allow_pickle=False) as f:
+                frames, loop = f['frames'], bool(f['loop'])
+            log.debug(f'Loaded compiled timeline {path} from {cached}')
+            return frames, loop
+        except (OSError, ValueError, KeyError):
+            pass
+
+    frames, loop = compile(tomllib.loads(data.decode()), rate, pixels)
+    log.debug(f'Compiled timeline {path} into {len(frames)} frames')
+
+    if cache:
+        try:
+            tmp = f'{cached}.{os.getpid()}'
+            with open(tmp, 'wb') as f:
+                np.savez(f, frames=frames, loop=loop)
+            os.replace(tmp, cached)
+        except OSError as e:
+            log.warning(f'Could not store compiled timeline in {cached}: {e}')
+
+    return frames, loop
@@ -4,7 +4,8 @@ from queue import Queue
 from threading import Thread
 import itertools
 import logging
-from steve.audio import audio
+import steve.stats
+from steve.mixer import StreamSource, get_mixer
 
 
 log = logging.getLogger(__name__)
@@ -20,7 +21,12 @@ class TextToSpeech(Thread):
         self.start()
 
     def run(self):
-        self._stream = audio.open(format=audio.get_format_from_width(2), channels=1, rate=22050, output=True)
+        # The synthesized speech is played through the shared output mixer.
+        # The service produces 16-bit mono audio at 22050 Hz, the source
+        # converts it to the mixer's rate.
+        self._stream = StreamSource(get_mixer(), rate=22050)
+        steve.stats.register('tts', self._stream.stats)
+        self._playback = get_mixer().play(self._stream)
         try:
             def read_text():
                 while True:
@@ -46,7 +52,6 @@ class TextToSpeech(Thread):
                 except google.api_core.exceptions.Aborted as e:
                     log.debug('Disconnected from Google TTS')
         finally:
-            self._stream.stop_stream()
             self._stream.close()
 
     def say(self, text):
@@ -1,3 +1,4 @@
+import os
 import logging
 
 def init_logging(verbose):
@@ -8,3 +9,11 @@ def init_logging(verbose):
     if verbose >= 2:
         level = logging.DEBUG
     logging.basicConfig(level=level)
+
+
+def cache_dir():
+    '''Return the directory for cached data, creating it if necessary'''
+    base = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    path = os.path.join(base, 'steve')
+    os.makedirs(path, exist_ok=True)
+    return path
@@ -1,10 +1,13 @@
 import os
 import site
+import time
 import pyaudio
 import numpy as np
 from contextlib import suppress
 from openwakeword.model import Model
-from steve.audio import audio, AudioClip
+import steve.stats
+from steve.audio import AudioClip
+from steve.capture import get_capture_hub
 from steve.stt import SpeechToText
 
 
@@ -24,32 +27,47 @@ class WakeWord:
     CHANNELS   = 1
     RATE       = 16000
 
-    def __init__(self, model='hey_steve.onnx', threshold=0.5):
+    def __init__(self, model='hey_steve.onnx', threshold=0.5, hub=None):
         self._model_dir = install_models()
         self._threshold = threshold
+        self._hub = hub
+        self.position = None
+        self.inference = steve.stats.Series()
+        self.overruns = 0
+        steve.stats.register('wake', self.stats)
         self._model = Model(wakeword_models=[
             os.path.join(self._model_dir, model)],
             inference_framework='onnx',
             enable_speex_noise_suppression=True)
 
     def detect(self):
+        if self._hub is None:
+            self._hub = get_capture_hub(self.RATE, pyaudio.get_sample_size(self.FORMAT), self.CHANNELS)
+
         self._model.reset()
+        reader = self._hub.reader(self.CHUNK_SIZE)
         try:
-            stream = audio.open(
-                format=self.FORMAT, channels=self.CHANNELS, rate=self.RATE,
-                frames_per_buffer=self.CHUNK_SIZE, input=True)
-
-            while True:
-                data = np.frombuffer(stream.read(self.CHUNK_SIZE, exception_on_overflow=False), dtype=np.int16)
-                self._model.predict(data)
+            for chunk in reader:
+                start = time.perf_counter()
+                self._model.predict(np.frombuffer(chunk, dtype=np.int16))
+                self.inference.add(time.perf_counter() - start)
 
                 for m in self._model.prediction_buffer.keys():
                     score = list(self._model.prediction_buffer[m])[-1]
                     if score >= self._threshold:
+                        # The frame position right after the wake word, where
+                        # speech recognition can pick up the captured audio
+                        self.position = reader.position
                         return score
         finally:
-            stream.stop_stream()
-            stream.close()
+            self.overruns += reader.overruns
+            reader.close()
+
+    def stats(self) -> dict:
+        return {
+            'overruns': self.overruns,
+            **self.inference.stats('inference_ms', 1000)
+        }
 
 
 if __name__ == "__main__":
@@ -61,7 +79,7 @@ if __name__ == "__main__":
         print('Listening for wake word')
         print(detector.detect())
         chirp.play()
-        for value in stt_client.recognize():
+        for value in stt_client.recognize(start=detector.position):
             print(value)
             if value == 'stop':
                 stt_client.stop()
@@ -0,0 +1,102 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import steve.aec
+import steve.capture
+import steve.mixer
+import steve.stats
+from steve.aec import EchoCancellation, FDAFEchoCanceller
+
+RATE = 16000
+FRAME = 256
+DELAY = 100
+
+
+@pytest.fixture(autouse=True)
+def isolate(monkeypatch):
+    monkeypatch.setattr(steve.aec, 'speexdsp', None)
+    monkeypatch.setattr(steve.stats, '_providers', {})
+
+
+def far_signal(frames, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(0, 0.1, frames * FRAME).astype(np.float32)
+
+
+def echo_of(far):
+    # A delayed, attenuated copy of the reference, as if picked up by the
+    # microphone from the speaker
+    return 0.5 * np.concatenate((np.zeros(DELAY, dtype=np.float32), far[:-DELAY]))
+
+
+def energy(x):
+    return float(np.mean(np.asarray(x, dtype=np.float64) ** 2))
+
+
+def test_fdaf_removes_delayed_reference():
+    far = (far_signal(200) * 32767).astype(np.int16)
+    near = (echo_of(far.astype(np.float32))).astype(np.int16)
+
+    canceller = FDAFEchoCanceller(FRAME, 2048)
+    out = np.concatenate([canceller.process(near[i:i + FRAME], far[i:i + FRAME])
+        for i in range(0, len(far), FRAME)])
+
+    tail = slice(-50 * FRAME, None)
+    assert energy(out[tail]) < energy(near[tail]) / 100
+
+
+def mock_mixer():
+    mixer = SimpleNamespace(rate=RATE, monitors=[],
+        stream=SimpleNamespace(get_output_latency=lambda: 0.0))
+    mixer.monitor = mixer.monitors.append
+    return mixer
+
+
+def test_echo_cancellation_removes_mixer_output():
+    mixer = mock_mixer()
+    aec = EchoCancellation(mixer, RATE)
+    assert len(mixer.monitors) == 1
+
+    far = far_signal(200)
+    near = (echo_of(far) * 32767).astype(np.int16)
+
+    out = []
+    for i in range(0, len(far), FRAME):
+        mixer.monitors[0](far[i:i + FRAME])
+        out.append(np.frombuffer(aec(near[i:i + FRAME].tobytes()), dtype=np.int16))
+    out = np.concatenate(out)
+
+    tail = slice(-50 * FRAME, None)
+    assert energy(out[tail]) < energy(near[tail]) / 100
+    assert aec.stats()['process_ms_count'] == 200
+
+
+def test_echo_cancellation_passes_through_until_attached():
+    aec = EchoCancellation(None, RATE)
+    frame = (far_signal(1) * 32767).astype(np.int16).tobytes()
+    assert aec(frame) == frame
+
+    mixer = mock_mixer()
+    aec.attach(mixer)
+    assert mixer.monitors == [aec._on_output]
+
+
+def test_capture_hub_does_not_open_mixer(monkeypatch):
+    monkeypatch.setenv(steve.capture.AEC_ENV, '1')
+    monkeypatch.setattr(steve.capture, '_hub', None)
+    monkeypatch.setattr(steve.mixer, '_mixer', None)
+    monkeypatch.setattr(steve.mixer, '_on_create', [])
+
+    hub = steve.capture.get_capture_hub()
+    assert steve.mixer._mixer is None
+    assert hub.processor.mixer is None
+
+    # The processor starts using the mixer once the process plays audio
+    mixer = mock_mixer()
+    mixer.start = lambda: None
+    monkeypatch.setattr(steve.mixer, 'Mixer', lambda: mixer)
+    assert steve.mixer.get_mixer() is mixer
+    assert hub.processor.mixer is mixer
+    assert mixer.monitors == [hub.processor._on_output]
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from steve.animation import Blink, Breathe, Transition, blink_waveform, breathe_waveform, transition_waveform
+from steve.color import RGB
+
+
+def layer(color=(1, 0.5, 0.25), alpha=0.8, pixels=4):
+    return np.tile(np.array([*color, alpha], dtype=np.float32), (pixels, 1))
+
+
+def test_waveforms_are_cached_and_read_only():
+    wave = breathe_waveform(2, 0.1)
+    assert breathe_waveform(2, 0.1) is wave
+    assert len(wave) == 200
+    with pytest.raises(ValueError):
+        wave[0] = 1
+
+
+def test_blink_waveform():
+    assert blink_waveform(0.02, 0.03).tolist() == [1, 1, 0, 0, 0]
+
+
+def test_transition_reaches_final_alpha():
+    # The duration is not a multiple of the waveform's sample period
+    t = Transition(RGB(255, 0, 0), 0.123, ease='in_out_cubic')
+    base, out = layer(), layer()
+
+    t(0, base, out)
+    assert out[:, 3] == pytest.approx(0)
+
+    t(0.06, base, out)
+    assert 0 < out[0, 3] < 0.8
+
+    t(t.duration, base, out)
+    assert out[:, 3] == pytest.approx(0.8)
+    assert t.done(t.duration)
+    assert not t.done(0.1)
+
+
+def test_transition_waveform_ends_at_one():
+    assert transition_waveform(0.005)[-1] == 1
+    assert transition_waveform(0.5, 'out_bounce')[-1] == pytest.approx(1)
+
+
+def test_blink_alternates_alpha():
+    b = Blink(None, 0.1, 0.2)
+    base, out = layer(), layer()
+    b(0.05, base, out)
+    assert out[0, 3] == pytest.approx(0.8)
+    b(0.15, base, out)
+    assert out[0, 3] == 0
+    b(0.35, base, out)
+    assert out[0, 3] == pytest.approx(0.8)
+    assert b.duration is None and not b.done(100)
+
+
+def test_breathe_single_color_matches_scaled_base():
+    color = (1.0, 0.5, 0.25)
+    base, out = layer(color), layer()
+    table = Breathe(color, period=1)
+    scaled = Breathe(None, period=1)
+
+    for t in (0, 0.3, 0.5, 1.7):
+        table(t, base, out)
+        expected = layer()
+        scaled(t, base, expected)
+        assert out == pytest.approx(expected)
+
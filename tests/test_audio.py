@@ -0,0 +1,116 @@
+import wave
+from types import SimpleNamespace
+
+import numpy as np
+
+from steve.audio import BufferedAudioInput, ClipCache
+from steve.capture import CaptureHub
+
+
+RATE = 16000
+CHUNK = 0.02
+
+
+def buffers(start, count, frames=320):
+    '''Return count buffers of 16-bit samples counting up from start'''
+    x = np.arange(start, start + count * frames).astype('<i2')
+    return [x[i:i + frames].tobytes() for i in range(0, len(x), frames)]
+
+
+def hub_without_input(monkeypatch):
+    # The tests feed the hub directly instead of opening the microphone
+    hub = CaptureHub(RATE, capacity=2, max_chunk=0.1)
+    monkeypatch.setattr(hub, 'start', lambda: None)
+    return hub
+
+
+def samples(audio):
+    return np.concatenate([np.frombuffer(c, dtype='<i2') for c in iter(audio.ring.read, None)]).tolist()
+
+
+def test_preroll_followed_by_live_audio(monkeypatch):
+    hub = hub_without_input(monkeypatch)
+    for data in buffers(0, 5):
+        hub._deliver(data)
+
+    audio = BufferedAudioInput(RATE, 2, 1, CHUNK, hub=hub)
+    audio.start = 320
+    with audio:
+        # A buffer already written to the hub's ring, but dispatched to the
+        # listeners only after the input subscribed, is not duplicated
+        audio._enqueue(buffers(4 * 320, 1)[0])
+        for data in buffers(5 * 320, 2):
+            hub._deliver(data)
+        audio.ring.close()
+        assert samples(audio) == list(range(320, 7 * 320))
+
+
+def test_preroll_is_limited(monkeypatch):
+    hub = hub_without_input(monkeypatch)
+    for data in buffers(0, 10):
+        hub._deliver(data)
+
+    audio = BufferedAudioInput(RATE, 2, 1, CHUNK, max_preroll=0.04, hub=hub)
+    audio.start = 0
+    with audio:
+        audio.ring.close()
+        assert samples(audio) == list(range(8 * 320, 10 * 320))
+
+
+def test_no_preroll_without_start(monkeypatch):
+    hub = hub_without_input(monkeypatch)
+    for data in buffers(0, 3):
+        hub._deliver(data)
+
+    audio = BufferedAudioInput(RATE, 2, 1, CHUNK, hub=hub)
+    with audio:
+        for data in buffers(3 * 320, 1):
+            hub._deliver(data)
+        audio.ring.close()
+        assert samples(audio) == list(range(3 * 320, 4 * 320))
+
+
+def write_wav(path, samples, rate=RATE):
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(np.asarray(samples, dtype='<i2').tobytes())
+    return str(path)
+
+
+def test_clip_cache_converts_clip_once(tmp_path):
+    cache = ClipCache(SimpleNamespace(rate=2 * RATE))
+    filename = write_wav(tmp_path / 'a.wav', np.full(1600, 8192))
+
+    clip = cache.get(filename)
+    assert len(clip) == 3200
+    assert clip.dtype == np.float32
+    assert not clip.flags.writeable
+    assert cache.get(filename) is clip
+    assert cache.size == clip.nbytes
+
+
+def test_clip_cache_reloads_modified_file(tmp_path):
+    cache = ClipCache(SimpleNamespace(rate=RATE))
+    filename = write_wav(tmp_path / 'a.wav', np.zeros(100))
+    clip = cache.get(filename)
+
+    write_wav(filename, np.zeros(200))
+    assert len(cache.get(filename)) == 200
+    assert cache.get(filename) is not clip
+
+
+def test_clip_cache_evicts_least_recently_used(tmp_path):
+    # Room for two clips of 1000 float32 samples
+    cache = ClipCache(SimpleNamespace(rate=RATE), max_size=8000)
+    a, b, c = (write_wav(tmp_path / f'{n}.wav', np.zeros(1000)) for n in 'abc')
+
+    clip_a = cache.get(a)
+    clip_b = cache.get(b)
+    cache.get(a)
+    cache.get(c)
+
+    assert cache.size == 8000
+    assert cache.get(a) is clip_a
+    assert cache.get(b) is not clip_b
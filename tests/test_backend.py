@@ -0,0 +1,76 @@
+import time
+import wave
+
+import numpy as np
+import pytest
+
+import steve.backend
+from steve.audio import BufferedAudioInput
+from steve.backend import NULL, Backend
+from steve.capture import CaptureHub
+from steve.resample import from_float, to_float
+
+RATE = 16000
+CHUNK = 1280
+
+
+@pytest.fixture
+def wav(tmp_path):
+    '''A mono 16-bit WAV file with 32 chunks of noise at 16 kHz'''
+    data = np.random.default_rng(0).integers(-10000, 10000, 32 * CHUNK).astype('<i2').tobytes()
+    path = tmp_path / 'input.wav'
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(RATE)
+        f.writeframes(data)
+
+    # The file input converts the samples to float and back
+    return str(path), from_float(to_float(data, 2, 1), 2, 1)
+
+
+def use_file_input(monkeypatch, filename, realtime):
+    monkeypatch.setattr(steve.backend, '_backend', Backend(input=filename, output=NULL, realtime=realtime))
+
+
+def test_reader_receives_entire_file(monkeypatch, wav):
+    filename, expected = wav
+    use_file_input(monkeypatch, filename, realtime=True)
+
+    hub = CaptureHub(RATE)
+    reader = hub.reader(CHUNK)
+    assert b''.join(bytes(c) for c in reader) == expected
+    hub.stop()
+
+
+def test_fast_input_waits_for_slow_reader(monkeypatch, wav):
+    filename, expected = wav
+    use_file_input(monkeypatch, filename, realtime=False)
+
+    hub = CaptureHub(RATE, capacity=0.5, max_chunk=0.1)
+    reader = hub.reader(CHUNK)
+    chunks = []
+    for chunk in reader:
+        chunks.append(bytes(chunk))
+        time.sleep(0.001)
+
+    assert b''.join(chunks) == expected
+    assert reader.overruns == 0
+    hub.stop()
+
+
+def test_fast_input_waits_for_slow_listener(monkeypatch, wav):
+    filename, expected = wav
+    use_file_input(monkeypatch, filename, realtime=False)
+
+    hub = CaptureHub(RATE, capacity=0.5, max_chunk=0.1)
+    audio = BufferedAudioInput(RATE, 2, 1, 0.08, max_queue_duration=0.16, max_preroll=0.16, hub=hub)
+    chunks = []
+    with audio:
+        for chunk in audio:
+            chunks.append(bytes(chunk))
+            time.sleep(0.001)
+
+    assert b''.join(chunks) == expected
+    assert audio.overruns == 0
+    hub.stop()
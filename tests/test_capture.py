@@ -0,0 +1,164 @@
+import struct
+import threading
+import time
+
+from steve.capture import RingBuffer, RingReader, SharedRing
+
+
+def test_shared_ring_slices_wrap_around():
+    ring = SharedRing(8, 4)
+    ring.write(b'abcdef')
+    ring.write(b'ghij')
+    assert ring.written == 10
+    assert bytes(ring.slice(6, 4)) == b'ghij'
+    assert bytes(ring.slice(4, 4)) == b'efgh'
+    assert b''.join(bytes(b) for b in ring.history(0, 10)) == b'cdefghij'
+
+
+def test_shared_ring_keeps_tail_of_large_write():
+    ring = SharedRing(8, 4)
+    ring.write(b'0123456789ab')
+    assert ring.written == 12
+    assert b''.join(bytes(b) for b in ring.history(0, 12)) == b'456789ab'
+
+
+def test_readers_with_different_chunk_sizes():
+    ring = SharedRing(16, 8)
+    small = RingReader(ring, 2, 1, start=0)
+    large = RingReader(ring, 4, 1, start=0)
+    ring.write(b'abcdefgh')
+
+    assert [bytes(small.read(0)) for _ in range(4)] == [b'ab', b'cd', b'ef', b'gh']
+    assert small.read(0) is None
+    assert [bytes(large.read(0)) for _ in range(2)] == [b'abcd', b'efgh']
+    assert large.position == 8
+
+
+def test_reader_skips_overwritten_data():
+    ring = SharedRing(8, 4)
+    reader = RingReader(ring, 2, 2, start=0)
+    ring.write(b'abcdefgh')
+    ring.write(b'ijkl')
+
+    assert bytes(reader.read(0)) == b'ef'
+    assert reader.overruns == 1
+    assert reader.position == 3
+
+
+def test_reader_drains_closed_ring():
+    ring = SharedRing(8, 4)
+    reader = RingReader(ring, 2, 1, start=0)
+    ring.write(b'abcde')
+    ring.close()
+    assert [bytes(c) for c in reader] == [b'ab', b'cd']
+
+
+def test_closed_reader_returns_none():
+    ring = SharedRing(8, 4)
+    reader = RingReader(ring, 2, 1)
+    reader.close()
+    assert reader.read() is None
+
+
+def test_ring_buffer_wraps_around():
+    ring = RingBuffer(2, 3)
+    for data in (b'aa', b'bb', b'cc', b'dd', b'ee'):
+        ring.write(data)
+        assert bytes(ring.read(0)) == data
+    assert ring.overruns == 0
+
+
+def test_ring_buffer_joins_partial_writes():
+    ring = RingBuffer(4, 3)
+    ring.write(b'ab')
+    assert ring.read(0) is None
+    ring.write(b'cdef')
+    assert bytes(ring.read(0)) == b'abcd'
+    ring.write(b'gh')
+    assert bytes(ring.read(0)) == b'efgh'
+
+
+def test_ring_buffer_overrun_drops_oldest_chunk():
+    ring = RingBuffer(2, 3)
+    ring.write(b'aa')
+    chunk = ring.read(0)
+
+    for data in (b'bb', b'cc', b'dd'):
+        ring.write(data)
+
+    # The chunk held by the consumer is intact, bb was dropped
+    assert bytes(chunk) == b'aa'
+    assert ring.overruns == 1
+    assert bytes(ring.read(0)) == b'cc'
+    assert bytes(ring.read(0)) == b'dd'
+    assert ring.read(0) is None
+
+
+def test_ring_buffer_keeps_newest_chunks():
+    ring = RingBuffer(2, 4)
+    ring.write(b'aabbccddeeff')
+    assert ring.overruns == 3
+    assert [bytes(ring.read(0)) for _ in range(3)] == [b'dd', b'ee', b'ff']
+    assert ring.read(0) is None
+
+
+def test_ring_buffer_overrun_with_two_slots():
+    ring = RingBuffer(2, 2)
+    ring.write(b'aa')
+    chunk = ring.read(0)
+    ring.write(b'bbccd')
+
+    # With the other slot held, the only free slot is needed for the partial
+    # chunk, so the unread chunk cc is dropped too
+    assert bytes(chunk) == b'aa'
+    assert ring.overruns == 2
+    assert ring.read(0) is None
+
+    ring.write(b'd')
+    assert bytes(ring.read(0)) == b'dd'
+
+
+def test_ring_buffer_never_overwrites_held_chunk():
+    ring = RingBuffer(4, 3)
+    stop = threading.Event()
+    errors = []
+
+    def produce():
+        i = 0
+        while not stop.is_set():
+            ring.write(struct.pack('<I', i))
+            i += 1
+        ring.close()
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+
+    last = -1
+    deadline = time.monotonic() + 0.5
+    while time.monotonic() < deadline:
+        chunk = ring.read(1)
+        if chunk is None:
+            break
+        value = struct.unpack('<I', chunk)[0]
+        if value <= last:
+            errors.append((last, value))
+        last = value
+
+        # The producer keeps writing while the consumer holds the chunk
+        time.sleep(0.0001)
+        if struct.unpack('<I', chunk)[0] != value:
+            errors.append(('overwritten', value))
+
+    stop.set()
+    producer.join()
+
+    assert errors == []
+    assert ring.overruns > 0
+
+
+def test_ring_buffer_drains_after_close():
+    ring = RingBuffer(2, 4)
+    ring.write(b'aabbc')
+    ring.close()
+    assert [bytes(c) for c in ring] == [b'aa', b'bb']
+    assert ring.read(0) is None
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from steve.color import (RGB, dim, dim_array, hsl_to_rgb, hsl_to_rgb_array, linear_to_rgb_array, rgb_to_hsl,
+    rgb_to_hsl_array, rgb_to_linear_array)
+
+
+@pytest.fixture
+def colors():
+    rng = np.random.default_rng(0)
+    extra = [[0, 0, 0], [255, 255, 255], [128, 128, 128], [255, 0, 0], [0, 255, 0], [0, 0, 255], [255, 0, 255]]
+    return np.concatenate((rng.integers(0, 256, (200, 3)), extra))
+
+
+def test_rgb_to_hsl_array_matches_scalar(colors):
+    expected = [tuple(rgb_to_hsl(RGB(*c))) for c in colors.tolist()]
+    assert rgb_to_hsl_array(colors).tolist() == [pytest.approx(e) for e in expected]
+
+
+def test_hsl_round_trip(colors):
+    hsl = rgb_to_hsl_array(colors)
+    assert np.abs(hsl_to_rgb_array(hsl).astype(int) - colors).max() <= 1
+
+    expected = np.array([tuple(hsl_to_rgb(rgb_to_hsl(RGB(*c)))) for c in colors.tolist()])
+    assert np.abs(hsl_to_rgb_array(hsl).astype(int) - expected).max() <= 1
+
+
+def test_dim_array_matches_scalar(colors):
+    ratios = np.linspace(0, 1, len(colors))
+    expected = np.array([tuple(dim(RGB(*c), r)) for c, r in zip(colors.tolist(), ratios.tolist())])
+    assert np.abs(dim_array(colors, ratios).astype(int) - expected).max() <= 1
+
+
+def test_dim_is_memoized():
+    dim.cache_clear()
+    assert dim(RGB(200, 100, 50), 0.5) == dim(RGB(200, 100, 50), 0.5)
+    assert dim.cache_info().hits == 1
+
+
+def test_linear_round_trip(colors):
+    linear = rgb_to_linear_array(colors)
+    assert linear.min() >= 0 and linear.max() <= 1
+    assert linear[-4].tolist() == [1, 0, 0]
+    assert (linear_to_rgb_array(linear) == colors).all()
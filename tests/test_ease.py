@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+import steve.ease
+from steve.ease import LUT, lut, names, out_bounce, vector, vectorize
+
+
+X = np.linspace(0, 1, 201)
+
+
+@pytest.mark.parametrize('name', names)
+def test_vectorized_matches_scalar(name):
+    fn = getattr(steve.ease, name)
+    assert vector[name](X) == pytest.approx([fn(x) for x in X], abs=1e-12)
+
+
+@pytest.mark.parametrize('name', names)
+def test_curve_endpoints(name):
+    assert vector[name](np.array([0.0, 1.0])) == pytest.approx([0, 1], abs=1e-9)
+
+
+def test_out_bounce_stays_within_unit_range():
+    # The segment offsets were once not divided by d1, which made the curve
+    # overshoot to about 4
+    values = [out_bounce(x) for x in X]
+    assert min(values) >= 0
+    assert max(values) <= 1
+    assert out_bounce(1.5 / 2.75) == pytest.approx(0.75)
+    assert out_bounce(2.25 / 2.75) == pytest.approx(0.9375)
+    assert out_bounce(2.625 / 2.75) == pytest.approx(0.984375)
+
+
+def test_lut_interpolates_curve():
+    table = lut('in_out_cubic')
+    assert lut('in_out_cubic') is table
+    assert isinstance(table(0.3), float)
+    assert table(X) == pytest.approx(vector['in_out_cubic'](X), abs=1e-5)
+
+
+def test_vectorize_arbitrary_callable():
+    fn = vectorize(lambda x: x * 2)
+    assert fn(np.array([[0.0, 0.5], [1.0, 0.25]])).tolist() == [[0, 1], [2, 0.5]]
+    assert vectorize(steve.ease.in_quad) is vector['in_quad']
+    assert vectorize('out_sine') is vector['out_sine']
+
+    table = LUT(steve.ease.in_sine)
+    assert vectorize(table) is table
+
+
+def test_css_keywords_are_cubic_bezier_curves():
+    ease = steve.ease.parse('ease-in-out')
+    assert ease is steve.ease.cubic_bezier(0.42, 0.0, 0.58, 1.0)
+    assert ease(0.5) == pytest.approx(0.5, abs=1e-4)
+    assert ease(0.25) < 0.25 < ease(0.75)
+
+
+def test_cubic_bezier_solves_for_x():
+    # With control points on the diagonal, the curve is the identity
+    linear = steve.ease.parse('cubic-bezier(0.25, 0.25, 0.75, 0.75)')
+    assert linear(X) == pytest.approx(X, abs=1e-4)
+
+    # For (x1, y1, x2, y2) = (0, 0, 1, 1), x(t) = 3t^2 - 2t^3 and y(t) = x(t)
+    curve = steve.ease.cubic_bezier(0.0, 0.0, 1.0, 1.0)
+    assert curve(X) == pytest.approx(X, abs=1e-4)
+
+
+def test_cubic_bezier_rejects_x_outside_unit_range():
+    with pytest.raises(ValueError):
+        steve.ease.parse('cubic-bezier(1.5, 0, 0.5, 1)')
+
+
+@pytest.mark.parametrize('spec', ['spring(1, 100, 10)', 'spring(1, 100, 20)', 'spring(1, 100, 60)', 'spring(1, 100, 60, 5)'])
+def test_spring_settles_at_target(spec):
+    curve = steve.ease.parse(spec)
+    y = curve(X)
+    assert y[0] == pytest.approx(0)
+    assert y[-1] == 1.0
+    assert abs(y[-2] - 1) < 0.01
+    assert np.all(np.isfinite(y))
+
+
+def test_underdamped_spring_overshoots():
+    assert steve.ease.parse('spring(1, 100, 5)')(X).max() > 1
+
+
+def test_overdamped_spring_does_not_overshoot():
+    y = steve.ease.parse('spring(1, 100, 60)')(X)
+    assert y.max() <= 1
+    assert np.all(np.diff(y) >= -1e-12)
+
+
+def test_invalid_springs_are_rejected():
+    with pytest.raises(ValueError):
+        steve.ease.spring(1, 100, 0)
+    with pytest.raises(ValueError):
+        steve.ease.parse('spring(0, 100, 10)')
+
+
+def test_parse():
+    assert steve.ease.parse('linear') is None
+    assert steve.ease.parse(' in_out_cubic ') is steve.ease.in_out_cubic
+    with pytest.raises(ValueError):
+        steve.ease.parse('wobble(1)')
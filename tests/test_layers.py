@@ -0,0 +1,136 @@
+import numpy as np
+import pytest
+
+from steve.layers import ADD, MULTIPLY, LayerStack, composite
+
+
+def over(stack, mask=None, background=None):
+    '''Blend the layers one after another with the "over" operator'''
+    rv = np.zeros((stack.shape[1], 3)) if background is None else background.copy()
+    for i, layer in enumerate(stack):
+        alpha = layer[:, 3] if mask is None else layer[:, 3] * mask[i]
+        rv = layer[:, :3] * alpha[:, None] + rv * (1 - alpha[:, None])
+    return rv
+
+
+@pytest.fixture
+def stack():
+    return np.random.default_rng(0).random((5, 16, 4)).astype(np.float32)
+
+
+def test_composite_matches_over_operator(stack):
+    assert composite(stack) == pytest.approx(over(stack), abs=1e-5)
+
+
+def test_composite_with_mask_and_background(stack):
+    rng = np.random.default_rng(1)
+    mask = rng.random((5, 16)).astype(np.float32)
+    background = rng.random((16, 3)).astype(np.float32)
+    assert composite(stack, mask, background) == pytest.approx(over(stack, mask, background), abs=1e-5)
+
+
+def test_single_layer(stack):
+    assert composite(stack[:1]) == pytest.approx(over(stack[:1]), abs=1e-6)
+
+
+def test_pixel_index_mask_restricts_layer():
+    layers = LayerStack(4)
+    id = layers.add(mask=[1, 3])
+    layers[id][:, :3] = 1
+    assert layers.compose()[:, 0].tolist() == [0, 1, 0, 1]
+
+
+def test_mask_with_wrong_size_is_rejected():
+    with pytest.raises(Exception):
+        LayerStack(4).add(mask=[0.5, 0.5])
+
+
+def test_view_ignores_writes_after_slot_reuse():
+    layers = LayerStack(4)
+    old = layers.add()
+    view = layers.view(old)
+    view[:, :3] = 0.5
+    assert layers[old][0, 0] == 0.5
+
+    layers.remove(old)
+    new = layers.add()
+    assert layers._layer[new].slot == view.slot
+    assert not view.valid
+
+    view[:, 3] *= 0
+    view[:, :3] = 1
+    assert layers[new].tolist() == [[0, 0, 0, 1]] * 4
+
+
+def solid(layers, color, alpha=1.0, **kwargs):
+    id = layers.add(alpha=alpha, **kwargs)
+    layers[id][:, :3] = color
+    return id
+
+
+def test_layers_ordered_by_priority_z_and_insertion():
+    layers = LayerStack(1)
+    a = layers.add()
+    b = layers.add(z=-1)
+    c = layers.add(priority=1, z=-5)
+    d = layers.add()
+    assert layers.ids() == [b, a, d, c]
+
+    layers.restack(b, z=1)
+    assert layers.ids() == [a, d, b, c]
+
+
+def test_top_layer_wins():
+    layers = LayerStack(1)
+    solid(layers, (1, 0, 0), priority=1)
+    solid(layers, (0, 1, 0), z=10)
+    assert layers.compose().tolist() == [[1, 0, 0]]
+
+
+def test_add_blend_mode():
+    layers = LayerStack(1)
+    solid(layers, (0.5, 0.2, 0))
+    solid(layers, (0.25, 1, 0.5), alpha=0.5, mode=ADD)
+    assert layers.compose().tolist() == [pytest.approx([0.625, 0.7, 0.25])]
+
+
+def test_add_blend_mode_saturates():
+    layers = LayerStack(1)
+    solid(layers, (0.8, 0.8, 0.8))
+    solid(layers, (0.8, 0.8, 0.8), mode=ADD)
+    assert layers.compose().tolist() == [[1, 1, 1]]
+
+
+def test_multiply_blend_mode():
+    layers = LayerStack(1)
+    solid(layers, (1, 0.5, 0.5))
+    solid(layers, (0.5, 0.5, 0), alpha=0.5, mode=MULTIPLY)
+    assert layers.compose().tolist() == [pytest.approx([0.75, 0.375, 0.25])]
+
+
+def test_runs_of_modes_are_blended_in_order():
+    layers = LayerStack(1)
+    solid(layers, (0.5, 0.5, 0.5))
+    solid(layers, (0.5, 0.5, 0.5), mode=ADD)
+    solid(layers, (0, 0, 1), alpha=0.5)
+    solid(layers, (0.5, 0.5, 0.5), mode=MULTIPLY)
+    assert layers.compose().tolist() == [pytest.approx([0.25, 0.25, 0.5])]
+
+
+def test_unsupported_blend_mode():
+    with pytest.raises(Exception):
+        LayerStack(1).add(mode='screen')
+
+
+def test_slots_are_reused():
+    layers = LayerStack(1, capacity=2)
+    a = layers.add()
+    layers.add()
+    with pytest.raises(Exception):
+        layers.add()
+
+    layers.remove(a)
+    assert not layers.remove(a)
+    c = layers.add()
+    assert c != a
+    assert len(layers) == 2
@@ -0,0 +1,163 @@
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import steve.led
+from steve.animation import Transition, current_layer
+from steve.color import RGB
+from steve.led import Compositor, LEDDBusAPI, add_layer, remove_layer, update_layer
+
+
+@pytest.fixture
+def frames(monkeypatch):
+    '''Run the compositor on the module's layers, return the frames it outputs'''
+    rv = []
+    monkeypatch.setattr(steve.led, 'compositor', Compositor(rv.append, rate=100))
+    yield rv
+    monkeypatch.setattr(steve.led, 'compositor', None)
+    steve.led.off()
+    steve.led.animations.clear()
+    steve.led.finished.clear()
+
+
+def run(test):
+    async def main():
+        task = asyncio.create_task(steve.led.compositor.run())
+        try:
+            # Let the compositor output the initial frame
+            await asyncio.sleep(0.02)
+            await test(steve.led.compositor)
+        finally:
+            task.cancel()
+
+    asyncio.run(main())
+
+
+def test_compositor_is_idle_until_invalidated(frames):
+    async def test(c):
+        n = c.frames
+        await asyncio.sleep(0.05)
+        assert c.frames == n
+
+        id = add_layer(RGB(255, 0, 0))
+        await asyncio.sleep(0.02)
+        assert c.frames == n + 1
+        assert frames[-1][0].tolist() == [1, 0, 0]
+
+        remove_layer(id)
+        await asyncio.sleep(0.02)
+        assert c.frames == n + 2
+        assert frames[-1][0].tolist() == [0, 0, 0]
+
+    run(test)
+
+
+def test_unchanged_frame_is_not_output(frames):
+    async def test(c):
+        id = add_layer(RGB(0, 255, 0))
+        await asyncio.sleep(0.02)
+        n, m = c.frames, len(frames)
+
+        update_layer(RGB(0, 255, 0), id)
+        await asyncio.sleep(0.02)
+        assert c.frames == n + 1
+        assert len(frames) == m
+
+    run(test)
+
+
+def test_animation_runs_at_capped_rate_until_done(frames):
+    async def test(c):
+        n = c.frames
+        id = add_layer()
+        steve.led.set_animation(id, Transition(RGB(0, 0, 255), 0.1))
+        await asyncio.sleep(0.2)
+
+        # Ten frames of the animation at 100 Hz, plus the final frame
+        assert 8 <= c.frames - n <= 13
+        assert np.allclose(frames[-1][0], [0, 0, 1])
+        assert id not in steve.led.animations
+
+        n = c.frames
+        await asyncio.sleep(0.05)
+        assert c.frames == n
+
+    run(test)
+
+
+def test_cancelled_coroutine_does_not_write_into_reused_slot(frames, monkeypatch):
+    async def stubborn():
+        _, layer, _ = current_layer.get()
+        try:
+            while True:
+                layer[:, :3] = 1
+                await asyncio.sleep(0.005)
+        except asyncio.CancelledError:
+            # Keep writing for a while after the cancellation
+            for _ in range(5):
+                await asyncio.sleep(0.005)
+                layer[:, :3] = 1
+            raise
+
+    async def test(c):
+        monkeypatch.setattr(steve.led, 'asyncio_loop', asyncio.get_running_loop())
+        id = add_layer()
+        steve.led.set_animation(id, stubborn())
+        await asyncio.sleep(0.02)
+
+        slot = steve.led.layers._layer[id].slot
+        remove_layer(id)
+        new = add_layer(RGB(0, 0, 0), alpha=0.5)
+        assert steve.led.layers._layer[new].slot == slot
+
+        await asyncio.sleep(0.05)
+        assert steve.led.layers[new].tolist() == [[0, 0, 0, 0.5]] * steve.led.PIXEL_COUNT
+
+    run(test)
+
+
+def test_stats_include_compositor_counters(frames, monkeypatch):
+    api = LEDDBusAPI(steve.led.BUS_NAME)
+
+    async def test(c):
+        id = add_layer(RGB(255, 0, 0))
+        await asyncio.sleep(0.02)
+        update_layer(RGB(255, 0, 0), id)
+        await asyncio.sleep(0.02)
+
+        assert api.stats == {'frames': c.frames, 'unchanged': 1, 'overruns': 0}
+        assert c.frames == len(frames) + 1
+
+        monkeypatch.setattr(steve.led, 'output', SimpleNamespace(stats=lambda: {'composed': 2, 'sent': 1, 'skipped': 1}))
+        assert api.stats == {'frames': c.frames, 'unchanged': 1, 'overruns': 0, 'composed': 2, 'sent': 1, 'skipped': 1}
+
+    run(test)
+
+
+def test_timeline_name_cannot_escape_lights_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(steve.led, 'lights_dir', str(tmp_path))
+    with pytest.raises(Exception, match='Invalid timeline name'):
+        steve.led.parse_animation({'type': 'timeline', 'name': '../roboarm'})
+
+
+def test_frames_over_budget_are_counted(frames, monkeypatch):
+    compositor = Compositor(frames.append, rate=100, budget=0)
+    compositor.trace = []
+    monkeypatch.setattr(steve.led, 'compositor', compositor)
+
+    async def test(c):
+        id = add_layer()
+        steve.led.set_animation(id, Transition(RGB(0, 0, 255), 0.1))
+        await asyncio.sleep(0.2)
+
+        assert c.overruns == c.frames
+        assert len(c.trace) == c.frames
+
+        # The frames are scheduled against a running deadline, so the rate
+        # does not drift below the target
+        start = [t[0] for t in c.trace[1:]]
+        assert np.diff(start).mean() == pytest.approx(0.01, abs=0.003)
+
+    run(test)
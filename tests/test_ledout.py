@@ -0,0 +1,72 @@
+import threading
+
+import numpy as np
+import pytest
+
+from steve.ledout import MAX_VALUE, OutputStage, TLC59711Output, _thresholds
+
+
+def test_plain_output_is_gamma_corrected():
+    stage = OutputStage(gamma=2.0)
+    out = stage(np.array([[0.0, 0.5, 1.0]]))
+    assert out.dtype == np.uint16
+    # Inputs are quantized to the size of the table before the lookup
+    half = round(0.5 * (stage.size - 1)) / (stage.size - 1)
+    assert out.tolist() == [[0, round(half ** 2 * MAX_VALUE), MAX_VALUE]]
+
+
+def test_thresholds_alternate():
+    assert _thresholds(4).tolist() == [0.125, 0.625, 0.375, 0.875]
+    with pytest.raises(ValueError):
+        _thresholds(6)
+
+
+def test_dither_averages_to_exact_value():
+    stage = OutputStage(frames=8)
+    frame = np.linspace(0, 0.2, 48, dtype=np.float32).reshape(16, 3)
+
+    i = np.rint(frame * (stage.size - 1)).astype(np.intp)
+    exact = np.linspace(0, 1, stage.size)[i] ** stage.gamma * MAX_VALUE
+
+    total = sum(stage(frame, dither=True).astype(np.float64) for _ in range(8))
+    assert np.abs(total / 8 - exact).max() <= 1 / 8 + 1e-9
+    assert stage.phase == 0
+
+
+def test_dither_does_not_overflow():
+    stage = OutputStage()
+    for _ in range(8):
+        assert stage(np.ones((16, 3)), dither=True).max() == MAX_VALUE
+
+
+class TLC:
+    def __init__(self):
+        self.pixels = {}
+        self.shown = []
+        self.event = threading.Event()
+
+    def __setitem__(self, i, v):
+        self.pixels[i] = v
+
+    def show(self):
+        self.shown.append(dict(self.pixels))
+        self.event.set()
+
+
+def test_unchanged_frames_are_not_sent():
+    tlc = TLC()
+    output = TLC59711Output(tlc, 2)
+    output.start()
+    try:
+        frame = np.array([[1, 2, 3], [4, 5, 6]], dtype=np.uint16)
+        output(frame)
+        assert tlc.event.wait(1)
+        tlc.event.clear()
+
+        output(frame)
+        assert not tlc.event.wait(0.05)
+    finally:
+        output.stop()
+
+    assert tlc.shown == [{0: (1, 2, 3), 1: (4, 5, 6)}]
+    assert output.stats() == {'composed': 2, 'sent': 1, 'skipped': 1}
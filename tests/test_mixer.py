@@ -0,0 +1,99 @@
+import threading
+
+import numpy as np
+import pytest
+
+import steve.backend
+from steve.backend import NULL, Backend
+from steve.mixer import ClipSource, Mixer, StreamSource, ToneSource
+from steve.resample import from_float
+
+RATE = 16000
+PERIOD = 256
+
+
+@pytest.fixture
+def mixer(monkeypatch):
+    monkeypatch.setattr(steve.backend, '_backend', Backend(output=NULL))
+    mixer = Mixer(RATE, period=PERIOD)
+    mixer.output = []
+    mixer.monitor(lambda buf: mixer.output.append(buf.copy()))
+    yield mixer
+    mixer.stop()
+
+
+def test_sources_are_mixed(mixer):
+    a = mixer.play(ClipSource(np.full(PERIOD * 2, 0.25, dtype=np.float32)))
+    b = mixer.play(ClipSource(np.full(PERIOD, 0.5, dtype=np.float32)), volume=0.5)
+    mixer.start()
+    assert a.wait(1) and b.wait(1)
+    mixer.stop()
+
+    out = np.concatenate(mixer.output)
+    assert out[:PERIOD] == pytest.approx(0.5)
+    assert out[PERIOD:2 * PERIOD] == pytest.approx(0.25)
+    assert out[2 * PERIOD:] == pytest.approx(0)
+
+
+def test_mix_is_clipped(mixer):
+    for _ in range(3):
+        mixer.play(ClipSource(np.full(PERIOD, 0.5, dtype=np.float32)))
+    mixer.start()
+    mixer.play(ClipSource(np.zeros(PERIOD, dtype=np.float32))).wait(1)
+    assert np.concatenate(mixer.output).max() == 1
+
+
+def test_cancelled_playback_finishes(mixer):
+    mixer.start()
+    playback = mixer.play(ToneSource(440, 10, RATE))
+    assert not playback.wait(0.05)
+    playback.cancel()
+    assert playback.wait(1)
+    assert mixer.stats()['playing'] == 0
+
+
+def test_stream_source_converts_rate(mixer):
+    source = StreamSource(mixer, 8000)
+    t = np.arange(8000) / 8000
+    source.write(from_float(0.5 * np.sin(2 * np.pi * 200 * t).astype(np.float32), 2, 1))
+    source.close()
+
+    playback = mixer.play(source)
+    mixer.start()
+    assert playback.wait(2)
+    mixer.stop()
+
+    # One second of audio at the mixer's rate with the tone's frequency
+    out = np.concatenate(mixer.output)
+    assert abs(np.nonzero(out)[0][-1] - RATE) < RATE * 0.02
+    assert np.argmax(np.abs(np.fft.rfft(out[:RATE]))) == 200
+    assert np.abs(out).max() == pytest.approx(0.5, abs=0.02)
+
+
+def test_stream_source_write_blocks_until_played(mixer):
+    source = StreamSource(mixer, RATE, max_duration=0.05)
+    data = from_float(np.full(RATE // 10, 0.1, dtype=np.float32), 2, 1)
+    source.write(data)
+
+    writer = threading.Thread(target=source.write, args=(data,))
+    writer.start()
+    writer.join(0.05)
+    assert writer.is_alive()
+
+    mixer.play(source)
+    mixer.start()
+    writer.join(1)
+    assert not writer.is_alive()
+    assert source.stats()['write_stall_ms_count'] == 1
+    source.close()
+
+
+def test_failed_mixer_releases_playbacks(mixer):
+    def fail(*args, **kwargs):
+        raise OSError('device gone')
+
+    mixer.stream.write = fail
+    playback = mixer.play(ToneSource(440, 10, RATE))
+    mixer.start()
+    assert playback.wait(1)
+    assert mixer.play(ToneSource(440, 10, RATE)).done
@@ -0,0 +1,94 @@
+import os
+
+import numpy as np
+import pytest
+
+import steve.model
+from steve.model import DEFAULT_MODEL, compile, is_compiled, load, to_fraction, to_fractions
+
+
+MODEL = '''
+transitions = [["rest", "up"]]
+
+[actuators.elbow]
+type = "angular"
+servo = 3
+pulse = [500, 2500]
+map = { "-90" = 0.0, "0" = 0.4, "90" = 1.0 }
+
+[actuators.gripper]
+type = "linear"
+servo = 5
+pulse = [500, 2500]
+range = [0.2, 0.8]
+
+[poses.rest]
+elbow = -90
+
+[poses.up]
+elbow = 90
+'''
+
+
+@pytest.fixture
+def model_file(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    path = tmp_path / 'model.toml'
+    path.write_text(MODEL)
+    return str(path)
+
+
+def test_default_model_is_package_data():
+    assert os.path.dirname(DEFAULT_MODEL) == os.path.dirname(steve.model.__file__)
+    assert is_compiled(load(DEFAULT_MODEL, cache=False))
+
+
+def test_invalid_model_is_rejected():
+    with pytest.raises(Exception, match='Unknown actuator'):
+        compile({'actuators': {}, 'poses': {'rest': {'elbow': 0}}})
+
+    with pytest.raises(Exception, match='Invalid transition'):
+        compile({'actuators': {}, 'poses': {}, 'transitions': [['rest', 'up']]})
+
+
+def test_compiled_maps_and_plans(model_file):
+    model = load(model_file, cache=False)
+    assert [list(p) for p in model['set_map']['elbow']] == [[-90.0, 0.0], [0.0, 0.4], [90.0, 1.0]]
+
+    assert to_fraction(model, 'elbow', -45) == pytest.approx(0.2)
+    assert to_fraction(model, 'elbow', 45) == pytest.approx(0.7)
+    assert to_fraction(model, 'gripper', 0.5) == pytest.approx(0.5)
+    assert to_fraction(model, 'gripper', 1) == pytest.approx(0.8)
+
+    states = np.linspace(-90, 90, 13)
+    expected = [to_fraction(model, 'elbow', s) for s in states]
+    assert to_fractions(model, 'elbow', states) == pytest.approx(expected)
+
+    (src, dst, _, _, plan), = model['plans']
+    assert (src, dst) == ('rest', 'up')
+    assert plan['elbow'][3][-1] == pytest.approx(1.0)
+
+
+def test_out_of_range_state_is_rejected(model_file):
+    model = load(model_file, cache=False)
+    with pytest.raises(ValueError):
+        to_fraction(model, 'elbow', 100)
+
+
+def test_compiled_model_is_cached(model_file, monkeypatch):
+    model = load(model_file)
+
+    def fail(model):
+        raise AssertionError('model compiled again')
+
+    monkeypatch.setattr(steve.model, 'compile', fail)
+    cached = load(model_file)
+    assert is_compiled(cached)
+    assert cached['poses'] == model['poses']
+
+
+def test_changed_model_is_compiled_again(model_file):
+    load(model_file)
+    with open(model_file, 'a') as f:
+        f.write('\n[poses.side]\nelbow = 0\n')
+    assert 'side' in load(model_file)['poses']
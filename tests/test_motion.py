@@ -0,0 +1,125 @@
+import asyncio
+import struct
+from types import SimpleNamespace
+
+import pytest
+
+from steve.model import Trajectory
+from steve.motion import PCA9685_LED0_ON_L, MotionScheduler, ServoController
+
+
+class Bus:
+    def __init__(self, fail=False):
+        self.writes = []
+        self.fail = fail
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def write(self, buf):
+        if self.fail:
+            raise OSError('I2C write failed')
+        self.writes.append(bytes(buf))
+
+
+class Servo:
+    def __init__(self):
+        self._min_duty = 0x1000
+        self._duty_range = 0x8000
+        self.fraction = None
+
+
+def kit(channels=16, fail=False):
+    return SimpleNamespace(servo=[Servo() for _ in range(channels)], _pca=SimpleNamespace(i2c_device=Bus(fail)))
+
+
+def test_consecutive_channels_share_one_write():
+    k = kit()
+    c = ServoController(k)
+    assert c.batched
+
+    c.stage(2, 0.5)
+    c.stage(3, None)
+    c.stage(7, 1.0)
+    c.flush()
+
+    writes = k._pca.i2c_device.writes
+    assert len(writes) == 2
+    assert writes[0][0] == PCA9685_LED0_ON_L + 4 * 2
+    assert struct.unpack('<HHHH', writes[0][1:]) == (0, (0x1000 + 0x4000) >> 4, 0, 0x1000)
+    assert writes[1][0] == PCA9685_LED0_ON_L + 4 * 7
+    assert c.pending == {}
+    assert c.commanded == {2: 0.5, 3: None, 7: 1.0}
+
+
+def test_unsupported_kit_falls_back_to_public_api():
+    k = SimpleNamespace(servo=[SimpleNamespace(fraction=None) for _ in range(4)], _pca=SimpleNamespace())
+    c = ServoController(k)
+    assert not c.batched
+
+    c.stage(1, 0.25)
+    c.flush()
+    assert k.servo[1].fraction == 0.25
+
+
+def test_set_records_commanded_fraction():
+    k = kit()
+    c = ServoController(k)
+    c.set(4, 0.75)
+    assert k.servo[4].fraction == 0.75
+    assert c.commanded[4] == 0.75
+
+
+def trajectory(n, rate=1000):
+    return Trajectory(0.0, 1.0, rate, tuple(i / (n - 1) for i in range(n)))
+
+
+def test_scheduler_plays_trajectories_to_the_end():
+    k = kit()
+    c = ServoController(k)
+    scheduler = MotionScheduler(rate=1000)
+
+    async def run():
+        return await asyncio.gather(
+            scheduler.play(c, 0, trajectory(5)),
+            scheduler.play(c, 1, trajectory(10)))
+
+    assert asyncio.run(run()) == [1.0, 1.0]
+    assert c.commanded == {0: 1.0, 1: 1.0}
+    assert scheduler.motion == {}
+
+
+def test_scheduler_fails_only_motions_of_failed_controller():
+    good = ServoController(kit())
+    bad = ServoController(kit(fail=True))
+    scheduler = MotionScheduler(rate=1000)
+
+    async def run():
+        rv = await asyncio.gather(
+            scheduler.play(bad, 0, trajectory(5)),
+            scheduler.play(good, 0, trajectory(5)),
+            return_exceptions=True)
+        return rv, scheduler._task.done()
+
+    (failed, done), stopped = asyncio.run(run())
+    assert isinstance(failed, OSError)
+    assert done == 1.0
+    assert not stopped
+
+
+def test_new_motion_cancels_old_one_on_same_servo():
+    c = ServoController(kit())
+    scheduler = MotionScheduler(rate=1000)
+
+    async def run():
+        first = asyncio.ensure_future(scheduler.play(c, 0, trajectory(1000)))
+        await asyncio.sleep(0.01)
+        second = await scheduler.play(c, 0, trajectory(3))
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return second
+
+    assert asyncio.run(run()) == 1.0
@@ -0,0 +1,98 @@
+from types import SimpleNamespace
+
+import pytest
+
+from steve.model import compile, to_fraction
+from steve.pose import PoseLibrary
+
+
+MODEL = {
+    'actuators': {
+        'torso': {'type': 'angular', 'servo': 0, 'pulse': [500, 2500], 'map': {'-90': 0.0, '90': 1.0}},
+        'elbow': {'type': 'angular', 'servo': 3, 'pulse': [500, 2500], 'map': {'-90': 0.0, '90': 1.0}}
+    },
+    'poses': {
+        'rest': {'torso': 0, 'elbow': -45},
+        'up'  : {'torso': 45, 'elbow': 45},
+        'side': {'torso': -90}
+    },
+    'transitions': [['rest', 'up']]
+}
+
+
+class Arm:
+    '''The parts of RoboArm used by PoseLibrary'''
+    def __init__(self, model, pose=None):
+        self.model = model
+        self.controller = SimpleNamespace(commanded={})
+        self.reads = 0
+        if pose is not None:
+            self.at(pose)
+
+    def at(self, pose):
+        for name, state in self.model['poses'][pose].items():
+            servo = self.model['actuators'][name]['servo']
+            self.controller.commanded[servo] = to_fraction(self.model, name, state)
+
+    def get(self, name):
+        # Hardware read, must not be needed for cached plans
+        self.reads += 1
+        servo = self.model['actuators'][name]['servo']
+        fraction = self.controller.commanded.get(servo, None)
+        return None if fraction is None else fraction * 180 - 90
+
+
+@pytest.fixture
+def model():
+    return compile(MODEL)
+
+
+def test_precomputed_plan_found_from_commanded_position(model):
+    arm = Arm(model, 'rest')
+    library = PoseLibrary(arm, model)
+
+    src, plan = library.lookup('up')
+    assert src == 'rest'
+    assert set(plan) == {'torso', 'elbow'}
+    assert plan['torso'].fractions[-1] == pytest.approx(to_fraction(model, 'torso', 45))
+    assert arm.reads == 0
+
+
+def test_no_plan_from_other_position(model):
+    arm = Arm(model, 'side')
+    library = PoseLibrary(arm, model)
+    assert library.lookup('up') == (None, None)
+
+
+def test_unknown_position_has_no_plan(model):
+    library = PoseLibrary(Arm(model), model)
+    assert library.lookup('up') == (None, None)
+
+
+def test_prepare_uses_cached_plan(model):
+    arm = Arm(model, 'rest')
+    library = PoseLibrary(arm, model)
+
+    plan = library.prepare('up')
+    assert plan['torso'] is library.lookup('up')[1]['torso']
+    assert arm.reads == 0
+
+
+def test_prepare_plans_uncached_transition(model):
+    arm = Arm(model, 'side')
+    library = PoseLibrary(arm, model)
+
+    plan = library.prepare('up')
+    assert plan['torso'].start == pytest.approx(-90)
+    assert plan['torso'].stop == 45
+    assert plan['elbow'] is None
+
+
+def test_plan_is_cached(model):
+    library = PoseLibrary(Arm(model), model)
+    plan = library.plan('up', 'rest', ease='in_out_cubic')
+    assert library.plan('up', 'rest', ease='in_out_cubic') is plan
+
+    arm = library.roboarm
+    arm.at('up')
+    assert library.lookup('rest', ease='in_out_cubic') == ('up', plan)
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from steve.resample import Resampler, from_float, resample, to_float
+
+
+def signal(n, seed=0):
+    return np.random.default_rng(seed).uniform(-0.5, 0.5, n).astype(np.float32)
+
+
+@pytest.mark.parametrize('src, dst', [(16000, 48000), (48000, 16000), (44100, 16000), (22050, 44100), (16000, 16000)])
+def test_chunked_matches_whole(src, dst):
+    x = signal(src // 2)
+    whole = resample(x, src, dst)
+
+    r = Resampler(src, dst)
+    sizes = np.random.default_rng(1).integers(1, 700, 100)
+    parts, pos = [], 0
+    for n in sizes:
+        parts.append(r(x[pos:pos + n]))
+        pos += n
+    parts.append(r(x[pos:]))
+    parts.append(r.flush())
+
+    np.testing.assert_allclose(np.concatenate(parts), whole, atol=1e-6)
+
+
+@pytest.mark.parametrize('src, dst', [(16000, 48000), (48000, 16000), (44100, 16000)])
+def test_output_length(src, dst):
+    x = signal(src)
+    assert abs(len(resample(x, src, dst)) - dst) <= 1
+
+
+def test_preserves_tone():
+    t = np.arange(48000) / 48000
+    x = (0.5 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+    y = resample(x, 48000, 16000)
+
+    expected = 0.5 * np.sin(2 * np.pi * 440 * np.arange(len(y)) / 16000)
+    np.testing.assert_allclose(y[200:-200], expected[200:-200], atol=1e-2)
+
+
+def test_removes_frequencies_above_nyquist():
+    t = np.arange(48000) / 48000
+    x = (0.5 * np.sin(2 * np.pi * 12000 * t)).astype(np.float32)
+    y = resample(x, 48000, 16000)
+    assert np.abs(y[200:-200]).max() < 1e-2
+
+
+@pytest.mark.parametrize('width', [1, 2, 4])
+def test_pcm_round_trip(width):
+    x = signal(100)
+    y = to_float(from_float(x, width, 2), width, 2)
+    np.testing.assert_allclose(y, x, atol=2 / 2 ** (8 * width - 1))
@@ -0,0 +1,48 @@
+import steve.stats
+from steve.capture import RingBuffer
+from steve.stats import Series, Window
+
+
+def test_series():
+    s = Series()
+    for v in (1, 5, 3):
+        s.add(v)
+    assert s.stats('x', 1000) == {'x_count': 3, 'x_mean': 3000, 'x_max': 5000}
+
+
+def test_window_covers_last_period():
+    w = Window(10)
+    for t in range(30):
+        w.add(t, now=t + 0.5)
+
+    assert w.stats('depth', now=29.9) == {'depth_count': 10, 'depth_mean': 24.5, 'depth_max': 29}
+
+    # Nothing was added in the last ten seconds
+    assert w.stats('depth', now=45)['depth_count'] == 0
+
+
+def test_window_shows_changing_depth():
+    w = Window(5)
+    for t in range(5):
+        w.add(8, now=t)
+    for t in range(5, 10):
+        w.add(1, now=t)
+    assert w.stats('depth', now=9)['depth_max'] == 1
+
+
+def test_collect_prefixes_provider_names(monkeypatch):
+    monkeypatch.setattr(steve.stats, '_providers', {})
+    ring = RingBuffer(2, 4)
+    steve.stats.register('ring', ring.stats)
+    steve.stats.register('broken', lambda: 1 / 0)
+
+    ring.write(b'aabbcc')
+    ring.read(0)
+
+    values = steve.stats.collect()
+    assert values['ring.depth'] == 2
+    assert values['ring.depth_window_count'] == 1
+    assert values['ring.depth_window_max'] == 3
+    assert values['ring.depth_max'] == 3
+    assert not any(k.startswith('broken.') for k in values)
+    assert 'ring.depth=2' in steve.stats.summary(values)
@@ -0,0 +1,124 @@
+import os
+
+import numpy as np
+import pytest
+
+import steve.timeline
+from steve.animation import Timeline
+from steve.timeline import LIGHTS_DIR, compile, filename
+
+
+def test_shipped_timelines_are_package_data():
+    assert os.path.dirname(LIGHTS_DIR) == os.path.dirname(steve.timeline.__file__)
+    assert os.path.isfile(filename('boot'))
+
+
+def test_name_resolves_within_directory(tmp_path):
+    assert filename('boot', str(tmp_path)) == str(tmp_path / 'boot.toml')
+    assert filename('boot.toml', str(tmp_path)) == str(tmp_path / 'boot.toml')
+
+
+@pytest.mark.parametrize('name', ['', '.', '..', '../boot', '/etc/passwd', 'sub/boot', '..\\boot'])
+def test_invalid_names_are_rejected(name, tmp_path):
+    with pytest.raises(Exception, match='Invalid timeline name'):
+        filename(name, str(tmp_path))
+
+
+def test_symlink_out_of_directory_is_rejected(tmp_path):
+    lights = tmp_path / 'lights'
+    lights.mkdir()
+    (tmp_path / 'secret.toml').write_text('')
+    os.symlink(tmp_path / 'secret.toml', lights / 'secret.toml')
+
+    with pytest.raises(Exception, match='outside'):
+        filename('secret', str(lights))
+
+
+TIMELINE = {
+    'keyframes': [
+        {'time': 0, 'color': 'black', 'pixels': [0]},
+        {'time': 1, 'color': [1.0, 1.0, 1.0], 'pixels': [0]},
+        {'time': 0.5, 'color': [0.0, 0.0, 1.0], 'alpha': 0.5, 'pixels': [1]}
+    ]
+}
+
+
+def test_compile_interpolates_keyframes():
+    frames, loop = compile(TIMELINE, 10, 3)
+    assert not loop
+    assert frames.shape == (11, 3, 4)
+    assert frames.dtype == np.float32
+
+    assert frames[:, 0, 0] == pytest.approx(np.linspace(0, 1, 11))
+    assert frames[:, 0, 3] == pytest.approx(1)
+
+    # A single keyframe holds its value for the entire timeline
+    assert (frames[:, 1] == [0, 0, 1, 0.5]).all()
+
+    # Pixels without keyframes are transparent
+    assert (frames[:, 2, 3] == 0).all()
+
+
+def test_compile_eased_looped_timeline():
+    timeline = {
+        'loop': True,
+        'duration': 2,
+        'keyframes': [
+            {'time': 0, 'color': 'black', 'ease': 'in_quad'},
+            {'time': 1, 'color': 'white'}
+        ]
+    }
+    frames, loop = compile(timeline, 4, 1)
+    assert loop
+    assert len(frames) == 8
+    assert frames[:5, 0, 0] == pytest.approx([0, 1 / 16, 1 / 4, 9 / 16, 1])
+    assert (frames[4:, 0, 0] == 1).all()
+
+
+def test_invalid_timeline_is_rejected():
+    with pytest.raises(Exception, match='Missing keyframes'):
+        compile({'keyframes': []}, 10, 1)
+
+    with pytest.raises(Exception):
+        compile({'keyframes': [{'time': 0, 'color': 'white', 'pixels': [5]}]}, 10, 2)
+
+
+def test_compiled_timeline_is_cached(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    (tmp_path / 'fade.toml').write_text('''
+[[keyframes]]
+time = 0
+color = "black"
+
+[[keyframes]]
+time = 1
+color = "white"
+''')
+    frames, loop = steve.timeline.load('fade', 10, 2, directory=str(tmp_path))
+
+    def fail(*args):
+        raise AssertionError('timeline compiled again')
+
+    monkeypatch.setattr(steve.timeline, 'compile', fail)
+    cached, loop = steve.timeline.load('fade', 10, 2, directory=str(tmp_path))
+    assert (cached == frames).all()
+
+    with pytest.raises(AssertionError):
+        steve.timeline.load('fade', 20, 2, directory=str(tmp_path))
+
+
+def test_timeline_playback():
+    frames = np.arange(3 * 2 * 4, dtype=np.float32).reshape(3, 2, 4)
+    once = Timeline(frames, 10)
+    out = np.zeros((2, 4), dtype=np.float32)
+
+    once(0.15, None, out)
+    assert (out == frames[1]).all()
+    once(5, None, out)
+    assert (out == frames[2]).all()
+    assert once.duration == pytest.approx(0.2)
+
+    looped = Timeline(frames, 10, loop=True)
+    looped(0.35, None, out)
+    assert (out == frames[0]).all()
+    assert looped.duration is None